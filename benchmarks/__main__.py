@@ -0,0 +1,88 @@
+"""
+Runs every benchmark suite and saves the results as JSON, optionally
+comparing them with a previous run.
+
+    python -m benchmarks --output after.json --compare before.json
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import platform
+import subprocess
+import sys
+
+from . import load, parser, pooling, response, router
+from .compare import compare, print_comparison
+
+
+SUITES = {
+    'parser': parser.run,
+    'router': router.run,
+    'response': response.run,
+    'pooling': pooling.run,
+    'load': load.run,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suites(names):
+    """
+    :param names: names of the suites in SUITES to run.
+    :return: a dict with metadata about the run and all results.
+    """
+    results = {}
+    for name in names:
+        print('Running {0} benchmarks'.format(name), file=sys.stderr)
+        results.update(SUITES[name]())
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'date': datetime.datetime.now().isoformat(),
+        'results': results,
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    arg_parser.add_argument(
+        '--suite', action='append', choices=sorted(SUITES),
+        help='suite to run, may be repeated, runs all by default')
+    arg_parser.add_argument('--output', help='file to save results to')
+    arg_parser.add_argument(
+        '--compare', help='results of a previous run to compare with')
+    arg_parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='relative change counted as a regression, default 0.1')
+    args = arg_parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    run = run_suites(args.suite or list(SUITES))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, run, args.threshold)
+        print_comparison(rows)
+        return 1 if any(row['regression'] for row in rows) else 0
+
+    for name, value in sorted(run['results'].items()):
+        print('{0:<40} {1:>12.2f} {2}'.format(
+            name, value['value'], value['unit']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Helpers shared by the benchmark suites. Every suite exposes a 'run'
+function returning a dict of metric name: result, where a result is
+built with 'result' so runs can be saved as JSON and compared.
+"""
+
+import timeit
+import tracemalloc
+
+
+LOWER = 'lower'
+HIGHER = 'higher'
+
+
+def result(value, unit, better=LOWER):
+    """
+    :param value: the measured number.
+    :param unit: a string, ie. 'ns' or 'req/s'.
+    :param better: LOWER or HIGHER - which direction is an improvement.
+    :return: a dict that can be serialized to JSON.
+    """
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def ns_per_call(fn, number, repeat=5):
+    """
+    :param fn: a callable without arguments.
+    :param number: calls per measurement.
+    :param repeat: measurements to take, the best one is reported.
+    :return: nanoseconds per call.
+    """
+    best = min(timeit.repeat(fn, number=number, repeat=repeat))
+    return best / number * 1e9
+
+
+def bytes_per_call(fn, number):
+    """
+    :param fn: a callable without arguments that returns a new object.
+    :param number: objects to create.
+    :return: bytes of memory still allocated per call while the returned
+        objects are alive.
+    """
+    kept = [None] * number
+    tracemalloc.start()
+    try:
+        for i in range(number):
+            kept[i] = fn()
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return allocated / number
+
+
+def percentile(sorted_values, fraction):
+    """
+    :param sorted_values: a non-empty, sorted list of numbers.
+    :param fraction: a float between 0 and 1, ie. 0.99 for p99.
+    :return: the nearest-rank percentile.
+    """
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
@@ -0,0 +1,65 @@
+"""
+Compares two runs saved by 'python -m benchmarks --output' and flags
+regressions. Exits with status 1 if any metric got worse by more than
+the threshold.
+
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    :param baseline: a dict loaded from a saved run.
+    :param current: a dict loaded from a saved run.
+    :param threshold: relative change counted as a regression.
+    :return: a list of dicts, one per metric present in both runs.
+    """
+    rows = []
+    for name, new in sorted(current['results'].items()):
+        old = baseline['results'].get(name)
+        if old is None or not old['value']:
+            continue
+        change = (new['value'] - old['value']) / old['value']
+        worse = change if new['better'] == 'lower' else -change
+        rows.append({
+            'name': name,
+            'unit': new['unit'],
+            'before': old['value'],
+            'after': new['value'],
+            'change': change,
+            'regression': worse > threshold,
+        })
+    return rows
+
+
+def print_comparison(rows):
+    print('{0:<40} {1:>12} {2:>12} {3:>8}'.format(
+        'metric', 'before', 'after', 'change'))
+    for row in rows:
+        print('{0:<40} {1:>12.2f} {2:>12.2f} {3:>+7.1%}{4}'.format(
+            row['name'], row['before'], row['after'], row['change'],
+            '  REGRESSION' if row['regression'] else ''))
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m benchmarks.compare')
+    arg_parser.add_argument('baseline')
+    arg_parser.add_argument('current')
+    arg_parser.add_argument('--threshold', type=float, default=0.1)
+    args = arg_parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows)
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""
+Compares the streams and the protocol server cores, on the default event
+loop and, when it is installed, on uvloop.
+
+    python -m benchmarks.io_modes
+"""
+
+import logging
+
+from diy_framework.application import PROTOCOL, STREAMS, uvloop
+
+from . import load
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    loops = [False, True] if uvloop is not None else [False]
+    print('{0:>10} {1:>8} {2:>12} {3:>10}'.format(
+        'io mode', 'uvloop', 'req/s', 'p99 ms'))
+    for use_uvloop in loops:
+        for io_mode in (STREAMS, PROTOCOL):
+            results = load.run(io_mode=io_mode, use_uvloop=use_uvloop)
+            print('{0:>10} {1:>8} {2:>12.0f} {3:>10.2f}'.format(
+                io_mode, str(use_uvloop), results['load.rps']['value'],
+                results['load.p99']['value']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+End-to-end load generator. Starts an App in a separate process and hits
+it with many concurrent keep-alive clients written with asyncio streams,
+spread over one or more client processes.
+
+    python -m benchmarks.load
+"""
+
+import asyncio
+import contextlib
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from diy_framework import App, Router
+
+from .common import HIGHER, percentile, result
+
+
+HOST = '127.0.0.1'
+PORT = 8089
+DURATION = 5
+CONNECTIONS = 64
+
+
+async def read_response(reader):
+    """
+    Reads one response with a Content-Length delimited body.
+
+    :return: a bytes object with the status line and the headers.
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    content_length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            content_length = int(value)
+    if content_length:
+        await reader.readexactly(content_length)
+    return head
+
+
+async def client(host, port, request, deadline, latencies):
+    """
+    Sends requests one after another over a persistent connection until
+    the deadline, reconnecting whenever the server closes it.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            writer.write(request)
+            head = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if b'Connection: close' in head:
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+    finally:
+        writer.close()
+
+
+async def run_clients(host, port, path, connections, duration):
+    request = 'GET {0} HTTP/1.1\r\nHost: {1}\r\n\r\n'.format(
+        path, host).encode('ascii')
+    deadline = time.monotonic() + duration
+    latencies = []
+    await asyncio.gather(*[
+        client(host, port, request, deadline, latencies)
+        for _ in range(connections)])
+    return latencies
+
+
+def _client_process(args):
+    return asyncio.run(run_clients(*args))
+
+
+def run_load(host=HOST, port=PORT, path='/', connections=64, duration=5,
+             processes=1):
+    """
+    :param connections: total number of concurrent client connections.
+    :param duration: seconds to generate load for.
+    :param processes: number of client processes the connections are
+        spread over.
+    :return: a list of request latencies in seconds.
+    """
+    per_process = max(1, connections // processes)
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(
+            _client_process,
+            [(host, port, path, per_process, duration)] * processes)
+    return list(itertools.chain.from_iterable(results))
+
+
+def wait_for_port(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('Server on {0}:{1} did not start'.format(host, port))
+
+
+@contextlib.contextmanager
+def running(app):
+    """
+    Runs app.start_server in a child process for the duration of the
+    with block and stops it with SIGINT afterwards.
+    """
+    process = multiprocessing.Process(target=app.start_server)
+    process.start()
+    try:
+        wait_for_port(app.host, app.port)
+        yield process
+    finally:
+        os.kill(process.pid, signal.SIGINT)
+        process.join(10)
+        if process.is_alive():
+            process.terminate()
+
+
+def summarize(latencies, duration):
+    """
+    :param latencies: a list of request latencies in seconds.
+    :param duration: seconds the load was generated for.
+    :return: a dict with requests per second and latency percentiles in
+        milliseconds.
+    """
+    latencies = sorted(latencies)
+    return {
+        'rps': len(latencies) / duration,
+        'p50': percentile(latencies, 0.5) * 1e3,
+        'p99': percentile(latencies, 0.99) * 1e3,
+        'p999': percentile(latencies, 0.999) * 1e3,
+    }
+
+
+async def hello(request):
+    return 'Hello, world!'
+
+
+def run(duration=DURATION, connections=CONNECTIONS, client_processes=1,
+        **app_kwargs):
+    """
+    Serves a single route with an App and measures it under load.
+
+    :param client_processes: number of processes generating the load.
+    :param app_kwargs: extra keyword arguments for App.
+    :return: a dict of results.
+    """
+    router = Router()
+    router.add_route('/', hello)
+    app = App(router, host=HOST, port=PORT, log_level=logging.WARNING,
+              **app_kwargs)
+    with running(app):
+        summary = summarize(
+            run_load(connections=connections, duration=duration,
+                     processes=client_processes),
+            duration)
+
+    results = {'load.rps': result(summary.pop('rps'), 'req/s', HIGHER)}
+    for name, value in summary.items():
+        results['load.' + name] = result(value, 'ms')
+    return results
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    for name, value in run().items():
+        print('{0:<12} {1:>10.2f} {2}'.format(
+            name, value['value'], value['unit']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Measures parsing requests that arrive in 1 KB chunks, the way
+HTTPConnection reads them. The stateful column feeds every chunk to one
+RequestParser, the stateless column calls http_parser.parse_into, which
+starts from scratch on every chunk. The suite also reports the time and
+the memory it takes to parse a small request, whose headers, query and
+body the Request only decodes when a handler reads them. The large
+requests are over the default size limits, so they're parsed without.
+
+    python -m benchmarks.parser
+"""
+
+import functools
+import time
+
+from diy_framework import http_parser
+from diy_framework.http_utils import Request
+
+from .common import bytes_per_call, ns_per_call, result
+
+
+CHUNK_SIZE = 1024
+NO_LIMITS = {
+    'max_request_line': None,
+    'max_header_size': None,
+    'max_headers': None,
+    'max_body_size': None,
+}
+
+
+def large_headers_request(header_count=400):
+    headers = b''.join(
+        b'X-Header-%d: %s\r\n' % (i, b'v' * 80) for i in range(header_count))
+    return b'GET / HTTP/1.1\r\n' + headers + b'\r\n'
+
+
+def large_body_request(body_size=2 * 1024 * 1024):
+    body = b'a=' + b'b' * (body_size - 2)
+    return (b'POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(body) +
+            body)
+
+
+def feed(parse_into, data, chunk_size=CHUNK_SIZE):
+    """
+    :param parse_into: a function with the 'parse_into' interface.
+    :param data: a bytes object containing a whole request.
+    :return: seconds it took to parse the request.
+    """
+    request = Request()
+    buffer = bytearray()
+    start = time.perf_counter()
+    for i in range(0, len(data), chunk_size):
+        buffer.extend(data[i:i + chunk_size])
+        buffer = parse_into(request, buffer)
+    elapsed = time.perf_counter() - start
+    assert request.finished
+    return elapsed
+
+
+def bench_parser(data, rounds=5):
+    """
+    :return: a dict of the best of rounds, in milliseconds.
+    """
+    stateful = min(
+        feed(http_parser.RequestParser(**NO_LIMITS).parse_into, data)
+        for _ in range(rounds))
+    stateless = min(
+        feed(functools.partial(http_parser.parse_into, **NO_LIMITS), data)
+        for _ in range(rounds))
+    return {'stateful': stateful * 1e3, 'stateless': stateless * 1e3}
+
+
+def small_request():
+    return (b'POST /login?next=/home HTTP/1.1\r\nHost: localhost\r\n'
+            b'Content-Type: application/x-www-form-urlencoded\r\n'
+            b'Content-Length: 27\r\n\r\nname=bob&password=secret12')
+
+
+def run():
+    """
+    :return: a dict of results for parsing a small request in one go and
+        large requests in 1 KB chunks.
+    """
+    data = small_request()
+
+    def parse_small():
+        request = Request()
+        http_parser.parse_into(request, bytearray(data))
+        return request
+
+    def parse_small_and_read():
+        request = parse_small()
+        request.headers, request.query_params, request.body
+        return request
+
+    results = {
+        'http_parser.parse_into[small]': result(
+            ns_per_call(parse_small, 10000), 'ns'),
+        'http_parser.parse_into[small,read_all]': result(
+            ns_per_call(parse_small_and_read, 10000), 'ns'),
+        'http_parser.parse_into[small,memory]': result(
+            bytes_per_call(parse_small, 1000), 'B'),
+    }
+    for name, data in [('headers', large_headers_request()),
+                       ('2mb_body', large_body_request())]:
+        results['http_parser.RequestParser[{0}]'.format(name)] = result(
+            bench_parser(data)['stateful'], 'ms')
+    return results
+
+
+def main():
+    cases = [
+        ('400 headers', large_headers_request()),
+        ('2 MB body', large_body_request()),
+        ('8 MB body', large_body_request(8 * 1024 * 1024)),
+    ]
+    print('{0:>12} {1:>14} {2:>14}'.format(
+        'request', 'stateful ms', 'stateless ms'))
+    for name, data in cases:
+        result = bench_parser(data)
+        print('{0:>12} {1:>14.2f} {2:>14.2f}'.format(
+            name, result['stateful'], result['stateless']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Compares HTTPServer with and without free-list pooling under a sustained
+stream of short keep-alive connections. Connections are driven through
+HTTPProtocol with an in-memory transport, so the numbers show the
+server's own allocations and garbage collection rather than the
+kernel's.
+
+    python -m benchmarks.pooling
+"""
+
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from diy_framework import http_parser, Router
+from diy_framework.http_protocol import HTTPProtocol
+from diy_framework.http_server import HTTPServer
+
+from .common import result
+
+
+POOL_SIZE = 1024
+CONNECTIONS = 20000
+BATCH = 100
+REQUESTS = (b'GET /item/1 HTTP/1.1\r\nHost: localhost\r\n\r\n'
+            b'GET /item/2 HTTP/1.1\r\nHost: localhost\r\n'
+            b'Connection: close\r\n\r\n')
+
+
+class MemoryTransport(asyncio.Transport):
+    """
+    Discards everything written and reports the connection as lost on
+    the next iteration of the loop after it's closed, like a socket
+    transport does.
+    """
+    def __init__(self, loop, protocol):
+        super().__init__()
+        self._loop = loop
+        self._protocol = protocol
+        self._closing = False
+
+    def write(self, data):
+        pass
+
+    def writelines(self, list_of_data):
+        pass
+
+    def is_closing(self):
+        return self._closing
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+    def close(self):
+        if not self._closing:
+            self._closing = True
+            self._loop.call_soon(self._protocol.connection_lost, None)
+
+
+class GCMonitor(object):
+    """
+    Counts young generation collections and sums the time spent in all
+    collections while it's installed in 'gc.callbacks'.
+    """
+    def __init__(self):
+        self.collections = 0
+        self.pause = 0.0
+        self._start = None
+
+    def __call__(self, phase, info):
+        if phase == 'start':
+            self._start = time.perf_counter()
+            return
+        self.pause += time.perf_counter() - self._start
+        if info['generation'] == 0:
+            self.collections += 1
+
+    def __enter__(self):
+        gc.callbacks.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        gc.callbacks.remove(self)
+
+
+def make_server(loop, pool_size):
+    async def item(request, item_id):
+        return item_id
+
+    router = Router()
+    router.add_route('/item/{item_id}', item)
+    router.compile()
+    return HTTPServer(router, http_parser, loop, pool_size=pool_size)
+
+
+async def serve_batch(server, loop):
+    tasks = []
+    for _ in range(BATCH):
+        protocol = server.new_connection(HTTPProtocol)
+        protocol.connection_made(MemoryTransport(loop, protocol))
+        protocol.data_received(REQUESTS)
+        tasks.append(protocol._task)
+    await asyncio.gather(*tasks)
+    # lets the transports report the connections as lost
+    await asyncio.sleep(0)
+
+
+def measure(pool_size):
+    """
+    :return: a tuple of nanoseconds per connection, young generation
+        collections and milliseconds of collector pauses per 1000
+        connections, and bytes allocated per connection.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        server = make_server(loop, pool_size)
+        # warms up the pools and the loop's caches
+        loop.run_until_complete(serve_batch(server, loop))
+
+        gc.collect()
+        with GCMonitor() as monitor:
+            start = time.perf_counter()
+            for _ in range(CONNECTIONS // BATCH):
+                loop.run_until_complete(serve_batch(server, loop))
+            elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        try:
+            loop.run_until_complete(serve_batch(server, loop))
+            allocated = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    finally:
+        loop.close()
+    per_thousand = 1000 / CONNECTIONS
+    return (elapsed / CONNECTIONS * 1e9,
+            monitor.collections * per_thousand,
+            monitor.pause * 1000 * per_thousand,
+            allocated / BATCH)
+
+
+def run():
+    """
+    :return: a dict of results with pooling off and with a pool of
+        POOL_SIZE objects.
+    """
+    results = {}
+    for name, pool_size in (('off', 0), ('on', POOL_SIZE)):
+        per_connection, collections, pause, allocated = measure(pool_size)
+        results.update({
+            'pooling[{0}].connection'.format(name): result(
+                per_connection, 'ns'),
+            'pooling[{0}].gc0_per_1k'.format(name): result(
+                collections, 'collections'),
+            'pooling[{0}].gc_pause_per_1k'.format(name): result(
+                pause, 'ms'),
+            'pooling[{0}].peak_bytes'.format(name): result(
+                allocated, 'B'),
+        })
+    return results
+
+
+def main():
+    for name, value in run().items():
+        print('{0:<32} {1:>10.2f} {2}'.format(
+            name, value['value'], value['unit']))
+
+
+if __name__ == '__main__':
+    main()
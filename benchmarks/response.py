@@ -0,0 +1,61 @@
+"""
+Measures building and serializing responses.
+
+    python -m benchmarks.response
+"""
+
+from diy_framework import json_utils
+from diy_framework.http_utils import JSONResponse, Response, frozen_response
+
+from .common import ns_per_call, result
+
+
+BODY = '<html><body>' + 'Hello, world! ' * 64 + '</body></html>'
+DATA = {
+    'users': [{'id': i, 'name': 'user {0}'.format(i), 'active': i % 2 == 0,
+               'score': i * 1.5} for i in range(20)],
+}
+CALLS = 20000
+
+
+def run():
+    """
+    :return: a dict of results for Response.to_bytes, Response.to_buffers,
+        a frozen Response and JSONResponse with every installed JSON
+        backend.
+    """
+    def to_bytes():
+        Response(code=200, body=BODY).to_bytes(True)
+
+    def to_buffers():
+        Response(code=200, body=BODY).to_buffers(True)
+
+    def frozen():
+        frozen_response(404, 'Not Found').to_buffers(False)
+
+    def json_response():
+        JSONResponse(DATA).to_buffers(True)
+
+    results = {
+        'Response.to_bytes': result(ns_per_call(to_bytes, CALLS), 'ns'),
+        'Response.to_buffers': result(ns_per_call(to_buffers, CALLS), 'ns'),
+        'Response.frozen': result(ns_per_call(frozen, CALLS), 'ns'),
+    }
+    for name in json_utils.available():
+        previous = json_utils.use(name)
+        try:
+            results['JSONResponse[{0}]'.format(name)] = result(
+                ns_per_call(json_response, CALLS // 4), 'ns')
+        finally:
+            json_utils.use(previous)
+    return results
+
+
+def main():
+    for name, value in run().items():
+        print('{0:<24} {1:>10.0f} {2}'.format(
+            name, value['value'], value['unit']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Measures the cost of Router.get_handler as the route table grows. The
+linear column replays the old lookup - trying every compiled route
+regexp in turn - against the same routes for comparison.
+'run' also reports Router.resolve and the cost of running a route's
+compiled chain with a growing number of middleware.
+
+    python -m benchmarks.router
+
+'run' reports only the current lookup, for 'python -m benchmarks'.
+"""
+
+import timeit
+
+from diy_framework import Router
+from diy_framework.exceptions import NotFoundException
+from diy_framework.http_utils import Request
+
+from .common import ns_per_call, result
+
+
+ROUTE_COUNTS = (10, 100, 1000)
+MIDDLEWARE_COUNTS = (0, 5)
+LOOKUPS = 20000
+
+
+async def handler(request, **kwargs):
+    return ''
+
+
+async def passthrough(request, call_next):
+    return await call_next(request)
+
+
+def bench_dispatch(middleware_count, calls=LOOKUPS):
+    """
+    Runs a route's chain without an event loop, none of the coroutines in
+    it suspend.
+
+    :return: nanoseconds per dispatch.
+    """
+    router = Router()
+    router.use(*[passthrough] * middleware_count)
+    router.add_route('/users/{id}', handler)
+    request = Request()
+    request.path = '/users/42'
+    route = router.resolve(request)
+
+    def dispatch():
+        try:
+            route.handle(request).send(None)
+        except StopIteration:
+            pass
+    return ns_per_call(dispatch, calls)
+
+
+def build_router(route_count):
+    """
+    :param route_count: number of routes to add, half static and half
+        with parameters.
+    :return: a Router.
+    """
+    router = Router()
+    for i in range(route_count // 2):
+        router.add_route('/static/{0}/page'.format(i), handler)
+        router.add_route('/resource{0}/{{id}}/edit'.format(i), handler)
+    return router
+
+
+def linear_get_handler(router, path):
+    for route in router.routes:
+        path_params = Router.match_path(route, path)
+        if path_params is not None:
+            return path_params
+    raise NotFoundException()
+
+
+def bench_router(route_count, lookups=LOOKUPS):
+    """
+    Looks up the last static and the last dynamic route added, the worst
+    case for a linear scan.
+
+    :return: a dict of nanoseconds per lookup.
+    """
+    router = build_router(route_count)
+    last = route_count // 2 - 1
+    paths = ['/static/{0}/page'.format(last),
+             '/resource{0}/42/edit'.format(last)]
+
+    def tree():
+        for path in paths:
+            router.get_handler(path)
+
+    def linear():
+        for path in paths:
+            linear_get_handler(router, path)
+
+    return {
+        'tree': timeit.timeit(tree, number=lookups) / lookups / 2 * 1e9,
+        'linear': timeit.timeit(linear, number=lookups // 10) /
+        (lookups // 10) / 2 * 1e9,
+    }
+
+
+def run():
+    """
+    :return: a dict of results for Router.get_handler per route count.
+    """
+    results = {}
+    for route_count in ROUTE_COUNTS:
+        router = build_router(route_count)
+        path = '/resource{0}/42/edit'.format(route_count // 2 - 1)
+        results['router.get_handler[{0}]'.format(route_count)] = result(
+            ns_per_call(lambda: router.get_handler(path), LOOKUPS), 'ns')
+    request = Request()
+    request.path = path
+    results['router.resolve[{0}]'.format(route_count)] = result(
+        ns_per_call(lambda: router.resolve(request), LOOKUPS), 'ns')
+    for middleware_count in MIDDLEWARE_COUNTS:
+        results['router.dispatch[{0}]'.format(middleware_count)] = result(
+            bench_dispatch(middleware_count), 'ns')
+    return results
+
+
+def main():
+    print('{0:>8} {1:>12} {2:>12}'.format('routes', 'tree ns', 'linear ns'))
+    for route_count in ROUTE_COUNTS:
+        result = bench_router(route_count)
+        print('{0:>8} {1:>12.0f} {2:>12.0f}'.format(
+            route_count, result['tree'], result['linear']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""
+Measures requests per second served by App with 1, 2, 4 and 8 pre-forked
+worker processes. Scaling is bounded by the number of cores, which are
+shared with the client processes generating the load.
+
+    python -m benchmarks.workers
+"""
+
+import logging
+import os
+
+from . import load
+
+
+WORKER_COUNTS = (1, 2, 4, 8)
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    print('{0} cores'.format(os.cpu_count()))
+    print('{0:>8} {1:>12} {2:>10}'.format('workers', 'req/s', 'p99 ms'))
+    for workers in WORKER_COUNTS:
+        results = load.run(workers=workers, client_processes=max(
+            1, min(workers, (os.cpu_count() or 1) // 2)))
+        print('{0:>8} {1:>12.0f} {2:>10.2f}'.format(
+            workers, results['load.rps']['value'],
+            results['load.p99']['value']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Admission control for HTTPServer: limits on open connections and on
+requests being handled, with load past the limits shed with
+'503 Service Unavailable'.
+"""
+
+import asyncio
+import collections
+
+from .exceptions import ServiceUnavailableException
+from .http_utils import Response, frozen_response
+
+
+QUEUE_TIMEOUT = 1
+RETRY_AFTER = 1
+
+
+class AdmissionController(object):
+    """
+    Decides which connections and requests an HTTPServer takes on.
+    A connection over 'max_connections' is answered with a 503 and
+    closed as soon as it's accepted, before any task or buffer is
+    created for it. A request over 'max_requests' waits in a FIFO queue
+    of at most 'max_queue' requests for up to 'queue_timeout' seconds and
+    gets a 503 if no slot frees up by then, or right away if the queue is
+    full. Every 503 carries a 'Retry-After' header.
+    None disables a limit. Counters of admitted and shed connections and
+    requests can be read directly or through 'stats' and 'render'.
+
+    :param max_connections: the number of connections kept open at once.
+    :param max_requests: the number of requests handled at once.
+    :param max_queue: the number of requests waiting for a slot.
+    :param queue_timeout: seconds a request waits for a slot.
+    :param retry_after: seconds clients are asked to wait before trying
+        again.
+    """
+    def __init__(self, max_connections=None, max_requests=None,
+                 max_queue=0, queue_timeout=QUEUE_TIMEOUT,
+                 retry_after=RETRY_AFTER):
+        self.max_connections = max_connections
+        self.max_requests = max_requests
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.connections = 0
+        self.in_flight = 0
+        self.admitted_connections = 0
+        self.shed_connections = 0
+        self.admitted_requests = 0
+        self.shed_requests = 0
+        self._waiters = collections.deque()
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def connection_opened(self):
+        """
+        :return: Boolean - whether the new connection is admitted. The
+            caller must send 'rejection' and close it otherwise.
+        """
+        if (self.max_connections is not None and
+                self.connections >= self.max_connections):
+            self.shed_connections += 1
+            return False
+        self.connections += 1
+        self.admitted_connections += 1
+        return True
+
+    def connection_closed(self):
+        self.connections -= 1
+
+    def rejection(self):
+        """
+        :return: a list of bytes objects, a 503 reply that closes the
+            connection.
+        """
+        return frozen_response(
+            503, Response.reason_phrases[503],
+            headers=self._retry_headers()).to_buffers(keep_alive=False)
+
+    async def acquire(self):
+        """
+        Waits until the current request may be handled. Every successful
+        call must be followed by a call to 'release'.
+
+        :raises ServiceUnavailableException: if the request is shed.
+        """
+        if self.max_requests is None or (
+                self.in_flight < self.max_requests and not self._waiters):
+            self.in_flight += 1
+            self.admitted_requests += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._shed_request()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._waiters.remove(waiter)
+            self._shed_request()
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        self.admitted_requests += 1
+
+    def release(self):
+        """
+        Frees the slot of a finished request, handing it straight to the
+        longest waiting request if there is one.
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self):
+        """
+        :return: a dict of the current counters.
+        """
+        return {
+            'connections': self.connections,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'admitted_connections': self.admitted_connections,
+            'shed_connections': self.shed_connections,
+            'admitted_requests': self.admitted_requests,
+            'shed_requests': self.shed_requests,
+        }
+
+    def render(self):
+        """
+        :return: a list of lines in Prometheus text format, so the
+            controller can be added to 'metrics.Metrics' as a collector.
+        """
+        stats = self.stats()
+        lines = []
+        for name in ('connections', 'in_flight', 'queued'):
+            lines.append('# TYPE diy_admission_{0} gauge'.format(name))
+            lines.append('diy_admission_{0} {1}'.format(name, stats[name]))
+        for kind in ('connections', 'requests'):
+            lines.append('# TYPE diy_admission_{0}_total counter'.format(
+                kind))
+            for outcome in ('admitted', 'shed'):
+                lines.append(
+                    'diy_admission_{0}_total{{outcome="{1}"}} {2}'.format(
+                        kind, outcome,
+                        stats['{0}_{1}'.format(outcome, kind)]))
+        return lines
+
+    def _shed_request(self):
+        self.shed_requests += 1
+        raise ServiceUnavailableException(headers=self._retry_headers())
+
+    def _retry_headers(self):
+        return {'Retry-After': str(self.retry_after)}
@@ -1,6 +1,15 @@
 import asyncio
+import functools
+import inspect
 import logging
 import re
+import signal
+import socket
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 from .exceptions import (
     DiyFrameworkException,
@@ -8,10 +17,41 @@ from .exceptions import (
     DuplicateRoute,
 )
 
+from . import executors
+from .coalescing import Coalescer
 from . import http_parser
-from .http_server import HTTPServer
+from .http_utils import to_response
+from .middleware import compose
+from .http_server import (
+    HTTPServer,
+    BODY_TIMEOUT,
+    DRAIN_TIMEOUT,
+    HEADER_TIMEOUT,
+    KEEP_ALIVE_TIMEOUT,
+    MAX_BODY_SIZE,
+    MAX_HEADER_SIZE,
+    MAX_HEADERS,
+    MAX_KEEP_ALIVE_REQUESTS,
+    MAX_REQUEST_LINE,
+)
+from .http_protocol import HTTPProtocol
+from .static import StaticFiles
+from .workers import (
+    Supervisor,
+    inherited_socket,
+    notify_ready,
+    spawn_replacement,
+)
 
 logger = logging.getLogger(__name__)
+PARAM_REGEXP = re.compile(r'{([a-zA-Z0-9_-]+)}')
+PARAM_VALUE_REGEXP = re.compile(r'[a-zA-Z0-9_-]+')
+# characters that make a route a raw regular expression, '.' is left out
+# so '/report.csv' stays a literal path
+REGEXP_CHARS_REGEXP = re.compile(r'[\\^$*+?()\[\]|]')
+REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+STREAMS = 'streams'
+PROTOCOL = 'protocol'
 basic_logger_config = {
     'format': '%(asctime)s [%(levelname)s] %(message)s',
     'level': logging.INFO,
@@ -22,116 +62,661 @@ logging.basicConfig(**basic_logger_config)
 class App(object):
     """
     Contains the configuration needed to handle HTTP requests.
+
+    SIGTERM and SIGINT stop a running App gracefully: it stops accepting
+    connections, closes the idle ones and gives requests in flight
+    'drain_timeout' seconds to finish. SIGHUP restarts it without
+    downtime: a new copy of the program is started with the listening
+    socket, and once it's serving the old process stops gracefully. With
+    several workers the supervisor binds the listening socket, which its
+    workers share and which it hands to the replacement the same way.
     """
     def __init__(self,
                  router,
                  host='127.0.0.1',
                  port=8080,
                  log_level=logging.INFO,
-                 http_parser=http_parser):
+                 http_parser=http_parser,
+                 keep_alive_timeout=KEEP_ALIVE_TIMEOUT,
+                 max_keep_alive_requests=MAX_KEEP_ALIVE_REQUESTS,
+                 header_timeout=HEADER_TIMEOUT,
+                 body_timeout=BODY_TIMEOUT,
+                 workers=1,
+                 io_mode=STREAMS,
+                 use_uvloop=False,
+                 metrics=None,
+                 cache=None,
+                 compressor=None,
+                 admission=None,
+                 drain_timeout=DRAIN_TIMEOUT,
+                 max_request_line=MAX_REQUEST_LINE,
+                 max_header_size=MAX_HEADER_SIZE,
+                 max_headers=MAX_HEADERS,
+                 max_body_size=MAX_BODY_SIZE,
+                 pool_size=0,
+                 diagnostics=None):
         """
         :param router: a collection of routes that implements the
-            'get_handler' interface.
+            'resolve' and 'compile' interface.
         :param host: a string that represents and ipv4 address associated
             with the interface that will listen for incoming connections.
         :param port: an int that represents the port on which to listen to.
         :param log_level: an integer representing the logging level, using
             default Python stdlib values.
-        :param http_parser: an object that implements 'parse_into' interface.
-            Responsible for parsing bytes into Requests objects.
+        :param http_parser: an object that implements 'RequestParser'
+            interface. Responsible for parsing bytes into Requests objects.
+        :param keep_alive_timeout: number of seconds an idle persistent
+            connection is kept open.
+        :param max_keep_alive_requests: number of requests served over a
+            single connection before it is closed.
+        :param header_timeout: number of seconds a client has to send the
+            request line and headers of a request.
+        :param body_timeout: number of seconds a client may stay silent
+            while sending the body of a request.
+        :param workers: number of processes serving requests. With more
+            than one, a supervisor process binds one listening socket and
+            forks the workers, which share it and each run their own
+            event loop.
+        :param io_mode: either STREAMS, to serve connections with
+            HTTPConnection on top of 'asyncio.start_server' streams, or
+            PROTOCOL, to serve them with HTTPProtocol straight from the
+            transport.
+        :param use_uvloop: Boolean - run on uvloop's event loop if the
+            package is installed, on the default one otherwise.
+        :param metrics: None, or an object that implements the
+            'metrics.Metrics' interface and collects request timings,
+            connection counts and errors. Mount its 'handler' on the
+            router to expose them.
+        :param cache: None, or an object that implements the
+            'cache.ResponseCache' interface and stores responses of routes
+            added with a 'cache_ttl'.
+        :param compressor: None, or an object that implements the
+            'compression.Compressor' interface and compresses responses
+            according to the request's Accept-Encoding.
+        :param admission: None, or an object that implements the
+            'admission.AdmissionController' interface and sheds
+            connections and requests past its limits. With several
+            workers the limits apply to each of them.
+        :param drain_timeout: seconds requests in flight get to finish
+            when the server is stopped or restarted.
+        :param max_request_line: bytes of a request line, or the request
+            gets a 414.
+        :param max_header_size: bytes of a request's headers, or it gets
+            a 431.
+        :param max_headers: header lines of a request, or it gets a 431.
+        :param max_body_size: bytes of a buffered body, or the request
+            gets a 413. None disables any of the limits.
+        :param pool_size: the number of connections, receive buffers and
+            Requests each worker keeps for reuse instead of allocating
+            new ones, 0 disables pooling. Handlers must not keep the
+            Request once they have replied when it's on.
+        :param diagnostics: None, or a 'diagnostics.Diagnostics' that
+            monitors the event loop of every worker while it serves and
+            profiles it on demand, ie. when a worker gets the
+            diagnostics' 'profile_signal'.
         """
         # create ip address class
         self.router = router
         self.http_parser = http_parser
         self.host = host
         self.port = port
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.workers = workers
+        self.io_mode = io_mode
+        self.use_uvloop = use_uvloop
+        self.metrics = metrics
+        self.cache = cache
+        self.compressor = compressor
+        self.admission = admission
+        self.drain_timeout = drain_timeout
+        self.max_request_line = max_request_line
+        self.max_header_size = max_header_size
+        self.max_headers = max_headers
+        self.max_body_size = max_body_size
+        self.pool_size = pool_size
+        self.diagnostics = diagnostics
         self._server = None
+        self._supervisor = None
         self._connection_handler = None
-        self._loop = None
+        self._listener = None
+        self._stopping = None
+        self.loop = None
 
         logger.setLevel(log_level)
 
+    def use(self, *middleware):
+        """
+        Adds middleware that runs for every route of the router.
+
+        :param middleware: 'middleware.Middleware' objects or async
+            functions used as 'middleware.Around'.
+        """
+        self.router.use(*middleware)
+
     def start_server(self):
         """
         Starts listening asynchronously for TCP connections on a socket and
         passes each connection to the HTTPServer.handle_connection method.
+        With more than one worker, blocks in the supervisor until all
+        workers have been stopped.
         """
-        if not self._server:
-            self.loop = asyncio.get_event_loop()
-            self._server = HTTPServer(self.router, self.http_parser, self.loop)
-            self._connection_handler = asyncio.start_server(
-                self._server.handle_connection,
-                host=self.host,
-                port=self.port,
-                reuse_address=True,
-                reuse_port=True,
-                loop=self.loop)
-
-            logger.info('Starting server on {0}:{1}'.format(
-                self.host, self.port))
-            self.loop.run_until_complete(self._connection_handler)
-
-            try:
-                self.loop.run_forever()
-            except KeyboardInterrupt:
-                logger.info('Got signal, killing server')
-            except DiyFrameworkException as e:
-                logger.error('Critical framework failure:')
-                logger.error(e.__traceback__)
-            finally:
-                self.loop.close()
-        else:
+        if self._server or self._supervisor:
             logger.info('Server already started - {0}'.format(self))
+            return
+
+        sock = inherited_socket()
+        if self.workers > 1:
+            if sock is None:
+                sock = self._bind_socket()
+            self._supervisor = Supervisor(
+                self.workers, lambda: self._serve(sock),
+                replace=functools.partial(spawn_replacement, sock))
+            logger.info('Starting {0} workers on {1}:{2}'.format(
+                self.workers, self.host, self.port))
+            self._supervisor.run()
+        else:
+            self._serve(sock)
+
+    def _serve(self, sock=None):
+        """
+        Runs an event loop that serves requests until interrupted.
+
+        :param sock: an already bound listening socket, or None to bind a
+            new one to self.host and self.port.
+        """
+        self.loop = self._new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.router.compile()
+        self._server = HTTPServer(
+            self.router, self.http_parser, self.loop,
+            keep_alive_timeout=self.keep_alive_timeout,
+            max_keep_alive_requests=self.max_keep_alive_requests,
+            header_timeout=self.header_timeout,
+            body_timeout=self.body_timeout,
+            metrics=self.metrics,
+            cache=self.cache,
+            compressor=self.compressor,
+            admission=self.admission,
+            max_request_line=self.max_request_line,
+            max_header_size=self.max_header_size,
+            max_headers=self.max_headers,
+            max_body_size=self.max_body_size,
+            pool_size=self.pool_size)
+        if sock is None:
+            listen_kwargs = {'host': self.host, 'port': self.port,
+                             'reuse_address': True, 'reuse_port': REUSE_PORT}
+        else:
+            listen_kwargs = {'sock': sock}
+
+        if self.io_mode == PROTOCOL:
+            self._connection_handler = self.loop.create_server(
+                lambda: self._server.new_connection(HTTPProtocol),
+                **listen_kwargs)
+        else:
+            self._connection_handler = asyncio.start_server(
+                self._server.handle_connection, **listen_kwargs)
+
+        logger.info('Starting server on {0}:{1} ({2})'.format(
+            self.host, self.port, self.io_mode))
+        self._listener = self.loop.run_until_complete(
+            self._connection_handler)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self.stop)
+        if self._supervisor is None:
+            self.loop.add_signal_handler(signal.SIGHUP, self.restart)
+        diagnostics = self.diagnostics
+        if diagnostics is not None:
+            diagnostics.start(self.loop, self.router)
+            if diagnostics.profile_signal is not None:
+                self.loop.add_signal_handler(
+                    diagnostics.profile_signal, diagnostics.profile)
+        notify_ready()
+
+        try:
+            self.loop.run_forever()
+        except KeyboardInterrupt:
+            logger.info('Got signal, killing server')
+        except DiyFrameworkException as e:
+            logger.error('Critical framework failure:')
+            logger.error(e.__traceback__)
+        finally:
+            if diagnostics is not None:
+                diagnostics.stop()
+            executors.shutdown()
+            self.loop.close()
+
+    def stop(self):
+        """
+        Stops the server gracefully: the listener is closed, connections
+        are drained for up to 'drain_timeout' seconds and the event loop
+        stops. Must be called from the loop's thread.
+        """
+        if self._stopping is None:
+            self._stopping = self.loop.create_task(self._shutdown())
+
+    def restart(self):
+        """
+        Starts a new copy of the program that takes over the listening
+        socket and, once it's serving, stops this one gracefully. Must be
+        called from the loop's thread.
+        """
+        if self._stopping is None:
+            self._stopping = self.loop.create_task(self._restart())
+
+    async def _restart(self):
+        logger.info('Restarting, starting a replacement')
+        sock = self._listener.sockets[0]
+        replacement = await self.loop.run_in_executor(
+            None, spawn_replacement, sock)
+        if replacement is None:
+            logger.error('Replacement failed to start, still serving')
+            self._stopping = None
+            return
+        await self._shutdown()
+
+    async def _shutdown(self):
+        logger.info('Stopping server, draining {0} connections'.format(
+            len(self._server.connections)))
+        self._listener.close()
+        await self._server.shutdown(self.drain_timeout)
+        self.loop.stop()
+
+    def _new_event_loop(self):
+        if self.use_uvloop:
+            if uvloop is not None:
+                return uvloop.new_event_loop()
+            logger.info('uvloop is not installed, using the default loop')
+        return asyncio.new_event_loop()
+
+    def _bind_socket(self):
+        """
+        :return: a listening socket bound to self.host and self.port, to be
+            inherited by forked workers and by a replacement.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.setblocking(False)
+        return sock
 
     def __repr__(self):
         cls = self.__class__
-        if self._connection_handler:
+        if self._connection_handler or self._supervisor:
             return '{0} - Listening on: {1}:{2}'.format(
                 cls, self.host, self.port)
         else:
             return '{0} - Not started'.format(cls)
 
 
+class Route(object):
+    """
+    A handler registered on a Router together with its options.
+
+    :param path: the string the route was registered with.
+    :param handler: An async or plain function that accepts a request and
+        returns a string or Response object.
+    :param stream: Boolean - whether the handler is called as soon as the
+        headers are parsed and reads the body itself through
+        'Request.read' or 'async for'.
+    :param executor: where the handler runs, 'executors.INLINE' on the
+        event loop, 'executors.THREAD' or 'executors.PROCESS' in the
+        shared pools or in a given 'executors.Pool'. Only plain
+        functions can run in a pool, coroutine handlers run inline.
+    :param cache_ttl: seconds a response to a GET request stays in the
+        server's ResponseCache, None disables caching for the route.
+    :param vary: names of request headers whose values select between
+        different cached responses, ie. ('accept-encoding',).
+    :param middleware: a sequence of 'middleware.Middleware' that run
+        inside the Router's middleware, the first one outermost.
+    :param coalesce: None, True or a 'coalescing.Coalescer' - whether
+        identical concurrent GET requests share one handler call. True
+        keys them on the path, all query parameters and the 'vary'
+        headers.
+    :param router_middleware: a sequence of 'middleware.Middleware'
+        that run before the route's own, ie. the Router's, passed on to
+        the first 'compile'.
+
+    'handle' is the route's compiled chain, an async function that
+    accepts a Request with its 'path_params' set and returns a Response.
+    Coalescing wraps the handler alone, and a ResponseCache, through
+    'chain', wraps the coalesced handler, so middleware still runs for
+    every request, cache hits included.
+    """
+    def __init__(self, path, handler, stream=False, cache_ttl=None,
+                 vary=(), executor=executors.INLINE, middleware=(),
+                 coalesce=None, router_middleware=()):
+        self.path = path
+        self.handler = handler
+        self.stream = stream
+        self.pool = executors.get_pool(executor)
+        if stream and self.pool is not None:
+            raise ValueError('Streaming routes must run inline')
+        if self.pool is not None and is_coroutine_function(handler):
+            raise ValueError('Coroutine handlers must run inline')
+        self.cache_ttl = cache_ttl
+        self.vary = tuple(name.lower() for name in vary)
+        self.middleware = tuple(middleware)
+        if coalesce is True:
+            coalesce = Coalescer(headers=self.vary)
+        if stream and coalesce:
+            raise ValueError('Streaming routes can not be coalesced')
+        self.coalescer = coalesce or None
+        self.endpoint = None
+        self.handle = None
+        self._chain_middleware = ()
+        self._cached = None
+        self.compile(router_middleware)
+
+    def compile(self, middleware=()):
+        """
+        Composes the middleware with the handler into 'handle'.
+
+        :param middleware: a sequence of 'middleware.Middleware' that run
+            before the route's own, ie. the Router's.
+        """
+        endpoint = self._endpoint()
+        if self.coalescer is not None:
+            endpoint = self.coalescer.wrap(endpoint)
+        self.endpoint = endpoint
+        self._chain_middleware = tuple(middleware) + self.middleware
+        self.handle = compose(endpoint, self._chain_middleware)
+        self._cached = None
+
+    def chain(self, cache=None):
+        """
+        :param cache: None or an object that implements the
+            'cache.ResponseCache' interface.
+        :return: 'handle', or for a route with a 'cache_ttl' the same
+            middleware composed around the cache's lookup of 'endpoint'.
+            The chain is built on the first call for a cache and kept
+            until the route is compiled again.
+        """
+        if cache is None or not self.cache_ttl:
+            return self.handle
+        cached = self._cached
+        if cached is None or cached[0] is not cache:
+            cached = self._cached = (cache, compose(
+                cache.wrap(self, self.endpoint), self._chain_middleware))
+        return cached[1]
+
+    def _endpoint(self):
+        """
+        :return: an async function that calls the handler with the
+            Request and its path params and turns the result into a
+            Response.
+        """
+        handler = self.handler
+        pool = self.pool
+        if pool is not None:
+            async def endpoint(request):
+                return to_response(await pool.run(
+                    handler, request, **request.path_params))
+        else:
+            async def endpoint(request):
+                result = handler(request, **request.path_params)
+                if inspect.isawaitable(result):
+                    result = await result
+                return to_response(result)
+        return endpoint
+
+
+def is_coroutine_function(handler):
+    """
+    :param handler: a function, a functools.partial or an object with a
+        '__call__' method.
+    :return: Boolean - whether calling it returns a coroutine.
+    """
+    return (inspect.iscoroutinefunction(handler) or
+            inspect.iscoroutinefunction(getattr(handler, '__call__', None)))
+
+
 class HandlerWrapper(object):
     """
     Helper class that calls a user defined handler with a Request as the first
-    argument and route defined parameters as kwargs.
+    argument and route defined parameters as kwargs, in the route's pool if
+    it has one. Returned by 'Router.get_handler', it doesn't run middleware;
+    the server dispatches through 'Router.resolve' and 'Route.handle'.
     """
-    def __init__(self, handler, path_params):
+    def __init__(self, handler, path_params, route=None):
         self.handler = handler
         self.path_params = path_params
+        self.route = route
         self.request = None
 
     async def handle(self, request):
-        return await self.handler(request, **self.path_params)
+        if self.route is not None and self.route.pool is not None:
+            return await self.route.pool.run(
+                self.handler, request, **self.path_params)
+
+        result = self.handler(request, **self.path_params)
+        if inspect.isawaitable(result):
+            return await result
+        return result
+
+
+class RouteNode(object):
+    """
+    A node in the segment tree Router uses to match routes with '{}'
+    parameters. Children are looked up by the next path segment: literal
+    segments through a dict, whole-segment parameters and segments that
+    mix text with parameters by trying each candidate in turn.
+    """
+    def __init__(self):
+        self.static = {}
+        self.params = {}
+        self.patterns = {}
+        self.route = None
+
+    def insert(self, segments, route):
+        """
+        Adds a route under the given path segments.
+
+        :param segments: a list of strings, the route's path split on '/'.
+        :param route: the Route stored at the end of the path.
+        :return: Boolean - False if a route is already stored there.
+        """
+        node = self
+        for segment in segments:
+            param = PARAM_REGEXP.fullmatch(segment)
+            if param:
+                children, key = node.params, param.group(1)
+            elif PARAM_REGEXP.search(segment):
+                children, key = node.patterns, build_segment_regexp(segment)
+            else:
+                children, key = node.static, segment
+            node = children.setdefault(key, RouteNode())
+
+        if node.route is not None:
+            return False
+        node.route = route
+        return True
+
+    def match(self, segments, index, path_params):
+        """
+        Finds the route for segments[index:], preferring literal
+        segments over parameters and backtracking on dead ends.
+
+        :param segments: a list of strings, the path split on '/'.
+        :param index: the position of the segment to match at this node.
+        :param path_params: a dict that is filled with URL param:value
+            pairs of the matched route.
+        :return: the Route or None if nothing matches.
+        """
+        if index == len(segments):
+            return self.route
+
+        segment = segments[index]
+        child = self.static.get(segment)
+        if child is not None:
+            route = child.match(segments, index + 1, path_params)
+            if route is not None:
+                return route
+
+        if self.params and PARAM_VALUE_REGEXP.fullmatch(segment):
+            for name, child in self.params.items():
+                route = child.match(segments, index + 1, path_params)
+                if route is not None:
+                    path_params[name] = segment
+                    return route
+
+        for regexp, child in self.patterns.items():
+            match = regexp.fullmatch(segment)
+            if match:
+                route = child.match(segments, index + 1, path_params)
+                if route is not None:
+                    path_params.update(match.groupdict())
+                    return route
+
+        return None
+
+
+def build_segment_regexp(segment):
+    """
+    Turns a single path segment that mixes text and '{}' parameters,
+    ie. 'report-{year}.csv', into a compiled regular expression.
+
+    :param segment: a string, one part of a route between slashes.
+    :return: a compiled regular expression.
+    """
+    parts = PARAM_REGEXP.split(segment)
+    re_str = ''.join(
+        '(?P<{0}>[a-zA-Z0-9_-]+)'.format(part) if i % 2 else re.escape(part)
+        for i, part in enumerate(parts))
+    return re.compile(re_str)
 
 
 class Router(object):
     """
-    Container used to add and match a group of routes.
+    Container used to add and match a group of routes. Routes without
+    parameters are looked up in a dict, the rest in a tree of path
+    segments, so the cost of a lookup depends on the length of the path
+    and not on the number of routes. Middleware added with 'use' runs for
+    every route, outside of the routes' own.
+
+    A path is matched, in this order, against:
+
+    - routes without parameters, exactly, '.' included;
+    - routes with '{}' parameters, where a literal segment beats a
+      parameter whatever order the routes were added in;
+    - routes that use any other regular expression syntax, ie.
+      '/files/(?P<name>.+)', in the order they were added;
+    - directories added with 'add_static', the longest prefix first.
     """
     def __init__(self):
         self.routes = {}
+        self.middleware = []
+        self._static_routes = {}
+        self._route_tree = RouteNode()
+        self._regexp_routes = []
+        self._mounts = []
+        self._all_routes = []
+
+    def __iter__(self):
+        """
+        Iterates over every Route, the directories of 'add_static'
+        included, in the order they were added.
+        """
+        return iter(self._all_routes)
 
     def add_routes(self, routes):
         for route, fn in routes.items():
             self.add_route(route, fn)
 
-    def add_route(self, path, handler):
+    def use(self, *middleware):
         """
-        Creates a path:function pair for later retrieval by path. The
-        path is turned into a regular expression.
+        Adds middleware that runs for every route and recompiles the
+        routes' chains.
+
+        :param middleware: 'middleware.Middleware' objects or async
+            functions used as 'middleware.Around'.
+        """
+        self.middleware.extend(middleware)
+        self.compile()
+
+    def compile(self):
+        """
+        Composes every route's chain from the current middleware.
+        """
+        for route in self._all_routes:
+            route.compile(self.middleware)
+
+    def add_route(self, path, handler, stream=False, cache_ttl=None,
+                  vary=(), executor=executors.INLINE, middleware=(),
+                  coalesce=None):
+        """
+        Creates a path:function pair for later retrieval by path.
 
         :param path: A string that matches a URL path.
-        :param handler: An async function that accepts a request
+        :param handler: An async or plain function that accepts a request
             and returns a string or Response object.
+        :param stream: Boolean - hand the request to the handler once its
+            headers are parsed and let it read the body as it arrives.
+        :param cache_ttl: seconds responses to GET requests are cached
+            for, if the server has a ResponseCache.
+        :param vary: names of request headers that are part of the cache
+            key.
+        :param executor: 'executors.INLINE' runs the handler on the event
+            loop, 'executors.THREAD' and 'executors.PROCESS' in the shared
+            thread and process pools, an 'executors.Pool' in that pool.
+            A pool raises ValueError for coroutine handlers.
+        :param middleware: a sequence of 'middleware.Middleware' that only
+            run for this route.
+        :param coalesce: True or a 'coalescing.Coalescer' lets identical
+            concurrent GET requests share one handler call.
         """
         compiled_route = self.__class__.build_route_regexp(path)
-        if compiled_route not in self.routes:
-            self.routes[compiled_route] = handler
-        else:
+        if compiled_route in self.routes:
+            raise DuplicateRoute
+
+        route = Route(path, handler, stream=stream, cache_ttl=cache_ttl,
+                      vary=vary, executor=executor, middleware=middleware,
+                      coalesce=coalesce, router_middleware=self.middleware)
+        if REGEXP_CHARS_REGEXP.search(path) is not None:
+            self._regexp_routes.append((compiled_route, route))
+        elif PARAM_REGEXP.search(path) is None:
+            self._static_routes[path] = route
+        elif not self._route_tree.insert(path.split('/'), route):
+            raise DuplicateRoute
+        self.routes[compiled_route] = handler
+        self._all_routes.append(route)
+
+    def add_static(self, prefix, directory, **kwargs):
+        """
+        Serves the files below a directory under a path prefix, ie.
+        add_static('/assets', 'public') serves 'public/css/site.css' for
+        '/assets/css/site.css'.
+
+        :param prefix: A string, the URL path the directory is served at.
+        :param directory: A string, the directory to serve.
+        :param kwargs: options passed on to 'static.StaticFiles'.
+        :return: the StaticFiles handler.
+        """
+        prefix = prefix.rstrip('/')
+        if any(route.path == prefix for route in self._mounts):
             raise DuplicateRoute
 
+        handler = StaticFiles(directory, **kwargs)
+        route = Route(prefix, handler, router_middleware=self.middleware)
+        self._mounts.append(route)
+        self._mounts.sort(key=lambda route: len(route.path), reverse=True)
+        self._all_routes.append(route)
+        return handler
+
+    def resolve(self, request):
+        """
+        Finds the route for a request and sets the request's path params.
+
+        :param request: a Request with its path set.
+        :return: the Route, whose 'handle' replies to the request.
+        """
+        route, path_params = self._match(request.path)
+        if path_params is not None:
+            request.path_params = path_params
+        return route
+
     def get_handler(self, path):
         """
         Retrieves the correct async function to process a request.
@@ -140,14 +725,43 @@ class Router(object):
         :return: an function that accepts a request and returns a string or
             Response object.
         """
+        route, path_params = self._match(path)
+        return HandlerWrapper(route.handler, path_params or {}, route)
+
+    def _match(self, path):
+        """
+        :param path: path part of an HTTP request.
+        :return: a tuple of the Route and a dict of its path params, None
+            for routes without any.
+        :raises NotFoundException: if no route matches.
+        """
         logger.debug('Getting handler for: {0}'.format(path))
-        for route, handler in self.routes.items():
-            path_params = self.__class__.match_path(route, path)
-            if path_params is not None:
-                logger.debug('Got handler for: {0}'.format(path))
-                wrapped_handler = HandlerWrapper(handler, path_params)
-                return wrapped_handler
+        route = self._static_routes.get(path)
+        if route is not None:
+            return route, None
+
+        path_params = {}
+        route = self._route_tree.match(path.split('/'), 0, path_params)
+        if route is None:
+            for compiled_route, route in self._regexp_routes:
+                path_params = self.match_path(compiled_route, path)
+                if path_params is not None:
+                    break
+            else:
+                route, path_params = self._match_mount(path)
+
+        logger.debug('Got handler for: {0}'.format(path))
+        return route, path_params
 
+    def _match_mount(self, path):
+        """
+        :param path: path part of an HTTP request.
+        :return: a tuple of the 'add_static' Route and its path params.
+        :raises NotFoundException: if no directory contains the path.
+        """
+        for route in self._mounts:
+            if path.startswith(route.path + '/'):
+                return route, {'path': path[len(route.path) + 1:]}
         raise NotFoundException()
 
     @classmethod
@@ -0,0 +1,190 @@
+"""
+In-memory cache of serialized responses for routes registered with a
+'cache_ttl'.
+"""
+
+import collections
+import hashlib
+import time
+
+from .http_utils import (
+    FileResponse,
+    NotModifiedResponse,
+    StreamingResponse,
+    to_response,
+    utf8_bytes,
+)
+
+
+MAX_SIZE = 16 * 1024 * 1024
+CACHEABLE_METHODS = ('GET',)
+
+
+class CacheEntry(object):
+    """
+    A frozen response together with its ETag and expiry time.
+
+    :param response: a frozen Response with an 'ETag' header.
+    :param etag: a string, the quoted entity tag of the response body.
+    :param expires: the clock time after which the entry is stale.
+    """
+    def __init__(self, response, etag, expires):
+        self.response = response
+        self.etag = etag
+        self.expires = expires
+        self.not_modified = NotModifiedResponse.from_response(
+            response).freeze()
+        self.size = response.frozen_size
+
+
+class ResponseCache(object):
+    """
+    Caches the responses of GET requests for routes with a 'cache_ttl',
+    keyed on the method, path, query parameters and the request headers
+    listed in the route's 'vary'. Only 200 responses with a body held in
+    memory are kept. They are frozen, so a hit is written straight from bytes
+    that were serialized once, without calling the handler.
+    Every cached response gets an ETag, and a request whose
+    'If-None-Match' matches it is answered with '304 Not Modified'.
+    Once the cached bodies add up to more than 'max_size' bytes, the least
+    recently used entries are evicted.
+
+    :param max_size: the maximum number of bytes kept in the cache.
+    :param clock: a function returning the current time in seconds.
+    """
+    def __init__(self, max_size=MAX_SIZE, clock=time.monotonic):
+        self.max_size = max_size
+        self.clock = clock
+        self.size = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def wrap(self, route, endpoint):
+        """
+        :param route: a Route with a 'cache_ttl'.
+        :param endpoint: the async function the route's middleware wraps,
+            see 'Route.chain'.
+        :return: an async function that accepts a Request and answers it
+            from the cache or with 'endpoint'.
+        """
+        async def cached(request):
+            return await self.respond(request, route, endpoint)
+        return cached
+
+    async def respond(self, request, route, endpoint):
+        """
+        Answers a request from the cache, or with the endpoint's
+        response, which is stored for later requests if it can be.
+        Responses from the cache are frozen.
+
+        :param request: a Request.
+        :param route: the Route the Router resolved the request to.
+        :param endpoint: the async function that makes the response,
+            inside of the route's middleware.
+        :return: a Response.
+        """
+        if not route.cache_ttl or request.method not in CACHEABLE_METHODS:
+            return await endpoint(request)
+
+        key = self.make_key(request, route.vary)
+        entry = self.get(key)
+        if entry is None:
+            response = to_response(await endpoint(request))
+            if (response.code != 200 or response.frozen or isinstance(
+                    response, (StreamingResponse, FileResponse))):
+                return response
+            entry = self.set(key, response, route.cache_ttl)
+
+        if etag_matches(request.headers.get('if-none-match'), entry.etag):
+            return entry.not_modified
+        return entry.response
+
+    @staticmethod
+    def make_key(request, vary=()):
+        """
+        :param request: a Request.
+        :param vary: names of request headers that select between
+            different responses, in lowercase.
+        :return: a hashable cache key.
+        """
+        return (
+            request.method,
+            request.path,
+            tuple(sorted((name, tuple(values)) for name, values in
+                         request.query_params.items())),
+            tuple(request.headers.get(name) for name in vary),
+        )
+
+    def get(self, key):
+        """
+        :param key: a key returned by 'make_key'.
+        :return: the CacheEntry or None if it's missing or stale.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= self.clock():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key, response, ttl):
+        """
+        Adds an ETag to a response, freezes it and stores it.
+
+        :param key: a key returned by 'make_key'.
+        :param response: a Response, it must not be frozen yet.
+        :param ttl: seconds the response stays fresh.
+        :return: the new CacheEntry.
+        """
+        etag = make_etag(utf8_bytes(response.body))
+        response.set_header('ETag', etag)
+        entry = CacheEntry(response.freeze(), etag, self.clock() + ttl)
+        if key in self._entries:
+            self._remove(key)
+        if entry.size > self.max_size:
+            return entry
+
+        self._entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_size:
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key).size
+
+
+def make_etag(body):
+    """
+    :param body: a bytes object.
+    :return: a strong, quoted entity tag derived from the body.
+    """
+    return '"{0}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest())
+
+
+def etag_matches(if_none_match, etag):
+    """
+    :param if_none_match: the value of an 'If-None-Match' header or None.
+    :param etag: a quoted entity tag.
+    :return: Boolean - whether the header lists the tag, compared weakly
+        as RFC 7232 asks for 'If-None-Match'.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
@@ -0,0 +1,167 @@
+"""
+Single-flight coalescing for routes added with 'coalesce'. While a
+handler call for a GET request is in flight, identical requests wait
+for its Response instead of calling the handler again, so a burst on a
+hot URL reaches the backing service once.
+"""
+
+import asyncio
+import copy
+
+from .exceptions import ServiceUnavailableException
+from .http_utils import FileResponse, StreamingResponse
+
+
+MAX_WAITERS = 1024
+COALESCING_METHODS = ('GET',)
+RETRY_AFTER = 1
+
+
+class Flight(object):
+    """
+    A handler call in progress and the number of requests waiting for it.
+    """
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+
+class Coalescer(object):
+    """
+    Lets concurrent requests with the same key share one call of a
+    route's endpoint. The key is made of the method, the path, the query
+    parameters named in 'query' and the request headers named in
+    'headers'. The first request runs the endpoint, the others get a copy
+    of its Response as the endpoint returned it, or its exception raised
+    again. Streaming and file
+    responses can't be shared, waiters for those call the endpoint
+    themselves, as do waiters of a call that was cancelled along with the
+    request that made it. A request that finds 'max_waiters' requests
+    already waiting gets a '503 Service Unavailable'.
+
+    :param query: names of the query parameters that are part of the key,
+        None for all of them.
+    :param headers: lowercase names of the request headers that are part
+        of the key.
+    :param max_waiters: the number of requests that may wait for one
+        call, None for no limit.
+    :param retry_after: seconds shed clients are asked to wait.
+    """
+    def __init__(self, query=None, headers=(), max_waiters=MAX_WAITERS,
+                 retry_after=RETRY_AFTER):
+        self.query = None if query is None else tuple(sorted(query))
+        self.headers = tuple(name.lower() for name in headers)
+        self.max_waiters = max_waiters
+        self.retry_after = retry_after
+        self.calls = 0
+        self.coalesced = 0
+        self.shed = 0
+        self._flights = {}
+
+    def wrap(self, endpoint):
+        """
+        :param endpoint: an async function that accepts a Request and
+            returns a Response.
+        :return: an async function with the same signature that
+            coalesces identical concurrent calls.
+        """
+        async def coalesced(request):
+            if request.method not in COALESCING_METHODS:
+                return await endpoint(request)
+            return await self.call(endpoint, request)
+        return coalesced
+
+    async def call(self, endpoint, request):
+        """
+        :param endpoint: the route's endpoint.
+        :param request: a Request.
+        :return: a Response, the endpoint's or a copy of it.
+        :raises ServiceUnavailableException: if too many requests wait
+            for the same call.
+        """
+        key = self.make_key(request)
+        flight = self._flights.get(key)
+        while flight is not None:
+            if (self.max_waiters is not None and
+                    flight.waiters >= self.max_waiters):
+                self.shed += 1
+                raise ServiceUnavailableException(
+                    'Too many identical requests',
+                    headers={'Retry-After': str(self.retry_after)})
+            flight.waiters += 1
+            try:
+                response = await asyncio.shield(flight.future)
+            except asyncio.CancelledError:
+                if not flight.future.cancelled():
+                    raise
+            finally:
+                flight.waiters -= 1
+            if flight.future.cancelled():
+                flight = self._flights.get(key)
+                continue
+            self.coalesced += 1
+            if response is None:
+                return await endpoint(request)
+            return share(response)
+
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight = Flight(future)
+        self.calls += 1
+        try:
+            response = await endpoint(request)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # marks it retrieved, asyncio logs it if no request waited
+            future.exception()
+            raise
+        else:
+            # waiters copy this copy, the leader's middleware and
+            # compression change the original in place
+            future.set_result(share(response))
+        finally:
+            del self._flights[key]
+        return response
+
+    def make_key(self, request):
+        """
+        :param request: a Request.
+        :return: a hashable key, equal for requests that share calls.
+        """
+        query_params = request.query_params
+        if self.query is None:
+            query = tuple(sorted((name, tuple(values)) for name, values in
+                                 query_params.items()))
+        else:
+            query = tuple((name, tuple(query_params.get(name, ())))
+                          for name in self.query)
+        return (
+            request.method,
+            request.path,
+            query,
+            tuple(request.headers.get(name) for name in self.headers),
+        )
+
+    def stats(self):
+        """
+        :return: a dict of the counters and the calls in flight.
+        """
+        return {'in_flight': len(self._flights), 'calls': self.calls,
+                'coalesced': self.coalesced, 'shed': self.shed}
+
+
+def share(response):
+    """
+    :param response: a Response returned by a coalesced call.
+    :return: a Response a waiter can send and change without affecting
+        the others, or None if the response can only be sent once.
+    """
+    if isinstance(response, (StreamingResponse, FileResponse)):
+        return None
+    if response.frozen:
+        return response
+    response = copy.copy(response)
+    response.headers = dict(response.headers)
+    return response
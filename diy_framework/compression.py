@@ -0,0 +1,238 @@
+"""
+gzip and deflate compression of responses, negotiated on the request's
+Accept-Encoding header.
+"""
+
+import weakref
+import zlib
+
+from .http_utils import (
+    FileResponse,
+    NotModifiedResponse,
+    Response,
+    StreamingResponse,
+    utf8_bytes,
+)
+
+
+MIN_SIZE = 1024
+OFFLOAD_SIZE = 65536
+LEVEL = 6
+CONTENT_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+WBITS = {
+    'gzip': 31,
+    'deflate': 15,
+}
+NO_BODY_CODES = (204, 304)
+
+
+class Compressor(object):
+    """
+    Compresses responses for clients that accept gzip or deflate. Bodies
+    shorter than 'min_size' and content types that don't start with one
+    of 'content_types' are sent as they are. Bodies of 'offload_size'
+    bytes or more are compressed in 'executor', zlib releases the GIL so
+    the event loop keeps serving other connections meanwhile.
+    StreamingResponses are compressed chunk by chunk, each chunk is
+    flushed so the client never waits for the compressor to fill up.
+
+    Frozen responses, ie. ones served from a ResponseCache, can't be
+    changed, so their compressed variants are built once, frozen and
+    remembered for as long as the original is alive. Compressed variants
+    get a weak ETag, since their bytes differ from the original's. A
+    '304 Not Modified' that knows its full response is replaced with the
+    304 of the variant that would have been sent, so it carries the same
+    ETag and Vary.
+
+    :param min_size: bodies shorter than this many bytes are not
+        compressed.
+    :param content_types: prefixes of the content types to compress.
+    :param level: the zlib compression level, 1 to 9.
+    :param offload_size: bodies of this many bytes or more are compressed
+        in the executor.
+    :param executor: a 'concurrent.futures.Executor' or None for the
+        loop's default executor.
+    """
+    def __init__(self, min_size=MIN_SIZE, content_types=CONTENT_TYPES,
+                 level=LEVEL, offload_size=OFFLOAD_SIZE, executor=None):
+        self.min_size = min_size
+        self.content_types = tuple(content_types)
+        self.level = level
+        self.offload_size = offload_size
+        self.executor = executor
+        self._variants = weakref.WeakKeyDictionary()
+
+    async def compress(self, request, response, loop):
+        """
+        :param request: the Request being answered.
+        :param response: its Response.
+        :param loop: the event loop whose executor compresses large
+            bodies.
+        :return: the response to send, either 'response' itself, changed
+            in place, or a new frozen Response for frozen ones.
+        """
+        if (isinstance(response, NotModifiedResponse) and
+                response.response is not None):
+            return await self._not_modified(request, response, loop)
+        if not self.compressible(response):
+            return response
+
+        encoding = negotiate(request.headers.get('accept-encoding'))
+        if response.frozen:
+            return await self._compress_frozen(response, encoding, loop)
+
+        add_vary(response)
+        if encoding is None:
+            return response
+        if isinstance(response, StreamingResponse):
+            response.body = self._compress_stream(
+                response.body, encoding, loop)
+        else:
+            body = utf8_bytes(response.body)
+            if len(body) < self.min_size:
+                return response
+            response.body = await self._compress_body(body, encoding, loop)
+        self._set_encoding(response, encoding)
+        return response
+
+    def compressible(self, response):
+        """
+        :param response: a Response.
+        :return: Boolean - whether the response may be compressed.
+        """
+        if response.code in NO_BODY_CODES or isinstance(
+                response, FileResponse):
+            return False
+        content_type = response.headers.get('content-type', '')
+        if not content_type.startswith(self.content_types):
+            return False
+        return not any(header.lower() == 'content-encoding'
+                       for header in response.headers)
+
+    async def _compress_frozen(self, response, encoding, loop):
+        variants = self._variants.get(response)
+        if variants is None:
+            variants = self._variants[response] = {}
+        variant = variants.get(encoding)
+        if variant is not None:
+            return variant
+
+        body = utf8_bytes(response.body)
+        headers = dict(response.headers)
+        headers.pop('Content-Length', None)
+        variant = Response(code=response.code, body=body, headers=headers,
+                           content_type=headers['content-type'])
+        add_vary(variant)
+        if encoding is not None and len(body) >= self.min_size:
+            variant.body = await self._compress_body(body, encoding, loop)
+            self._set_encoding(variant, encoding)
+        variants[encoding] = variant.freeze()
+        return variant
+
+    async def _not_modified(self, request, response, loop):
+        full = response.response
+        if not self.compressible(full):
+            return response
+        encoding = negotiate(request.headers.get('accept-encoding'))
+        variant = await self._compress_frozen(full, encoding, loop)
+        variants = self._variants[full]
+        key = (encoding, response.code)
+        not_modified = variants.get(key)
+        if not_modified is None:
+            not_modified = NotModifiedResponse.from_response(variant)
+            variants[key] = not_modified.freeze()
+        return not_modified
+
+    async def _compress_body(self, body, encoding, loop):
+        if len(body) >= self.offload_size:
+            return await loop.run_in_executor(
+                self.executor, self._compress_bytes, body, encoding)
+        return self._compress_bytes(body, encoding)
+
+    def _compress_bytes(self, body, encoding):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED,
+                                      WBITS[encoding])
+        return compressor.compress(body) + compressor.flush()
+
+    async def _compress_stream(self, body, encoding, loop):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED,
+                                      WBITS[encoding])
+        async for chunk in body:
+            chunk = utf8_bytes(chunk)
+            if len(chunk) >= self.offload_size:
+                chunk = await loop.run_in_executor(
+                    self.executor, flush_chunk, compressor, chunk)
+            else:
+                chunk = flush_chunk(compressor, chunk)
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+
+    @staticmethod
+    def _set_encoding(response, encoding):
+        response.headers['Content-Encoding'] = encoding
+        etag = response.headers.get('ETag')
+        if etag is not None and not etag.startswith('W/'):
+            response.headers['ETag'] = 'W/' + etag
+
+
+def flush_chunk(compressor, chunk):
+    """
+    :param compressor: a zlib compression object.
+    :param chunk: a bytes object.
+    :return: the compressed chunk, flushed so it can be decompressed
+        without waiting for the next one.
+    """
+    return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def add_vary(response):
+    """
+    Adds 'Accept-Encoding' to the Vary header of a response.
+
+    :param response: a Response that isn't frozen.
+    """
+    vary = response.headers.get('Vary')
+    if not vary:
+        response.headers['Vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        response.headers['Vary'] = vary + ', Accept-Encoding'
+
+
+def negotiate(accept_encoding):
+    """
+    Picks the supported encoding the client prefers, gzip on a tie.
+
+    :param accept_encoding: the value of an 'Accept-Encoding' header or
+        None.
+    :return: 'gzip', 'deflate' or None to send the body as it is.
+    """
+    if not accept_encoding:
+        return None
+
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in WBITS:
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
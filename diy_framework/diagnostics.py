@@ -0,0 +1,423 @@
+"""
+Runtime diagnostics for the event loop an App serves on. Diagnostics
+bundles:
+
+LoopMonitor - measures how late a periodic callback runs, which is how
+long the loop was kept from its other work, and logs the route and the
+stack of anything that blocks it for longer than 'slow_threshold'.
+SamplingProfiler - samples the loop's stack from a separate thread for a
+fixed window and writes one file of collapsed stacks per route, the
+input format of flamegraph.pl and speedscope.
+
+    diagnostics = Diagnostics(output_dir='/var/tmp/profiles')
+    router.add_route('/admin/profile', diagnostics.handler)
+    metrics.add_collector(diagnostics)
+    app = App(router, metrics=metrics, diagnostics=diagnostics)
+
+A profile is started with a request to the mounted handler or by
+sending 'profile_signal' to a worker process. Nothing is sampled until
+then; the monitor costs one callback per 'lag_interval' on the loop and
+a thread that wakes twice per 'slow_threshold'.
+"""
+
+import functools
+import gc
+import inspect
+import logging
+import os
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+from .exceptions import BadRequestException
+from .http_utils import Response
+from .metrics import Histogram, escape_label
+
+
+logger = logging.getLogger(__name__)
+
+LAG_INTERVAL = 0.1
+SLOW_THRESHOLD = 0.1
+SAMPLE_INTERVAL = 0.005
+PROFILE_DURATION = 30
+MAX_PROFILE_DURATION = 600
+PROFILE_SIGNAL = signal.SIGUSR1
+LAG_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+MAX_DEPTH = 128
+STACK_LIMIT = 8
+IDLE = '<idle>'
+SERVER = '<server>'
+OTHER = '<other>'
+
+
+def handler_code(handler):
+    """
+    :param handler: a route's handler, a function, a method, a
+        functools.partial or an object with a '__call__' method.
+    :return: the code object that runs when the handler is called, or
+        None if it has none, ie. a builtin.
+    """
+    while isinstance(handler, functools.partial):
+        handler = handler.func
+    handler = inspect.unwrap(handler)
+    handler = getattr(handler, '__func__', handler)
+    code = getattr(handler, '__code__', None)
+    if code is None:
+        code = getattr(getattr(type(handler), '__call__', None),
+                       '__code__', None)
+    return code
+
+
+def frame_name(frame):
+    """
+    :return: a string naming the frame's function by its module and
+        qualified name, ie. 'app.views:Users.get'.
+    """
+    code = frame.f_code
+    return '{0}:{1}'.format(frame.f_globals.get('__name__', '?'),
+                            getattr(code, 'co_qualname', code.co_name))
+
+
+def slugify(label):
+    """
+    :param label: a route path or one of the IDLE, SERVER and OTHER
+        labels.
+    :return: a string that can be used as a file name.
+    """
+    return re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_') or 'root'
+
+
+class StackInspector(object):
+    """
+    Works out which route a stack of the loop's thread belongs to, from
+    the code objects of the routes' handlers. Stacks outside any handler
+    are labelled IDLE when the loop waits for events, SERVER in the
+    framework's own code, ie. the parser, and OTHER otherwise.
+    """
+    def __init__(self):
+        self._codes = {}
+
+    def add_routes(self, routes):
+        """
+        :param routes: an iterable of Routes, ie. a Router.
+        """
+        for route in routes:
+            code = handler_code(route.handler)
+            if code is not None:
+                self._codes.setdefault(code, route.path)
+
+    def inspect(self, frame):
+        """
+        :param frame: the innermost frame of a stack.
+        :return: a tuple of the label and a list of frame names, the
+            outermost first.
+        """
+        codes = self._codes
+        label = None
+        in_server = False
+        names = []
+        idle = frame.f_globals.get('__name__') == 'selectors'
+        while frame is not None and len(names) < MAX_DEPTH:
+            if label is None:
+                label = codes.get(frame.f_code)
+            if not in_server:
+                in_server = frame.f_globals.get(
+                    '__name__', '').startswith(__package__)
+            names.append(frame_name(frame))
+            frame = frame.f_back
+        names.reverse()
+        if label is None:
+            label = IDLE if idle else SERVER if in_server else OTHER
+        return label, names
+
+
+class LoopMonitor(object):
+    """
+    Schedules a callback every 'interval' seconds and records how late
+    it runs in a histogram, together with the time spent in garbage
+    collection. A watchdog thread checks on the callback, and once it's
+    more than 'slow_threshold' seconds overdue, samples the loop's stack,
+    logs it with the route it belongs to and counts it against that
+    route. Collections hold the GIL, so the watchdog can't catch those;
+    late callbacks log how much of the lag was spent in them instead.
+
+    :param inspector: a StackInspector.
+    :param interval: seconds between callbacks.
+    :param slow_threshold: seconds the loop may be blocked before it's
+        reported, None disables the watchdog.
+    :param buckets: upper bounds of the lag histogram's buckets.
+    """
+    def __init__(self, inspector, interval=LAG_INTERVAL,
+                 slow_threshold=SLOW_THRESHOLD, buckets=LAG_BUCKETS):
+        self.inspector = inspector
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.lag = Histogram(buckets)
+        self.max_lag = 0.0
+        self.slow_callbacks = {}
+        self.gc_collections = 0
+        self.gc_pause = 0.0
+        self._loop = None
+        self._thread_id = None
+        self._handle = None
+        self._expected = None
+        self._beat = None
+        self._reported = None
+        self._tick_gc_pause = 0.0
+        self._gc_started = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def start(self, loop):
+        """
+        Starts monitoring. Must be called from the loop's thread.
+        """
+        self._loop = loop
+        self._thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._schedule(loop.time())
+        gc.callbacks.append(self._on_gc)
+        if self.slow_threshold is not None:
+            self._watchdog = threading.Thread(
+                target=self._watch, name='diy-loop-watchdog', daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        self._stopped.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    def _schedule(self, now):
+        self._beat = time.monotonic()
+        self._tick_gc_pause = self.gc_pause
+        self._expected = now + self.interval
+        self._handle = self._loop.call_at(self._expected, self._tick)
+
+    def _tick(self):
+        now = self._loop.time()
+        lag = max(0.0, now - self._expected)
+        self.lag.observe(lag)
+        self.max_lag = max(self.max_lag, lag)
+        if self.slow_threshold is not None and lag > self.slow_threshold:
+            logger.warning(
+                'Event loop lagged {0:.1f} ms, {1:.1f} ms of it in garbage '
+                'collection'.format(
+                    lag * 1000,
+                    (self.gc_pause - self._tick_gc_pause) * 1000))
+        self._schedule(now)
+
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self._gc_started = time.perf_counter()
+        elif self._gc_started is not None:
+            self.gc_collections += 1
+            self.gc_pause += time.perf_counter() - self._gc_started
+            self._gc_started = None
+
+    def _watch(self):
+        threshold = self.slow_threshold
+        while not self._stopped.wait(threshold / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < threshold or beat == self._reported:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self._reported = beat
+            label, _ = self.inspector.inspect(frame)
+            stack = ''.join(traceback.format_stack(frame, STACK_LIMIT))
+            del frame
+            self.slow_callbacks[label] = self.slow_callbacks.get(label, 0) + 1
+            logger.warning(
+                'Event loop blocked for over {0:.1f} ms by {1}:\n{2}'.format(
+                    blocked * 1000, label, stack.rstrip()))
+
+    def render(self):
+        """
+        :return: a list of lines in Prometheus text format.
+        """
+        lines = ['# TYPE diy_loop_lag_seconds histogram']
+        lines.extend(self.lag.render('diy_loop_lag_seconds', ''))
+        lines.append('# TYPE diy_loop_lag_max_seconds gauge')
+        lines.append('diy_loop_lag_max_seconds {0}'.format(self.max_lag))
+        lines.append('# TYPE diy_slow_callbacks_total counter')
+        for label, count in sorted(self.slow_callbacks.items()):
+            lines.append('diy_slow_callbacks_total{{route="{0}"}} {1}'.format(
+                escape_label(label), count))
+        lines.append('# TYPE diy_gc_collections_total counter')
+        lines.append('diy_gc_collections_total {0}'.format(
+            self.gc_collections))
+        lines.append('# TYPE diy_gc_pause_seconds_total counter')
+        lines.append('diy_gc_pause_seconds_total {0}'.format(self.gc_pause))
+        return lines
+
+
+class SamplingProfiler(object):
+    """
+    Samples the stack of one thread every 'interval' seconds for a fixed
+    window, then writes a directory with a '<route>.folded' file per
+    route, each line a ';' separated stack and the number of samples it
+    was seen in. Only one profile runs at a time.
+
+    :param inspector: a StackInspector.
+    :param interval: seconds between samples.
+    :param output_dir: where the profile directories are created, the
+        system's temporary directory if None.
+    """
+    def __init__(self, inspector, interval=SAMPLE_INTERVAL, output_dir=None):
+        self.inspector = inspector
+        self.interval = interval
+        self.output_dir = output_dir or tempfile.gettempdir()
+        self.directory = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id, duration):
+        """
+        :param thread_id: the identifier of the thread to sample.
+        :param duration: seconds to sample for.
+        :return: Boolean - False if a profile is already running.
+        """
+        if self.running:
+            return False
+        self.directory = os.path.join(
+            self.output_dir, 'profile-{0}-{1}'.format(
+                os.getpid(), time.strftime('%Y%m%d-%H%M%S')))
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(thread_id, duration, self.directory),
+            name='diy-profiler', daemon=True)
+        self._thread.start()
+        logger.info('Profiling for {0} s into {1}'.format(
+            duration, self.directory))
+        return True
+
+    def stop(self):
+        """
+        Ends a running profile early, its samples are still written.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, thread_id, duration, directory):
+        samples = {}
+        deadline = time.monotonic() + duration
+        while (time.monotonic() < deadline and
+               not self._stopped.wait(self.interval)):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            label, names = self.inspector.inspect(frame)
+            del frame
+            stacks = samples.setdefault(label, {})
+            stack = ';'.join(names)
+            stacks[stack] = stacks.get(stack, 0) + 1
+        self.write(samples, directory)
+
+    def write(self, samples, directory):
+        """
+        :param samples: a dict of label: {stack: count}.
+        :param directory: the directory to create and write to.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for label, stacks in samples.items():
+            path = os.path.join(directory, slugify(label) + '.folded')
+            with open(path, 'w') as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write('{0} {1}\n'.format(stack, count))
+        logger.info('Wrote {0} profiles to {1}'.format(
+            len(samples), directory))
+
+
+class Diagnostics(object):
+    """
+    A LoopMonitor and a SamplingProfiler for the loop of an App, which
+    starts them with its server and stops them with it. Its 'handler'
+    starts a profile when mounted on a Router; the window can be given
+    as the 'seconds' query parameter. It renders the monitor's numbers
+    so it can be added to 'metrics.Metrics' as a collector.
+
+    :param lag_interval: seconds between the monitor's callbacks.
+    :param slow_threshold: seconds the loop may be blocked before the
+        stack is logged, None disables the watchdog.
+    :param sample_interval: seconds between a profile's samples.
+    :param profile_duration: the default window of a profile, in seconds.
+    :param output_dir: where profiles are written, the system's
+        temporary directory if None.
+    :param profile_signal: a signal that starts a profile in a worker,
+        None to not handle any.
+    """
+    def __init__(self, lag_interval=LAG_INTERVAL,
+                 slow_threshold=SLOW_THRESHOLD,
+                 sample_interval=SAMPLE_INTERVAL,
+                 profile_duration=PROFILE_DURATION, output_dir=None,
+                 profile_signal=PROFILE_SIGNAL):
+        self.inspector = StackInspector()
+        self.monitor = LoopMonitor(self.inspector, lag_interval,
+                                   slow_threshold)
+        self.profiler = SamplingProfiler(self.inspector, sample_interval,
+                                         output_dir)
+        self.profile_duration = profile_duration
+        self.profile_signal = profile_signal
+        self._thread_id = None
+
+    def start(self, loop, routes=()):
+        """
+        :param loop: the event loop to watch, this must be its thread.
+        :param routes: an iterable of Routes, ie. a Router, whose
+            handlers stacks are attributed to.
+        """
+        self._thread_id = threading.get_ident()
+        self.inspector.add_routes(routes)
+        self.monitor.start(loop)
+
+    def stop(self):
+        self.monitor.stop()
+        self.profiler.stop()
+
+    def profile(self, duration=None):
+        """
+        Starts sampling the loop's thread.
+
+        :param duration: seconds to sample for, 'profile_duration' if
+            None.
+        :return: Boolean - False if a profile is already running.
+        """
+        return self.profiler.start(
+            self._thread_id, duration or self.profile_duration)
+
+    def render(self):
+        return self.monitor.render()
+
+    async def handler(self, request):
+        seconds = request.query_params.get('seconds', [None])[0]
+        try:
+            duration = float(seconds) if seconds else self.profile_duration
+        except ValueError:
+            raise BadRequestException('Invalid seconds')
+        if not 0 < duration <= MAX_PROFILE_DURATION:
+            raise BadRequestException('Invalid seconds')
+        if not self.profile(duration):
+            return Response(code=200, body='A profile is already running '
+                            'into {0}\n'.format(self.profiler.directory),
+                            content_type='text/plain')
+        return Response(code=202, body='Profiling for {0} s into {1}\n'.format(
+            duration, self.profiler.directory), content_type='text/plain')
@@ -10,9 +10,33 @@ class BadRequestException(DiyFrameworkException):
     code = 400
 
 
+class PayloadTooLargeException(BadRequestException):
+    code = 413
+
+
+class URITooLongException(BadRequestException):
+    code = 414
+
+
+class HeadersTooLargeException(BadRequestException):
+    code = 431
+
+
+class ServiceUnavailableException(DiyFrameworkException):
+    code = 503
+
+    def __init__(self, *args, headers=None):
+        super().__init__(*args)
+        self.headers = headers
+
+
 class DuplicateRoute(DiyFrameworkException):
     pass
 
 
+class FrozenResponse(DiyFrameworkException):
+    pass
+
+
 class TimeoutException(DiyFrameworkException):
     code = 500
@@ -0,0 +1,152 @@
+"""
+Execution policies for route handlers. Coroutine handlers are awaited
+on the event loop, plain functions can run on the loop too, in a pool of
+threads for blocking work or in a pool of processes for CPU-bound work.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+import weakref
+
+from .exceptions import ServiceUnavailableException
+
+
+INLINE = 'inline'
+THREAD = 'thread'
+PROCESS = 'process'
+MAX_PENDING = 100
+START_METHOD = ('forkserver' if 'forkserver' in
+                multiprocessing.get_all_start_methods() else 'spawn')
+_started_pools = weakref.WeakSet()
+
+
+class Pool(object):
+    """
+    A 'concurrent.futures' executor with a bound on the number of calls
+    it holds, running or waiting. Calls over the bound are refused with
+    ServiceUnavailableException instead of queueing without limit.
+    The executor is created on first use in every process, so pools can
+    be configured before App forks its workers.
+
+    :param max_workers: the number of threads or processes, None for the
+        executor's default.
+    :param max_pending: the maximum number of calls held at once.
+    """
+    executor_class = None
+
+    def __init__(self, max_workers=None, max_pending=MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = None
+        self._pid = None
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        :param fn: the function to call in the executor.
+        :return: the function's return value.
+        """
+        if self.pending >= self.max_pending:
+            raise ServiceUnavailableException()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    @property
+    def executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = self.new_executor()
+            self._pid = os.getpid()
+            _started_pools.add(self)
+        return self._executor
+
+    def new_executor(self):
+        """
+        :return: a new executor of 'executor_class'.
+        """
+        return self.executor_class(max_workers=self.max_workers)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the executor, it's created again if the pool is used later.
+
+        :param wait: Boolean - wait for running calls to finish.
+        """
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
+        _started_pools.discard(self)
+
+
+class ThreadPool(Pool):
+    """
+    Pool of threads for handlers that block on I/O or release the GIL.
+    """
+    executor_class = concurrent.futures.ThreadPoolExecutor
+
+
+class ProcessPool(Pool):
+    """
+    Pool of processes for CPU-bound handlers. Handlers, their arguments
+    and their return values are pickled, so handlers must be module level
+    functions and get a copy of the Request.
+
+    The executor is created while a request is being served, so its
+    processes are not forked from the server: a forked copy would hold
+    the client's and the listening sockets open. They are started with
+    'start_method', 'forkserver' or 'spawn', which import the main module
+    again, so a script that starts an App must do it under
+    "if __name__ == '__main__':".
+
+    :param start_method: a 'multiprocessing' start method that doesn't
+        fork the calling process.
+    """
+    executor_class = concurrent.futures.ProcessPoolExecutor
+
+    def __init__(self, max_workers=None, max_pending=MAX_PENDING,
+                 start_method=START_METHOD):
+        super().__init__(max_workers, max_pending)
+        self.start_method = start_method
+
+    def new_executor(self):
+        return self.executor_class(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(self.start_method))
+
+
+pools = {
+    THREAD: ThreadPool(),
+    PROCESS: ProcessPool(),
+}
+
+
+def get_pool(executor):
+    """
+    :param executor: INLINE, THREAD, PROCESS or a Pool.
+    :return: the Pool to run handlers in, None to run them on the loop.
+    """
+    if executor is None or executor == INLINE:
+        return None
+    if isinstance(executor, Pool):
+        return executor
+    try:
+        return pools[executor]
+    except KeyError:
+        raise ValueError('Unknown executor: {0}'.format(executor))
+
+
+def shutdown(wait=True):
+    """
+    Stops the executors of every pool started in this process.
+
+    :param wait: Boolean - wait for running calls to finish.
+    """
+    for pool in list(_started_pools):
+        pool.shutdown(wait=wait)
@@ -1,14 +1,23 @@
 """
 Module response for parsing bytes objects into HTTP requests.
-All of the functions in here operate on byte buffers and modify them
-instead of working on copies.
+RequestParser keeps its progress between calls so that every byte of a
+request is scanned once, reads the buffer through memoryviews and only
+deletes bytes from it once a whole request has been consumed, or as soon
+as a streamed body has been read.
 """
 
+import functools
 import re
-import json
 from urllib import parse
 
-from .exceptions import BadRequestException
+from . import json_utils
+from . import multipart
+from .exceptions import (
+    BadRequestException,
+    HeadersTooLargeException,
+    PayloadTooLargeException,
+    URITooLongException,
+)
 
 
 CRLF = b'\x0d\x0a'
@@ -20,198 +29,551 @@ SUPPORTED_METHODS = [
 ]
 REQUEST_LINE_REGEXP = re.compile(br'[a-z]+ [a-z0-9.?_\[\]=&-\\]+ http/%s' %
                                  (HTTP_VERSION), flags=re.IGNORECASE)
+MAX_REQUEST_LINE = 8192
+MAX_HEADER_SIZE = 32768
+MAX_HEADERS = 100
+MAX_BODY_SIZE = 1048576
+MAX_CHUNK_LINE = 4096
+FRAMING_HEADERS = ('content-length', 'transfer-encoding', 'connection')
+FRAMING_HEADERS_REGEXP = re.compile(
+    br'\r\n(%s)[ \t]*:([^\r]*)' % b'|'.join(
+        name.encode('ascii') for name in FRAMING_HEADERS),
+    flags=re.IGNORECASE)
+
+
+class RequestParser(object):
+    """
+    Stateful, incremental parser for the requests sent over a single
+    connection. It remembers how far it scanned for the end of the headers
+    and where the body starts, so feeding it a request in many small
+    chunks costs the same as feeding it in one go.
+
+    Bodies are either buffered by 'parse_into' until the whole request has
+    arrived, or consumed piece by piece with 'read_body' once 'parse_head'
+    has parsed the headers.
+
+    Limits are checked as bytes arrive, so a request over one of them is
+    rejected before the rest of it is buffered. None disables a limit.
+
+    :param max_request_line: the longest request line, in bytes, or
+        URITooLongException is raised.
+    :param max_header_size: the most bytes of headers, or
+        HeadersTooLargeException is raised.
+    :param max_headers: the most header lines, or HeadersTooLargeException
+        is raised.
+    :param max_body_size: the largest body 'parse_into' buffers, or
+        PayloadTooLargeException is raised. A Content-Length over it is
+        rejected before any of the body arrives. Bodies read with
+        'read_body' aren't limited.
+
+    Chunked bodies, also those read with 'read_body', are kept to
+    MAX_CHUNK_LINE bytes per chunk size line and to 'max_header_size'
+    bytes of trailers.
+    """
+    def __init__(self, max_request_line=MAX_REQUEST_LINE,
+                 max_header_size=MAX_HEADER_SIZE, max_headers=MAX_HEADERS,
+                 max_body_size=MAX_BODY_SIZE):
+        self.max_request_line = max_request_line
+        self.max_header_size = max_header_size
+        self.max_headers = max_headers
+        self.max_body_size = max_body_size
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the progress made on the current request.
+        """
+        self._scan_offset = 0
+        self._line_end = None
+        self._line_scan_offset = 0
+        self._count_offset = 0
+        self._header_lines = 0
+        self._body_start = None
+        self._decoder = None
+        self._chunks = None
+
+    def parse_into(self, request, buffer):
+        """
+        Parses as much of buffer as possible into request. Once request
+        is finished its bytes are deleted from the buffer, anything after
+        them (ie. a pipelined request) is left in place. The head and the
+        framing of a chunked body are deleted as soon as the chunks are
+        decoded, so the buffer holds at most a partial line of framing
+        and 'max_body_size' bounds what is kept. This method is
+        expected to be called with the same request and buffer objects
+        throughout an HTTP request's life cycle.
+
+        :param request: an object that will store parsed data. Must expose
+            the Request interface.
+        :param buffer: a bytearray, modified in place.
+        :return: the buffer param.
+        """
+        if request.finished or not self.parse_head(request, buffer):
+            return buffer
+        if request.finished:
+            return buffer
+
+        max_body_size = self.max_body_size
+        if isinstance(self._decoder, ChunkedDecoder):
+            chunks, self._body_start = self._decoder.decode(
+                buffer, self._body_start)
+            for chunk in chunks:
+                self._chunks.extend(chunk)
+            if (max_body_size is not None and
+                    len(self._chunks) > max_body_size):
+                raise PayloadTooLargeException()
+            if self._decoder.done:
+                self._finish_body(request, buffer, bytes(self._chunks))
+            else:
+                del buffer[:self._body_start]
+                self._body_start = 0
+            return buffer
+
+        if (max_body_size is not None and
+                self._decoder.remaining > max_body_size):
+            raise PayloadTooLargeException()
+        body_end = self._body_start + self._decoder.remaining
+        if len(buffer) >= body_end:
+            with memoryview(buffer) as view:
+                body_raw = bytes(view[self._body_start:body_end])
+            self._body_start = body_end
+            self._finish_body(request, buffer, body_raw)
+        return buffer
+
+    def parse_head(self, request, buffer):
+        """
+        Parses the request line and the headers once the CRLFCRLF sequence
+        has arrived. Only bytes that were not scanned by previous calls
+        are searched. A request without a body is finished right away.
+
+        :param request: an object that exposes the Request interface.
+        :param buffer: a bytearray, modified in place.
+        :return: Boolean - whether the headers have been parsed.
+        """
+        if self._body_start is not None:
+            return True
+
+        headers_end = buffer.find(SEPARATOR, self._scan_offset)
+        if headers_end == -1:
+            self._scan_offset = max(0, len(buffer) - len(SEPARATOR) + 1)
+            self._check_head_size(buffer)
+            return False
+
+        line_end = self._find_line_end(buffer, headers_end + len(CRLF))
+        self._check_head_size(buffer, headers_end)
+        with memoryview(buffer) as view, view[:line_end] as request_line:
+            if REQUEST_LINE_REGEXP.match(request_line) is None:
+                raise BadRequestException('Malformed request line')
+            (request.method, request.path,
+             request.raw_query) = split_request_line(request_line)
+            request.raw_headers = bytes(view[line_end:headers_end])
+        request.framing_headers = scan_framing_headers(request.raw_headers)
+
+        self._body_start = headers_end + len(SEPARATOR)
+        self._decoder = get_body_decoder(
+            request.framing_headers, self.max_header_size)
+        if self._decoder is None:
+            self._finish(request, buffer, self._body_start)
+        else:
+            self._chunks = bytearray()
+        return True
+
+    def _find_line_end(self, buffer, end):
+        """
+        :param buffer: a bytearray that starts with a request.
+        :param end: the position the search stops at.
+        :return: the position of the CRLF after the request line, -1 if
+            it isn't in buffer[:end]. Bytes searched by previous calls
+            aren't searched again.
+        """
+        if self._line_end is None:
+            line_end = buffer.find(CRLF, self._line_scan_offset, end)
+            if line_end == -1:
+                self._line_scan_offset = max(
+                    self._line_scan_offset, end - len(CRLF) + 1)
+                return -1
+            self._line_end = line_end
+        return self._line_end
+
+    def _check_head_size(self, buffer, headers_end=None):
+        """
+        Raises if the request line or the headers are over their limits,
+        also while the end of them hasn't arrived yet. Incomplete headers
+        are measured the way they will be once they're complete: only
+        header lines that end with a CRLF are counted, and the bytes of a
+        partly received CRLFCRLF are not. Header lines are counted as
+        they arrive, so every call only looks at new bytes.
+
+        :param buffer: a bytearray that starts with a request.
+        :param headers_end: the position of the CRLFCRLF after the
+            headers, None if they aren't complete.
+        """
+        max_request_line = self.max_request_line
+        max_header_size = self.max_header_size
+        max_headers = self.max_headers
+        if (max_request_line is None and max_header_size is None and
+                max_headers is None):
+            return
+
+        if headers_end is None:
+            end = len(buffer)
+            if max_request_line is not None:
+                end = min(end, max_request_line + len(CRLF))
+            line_end = self._find_line_end(buffer, end)
+            if line_end == -1:
+                if (max_request_line is not None and
+                        len(buffer) > max_request_line + 1):
+                    raise URITooLongException()
+                return
+            end = len(buffer)
+            size = end - line_end - (len(SEPARATOR) - 1)
+        else:
+            line_end = self._line_end
+            end = headers_end + len(CRLF)
+            size = headers_end - line_end
+
+        if max_request_line is not None and line_end > max_request_line:
+            raise URITooLongException()
+        if max_header_size is not None and size > max_header_size:
+            raise HeadersTooLargeException()
+        if max_headers is not None:
+            # a CR at the end may start a CRLF, it's counted next time
+            start = max(self._count_offset, line_end + len(CRLF))
+            self._header_lines += buffer.count(CRLF, start, end)
+            self._count_offset = end
+            if buffer.endswith(b'\r', 0, end):
+                self._count_offset -= 1
+            if self._header_lines > max_headers:
+                raise HeadersTooLargeException()
+
+    def read_body(self, request, buffer, size=-1):
+        """
+        Decodes the body bytes that are available in buffer and deletes
+        them, so a body read this way never accumulates in the buffer.
+        Must only be called once 'parse_head' returned True.
+
+        :param request: an object that exposes the Request interface.
+        :param buffer: a bytearray, modified in place.
+        :param size: maximum number of bytes to return, -1 for no limit.
+        :return: a bytes object, empty if no body bytes are available yet
+            or the request is finished.
+        """
+        if request.finished:
+            return b''
+        chunks, consumed = self._decoder.decode(
+            buffer, self._body_start, size)
+        self._body_start = 0
+        if self._decoder.done:
+            self._finish(request, buffer, consumed)
+        else:
+            del buffer[:consumed]
+        return b''.join(chunks)
+
+    def _finish_body(self, request, buffer, body_raw):
+        request.body_raw = body_raw
+        self._finish(request, buffer, self._body_start)
+
+    def _finish(self, request, buffer, consumed):
+        del buffer[:consumed]
+        request.finished = True
+        self.reset()
 
 
-def parse_into(request, buffer):
+class ContentLengthDecoder(object):
+    """
+    Reads a body delimited by the Content-Length header.
+
+    :param length: an int, the value of Content-Length.
+    """
+    def __init__(self, length):
+        self.remaining = length
+
+    @property
+    def done(self):
+        return self.remaining == 0
+
+    def decode(self, buffer, offset, size=-1):
+        """
+        :param buffer: a bytearray.
+        :param offset: the position of the first unread body byte.
+        :param size: maximum number of bytes to decode, -1 for no limit.
+        :return: a tuple of a list of bytes objects and the position of
+            the first byte that was not consumed.
+        """
+        available = min(len(buffer) - offset, self.remaining)
+        if size >= 0:
+            available = min(available, size)
+        if available <= 0:
+            return [], offset
+
+        with memoryview(buffer) as view:
+            chunk = bytes(view[offset:offset + available])
+        self.remaining -= available
+        return [chunk], offset + available
+
+
+class ChunkedDecoder(object):
     """
-    Main function of the module - it incrementally parses a bytes object
-    and stores the information in request. First it attempts to parse the
-    request line and http headers. Based on that, it then attempts to
-    parse the body if applicable. This function expected to be called
-    with the same request and buffer objects throughout an HTTP request's
-    life cycle.
+    Incrementally decodes a body sent with 'Transfer-Encoding: chunked'.
+    Chunk extensions and trailers are read and discarded. Their lines are
+    limited as soon as they're buffered, so a line without its CRLF can't
+    grow without bound.
+
+    :param max_line: the longest chunk size line, extensions included,
+        or PayloadTooLargeException is raised.
+    :param max_trailer_size: the most bytes of trailers, or
+        HeadersTooLargeException is raised. None disables the limit.
+    """
+    SIZE, DATA, DATA_END, TRAILER = range(4)
+
+    def __init__(self, max_line=MAX_CHUNK_LINE, max_trailer_size=None):
+        self.max_line = max_line
+        self.max_trailer_size = max_trailer_size
+        self.done = False
+        self._state = self.SIZE
+        self._remaining = 0
+        self._trailer_size = 0
+
+    def decode(self, buffer, offset, size=-1):
+        """
+        :param buffer: a bytearray.
+        :param offset: the position of the first byte that was not
+            consumed by a previous call.
+        :param size: maximum number of bytes to decode, -1 for no limit.
+        :return: a tuple of a list of bytes objects and the position of
+            the first byte that was not consumed.
+        """
+        chunks = []
+        with memoryview(buffer) as view:
+            while not self.done and size != 0:
+                if self._state == self.DATA:
+                    available = min(len(buffer) - offset, self._remaining)
+                    if size > 0:
+                        available = min(available, size)
+                        size -= available
+                    if available == 0:
+                        break
+                    chunks.append(bytes(view[offset:offset + available]))
+                    offset += available
+                    self._remaining -= available
+                    if self._remaining == 0:
+                        self._state = self.DATA_END
+                    continue
+
+                line_end = buffer.find(CRLF, offset)
+                self._check_line(
+                    (len(buffer) if line_end == -1 else line_end) - offset)
+                if line_end == -1:
+                    break
+                line = bytes(view[offset:line_end])
+                offset = line_end + len(CRLF)
+
+                if self._state == self.SIZE:
+                    self._remaining = parse_chunk_size(line)
+                    self._state = (
+                        self.DATA if self._remaining else self.TRAILER)
+                elif self._state == self.DATA_END:
+                    if line:
+                        raise BadRequestException('Malformed chunk')
+                    self._state = self.SIZE
+                elif not line:
+                    self.done = True
+                else:
+                    self._trailer_size += len(line) + len(CRLF)
+        return chunks, offset
+
+    def _check_line(self, length):
+        """
+        :param length: bytes of the current line buffered so far.
+        """
+        if self._state != self.TRAILER:
+            if length > self.max_line:
+                raise PayloadTooLargeException('Chunk size line too long')
+        elif (self.max_trailer_size is not None and
+                self._trailer_size + length > self.max_trailer_size):
+            raise HeadersTooLargeException('Trailers too large')
+
+
+def parse_into(request, buffer, **limits):
+    """
+    Stateless version of RequestParser.parse_into. Because the buffer is
+    only modified once a request is finished, it can be called repeatedly
+    with the same request and buffer, at the cost of parsing the headers
+    again on every call.
 
     :param request: an object that will store parsed data. Must expose the
         Request interface.
-    :param buffer: a bytes objects. It will copied, the copy will be
-        modified during parsing.
-    :return: A bytes object that is the modified copy of the buffer param.
-    """
-    _buffer = buffer[:]
-    if not request.method and can_parse_request_line(_buffer):
-        (request.method, request.path,
-         request.query_params) = parse_request_line(_buffer)
-        remove_request_line(_buffer)
-
-    if not request.headers and can_parse_headers(_buffer):
-        request.headers = parse_headers(_buffer)
-        if not has_body(request.headers):
-            request.finished = True
-
-        remove_intro(_buffer)
-
-    if not request.finished and can_parse_body(request.headers, _buffer):
-        request.body_raw, request.body = parse_body(request.headers, _buffer)
-        clear_buffer(_buffer)
-        request.finished = True
-    return _buffer
+    :param buffer: a bytearray, modified in place.
+    :param limits: passed on to RequestParser.
+    :return: the buffer param.
+    """
+    return RequestParser(**limits).parse_into(request, buffer)
 
 
-def has_body(headers):
+def is_chunked(headers):
     """
-    :param headers: A dict-like object.
+    :param headers: A dict of header: value pairs.
+    :return: Boolean - whether the body uses chunked transfer-encoding.
     """
-    return 'content-length' in headers
+    encodings = headers.get('transfer-encoding', '').split(',')
+    return encodings[-1].strip().lower() == 'chunked'
 
 
-def can_parse_request_line(buffer):
+def get_body_decoder(headers, max_trailer_size=None):
     """
-    Uses a regular expression to determine whether buffer contains
-    something that looks like an HTTP request line.
-
-    :param buffer: a bytes like object.
+    :param headers: A dict of header: value pairs.
+    :param max_trailer_size: the most bytes of trailers of a chunked
+        body, None for no limit.
+    :return: A decoder for the request's body or None if it has none.
     """
-    return REQUEST_LINE_REGEXP.match(buffer) is not None
+    if is_chunked(headers):
+        return ChunkedDecoder(max_trailer_size=max_trailer_size)
+    elif 'content-length' in headers:
+        return ContentLengthDecoder(get_content_length(headers))
+    return None
 
 
-def can_parse_headers(buffer):
+def parse_chunk_size(line):
+    """
+    :param line: a bytes object, the chunk size line without CRLF.
+    :return: the size of the chunk as an int.
     """
-    Checks to see if buffer contains the CRLFCRFL sequence, which
-    signals the end of headers in an HTTP request.
+    try:
+        return int(line.split(b';')[0].strip(), 16)
+    except ValueError:
+        raise BadRequestException('Invalid chunk size')
+
 
-    :param buffer: a bytes like object.
+def get_content_length(headers):
     """
-    return SEPARATOR in buffer
+    :param headers: A dict of header: value pairs.
+    :return: The value of the Content-Length header as an int.
+    :raises BadRequestException: unless the value is made of ASCII
+        digits only. int() alone would accept signs, underscores and
+        non-ASCII digits.
+    """
+    content_length = headers.get('content-length', '0')
+    if not (content_length.isascii() and content_length.isdigit()):
+        raise BadRequestException('Invalid Content-Length')
+    return int(content_length)
 
 
-def parse_request_line(buffer):
+def split_request_line(request_line):
     """
-    Parses the buffer to extract information from the request line.
+    Extracts information from the request line, leaving the query string
+    undecoded.
 
-    :param buffer: a bytes like object.
-    :return: A typle of HTTP method, path, and query params.
+    :param request_line: a bytes like object without the trailing CRLF.
+    :return: A tuple of HTTP method, path, and raw query string.
     """
-    request_line = buffer.split(CRLF)[0].decode('utf-8')
-    method, raw_path = request_line.split(' ')[:2]
+    method, raw_path = bytes(request_line).decode('utf-8').split(' ')[:2]
     method = method.upper()
     if method not in SUPPORTED_METHODS:
         raise BadRequestException('{} method not supported'.format(method))
 
-    path, query_params = parse_query_params(raw_path)
-    return method, path, query_params
+    if raw_path.startswith('/'):
+        path, _, raw_query = raw_path.partition('#')[0].partition('?')
+        return method, path, raw_query
+    url_obj = parse.urlparse(raw_path)
+    return method, url_obj.path, url_obj.query
 
 
-def parse_query_params(raw_path):
+def scan_framing_headers(header_lines):
     """
-    Parses a string to extract the path and any URL params.
+    Picks the headers in FRAMING_HEADERS out of the header section
+    without decoding any of the others.
 
-    :param raw_path: string representation of an HTTP path ie. /path?key=val.
-    :return: path string and a dict of URL params in the form of {key: [val]}.
+    :param header_lines: a bytes object of CRLF separated headers, starting
+        with the CRLF that ends the request line.
+    :return: Dict of lowercase header: value pairs.
     """
-    url_obj = parse.urlparse(raw_path)
-    path = url_obj.path
-    query_params = parse.parse_qs(url_obj.query)
-    return path, query_params
+    return {
+        name.lower().decode('utf-8'): value.strip().decode('utf-8')
+        for name, value in FRAMING_HEADERS_REGEXP.findall(header_lines)}
 
 
-def parse_headers(buffer):
+def parse_headers(header_lines):
     """
-    Parses the buffer and creates a dict of header: value. Collapses
-    duplicate headers into one.
+    Creates a dict of header: value from the header section of a request.
+    Collapses duplicate headers into one.
 
-    :param buffer: a bytes like object.
+    :param header_lines: a bytes like object of CRLF separated headers.
     :return: Dict of headers.
     """
-    headers_end = buffer.index(SEPARATOR)
-    headers_iter = (line for line in buffer[:headers_end].split(CRLF) if line)
     headers = {}
-    for line in headers_iter:
-        header, value = [i.strip() for i in line.strip().split(b':')[:2]]
-        header = header.decode('utf-8').lower()
-        headers[header] = value.decode('utf-8')
+    for line in bytes(header_lines).split(CRLF):
+        if not line:
+            continue
+        header, sep, value = line.partition(b':')
+        if not sep:
+            raise BadRequestException('Malformed header line')
+        header = header.strip().decode('utf-8').lower()
+        headers[header] = value.strip().decode('utf-8')
     return headers
 
 
-def can_parse_body(headers, buffer):
-    """
-    Checks whether a request's headers signal a body to parse.
-
-    :param headers: A dict of header: value pairs.
-    :param buffer: a bytes object.
-    :return: Boolean.
-    """
-    content_length = int(headers.get('content-length', '0'))
-    return 'content-length' in headers and len(buffer) == content_length
-
-
-def parse_body(headers, buffer):
+def parse_body(headers, body_raw):
     """
     Parses a requests body according to the Content-Type header.
     Uses application/x-www-form-urlencoded by default.
 
     :param headers: a dict of header: value pairs.
-    :param buffer: a bytes objects.
-    :return: A tuple of the raw_body bytes and a parsed, utf-8-encoded,
-        dict representing the body.
+    :param body_raw: a bytes objects.
+    :return: A tuple of the raw_body bytes and the parsed body: a dict of
+        utf-8 {key: [val]} for forms, a 'multipart.FormData' for
+        multipart forms, the decoded document for JSON and None for
+        content types without a parser.
     """
-    body_raw = buffer[:]
     content_type = headers.get(
         'content-type', 'application/x-www-form-urlencoded')
     parser = get_body_parser(content_type)
-    body = parser(body_raw)
-    utf_8_body = byte_kv_to_utf8(body)
-    return body_raw, utf_8_body
+    if parser is None:
+        return body_raw, None
+    return body_raw, parser(body_raw)
 
 
 def get_body_parser(content_type):
     """
     Selects the correct parses to use for parsing a request's body.
+    Parameters of the content type, ie. '; charset=utf-8', are ignored.
 
     :param content_type: a string representing the request's content type.
-    :return: function that expects a string input and outputs parsed text.
+    :return: function that expects a bytes input and outputs the parsed
+        body, or None if the content type isn't supported.
     """
-    if content_type == 'application/x-www-form-urlencoded':
-        return parse.parse_qs
-    elif content_type == 'application/json':
-        return json.dumps
+    media_type = content_type.partition(';')[0].strip().lower()
+    if media_type == 'application/x-www-form-urlencoded':
+        return parse_form
+    elif media_type == 'application/json' or media_type.endswith('+json'):
+        return parse_json
+    elif media_type == 'multipart/form-data':
+        return functools.partial(multipart.parse, content_type)
 
 
-def byte_kv_to_utf8(kv):
+def parse_form(body_raw):
     """
-    :param kv: a dict of byte keys:values.
-    :return: a dict of utf-8 keys:values.
+    :param body_raw: a bytes object, an urlencoded form.
+    :return: a dict of utf-8 {key: [val]}.
     """
-    return {
-        k.decode('utf-8'): [val.decode('utf-8') for val in v]
-        for k, v in kv.items()}
+    return byte_kv_to_utf8(parse.parse_qs(body_raw))
 
 
-def remove_request_line(buffer):
+def parse_json(body_raw):
     """
-    Deletes the request line from the buffer.
-
-    :param buffer: a bytes object.
+    :param body_raw: a bytes object, a JSON document.
+    :return: the decoded document, with the backend of 'json_utils'.
     """
-    first_line_end = buffer.index(CRLF)
-    del buffer[:first_line_end]
-
+    try:
+        return json_utils.loads(body_raw)
+    except ValueError:
+        raise BadRequestException('Invalid JSON body')
 
-def remove_intro(buffer):
-    """
-    Deletes everything up to the CRLFCRLF sequence - the request
-    line as well as the headers.
 
-    :param buffer: a bytes object.
-    """
-    request_boundry = buffer.index(SEPARATOR)
-    del buffer[:request_boundry + len(SEPARATOR)]
-
-
-def clear_buffer(buffer):
+def byte_kv_to_utf8(kv):
     """
-    Clears the buffer.
-
-    :param buffer: a bytes object.
+    :param kv: a dict of byte keys:values.
+    :return: a dict of utf-8 keys:values.
     """
-
-    del buffer[:]
+    return {
+        k.decode('utf-8'): [val.decode('utf-8') for val in v]
+        for k, v in kv.items()}
@@ -0,0 +1,185 @@
+"""
+Alternative server core built on 'asyncio.Protocol'. Bytes delivered to
+'data_received' go straight into the parser and responses go straight
+to the transport, so there is no StreamReader buffer to copy through and
+the connection's task only wakes up once a request is ready, instead of
+once for every chunk read from the socket.
+"""
+
+import asyncio
+
+from .http_server import HTTPConnection
+from .exceptions import BadRequestException
+
+
+MAX_BUFFER_SIZE = 262144
+
+
+class HTTPProtocol(HTTPConnection, asyncio.Protocol):
+    """
+    HTTPConnection driven by the transport's callbacks. Reading is paused
+    while a request waits for its handler and more than MAX_BUFFER_SIZE
+    bytes are buffered, ie. an unread streaming body or a flood of
+    pipelined requests, or once the parser rejected the request, and
+    writing honours the transport's pause_writing/resume_writing flow
+    control.
+
+    :param http_server: An instance of HTTPServer.
+    """
+    def __init__(self, http_server):
+        super().__init__(http_server, None, None)
+
+    def open(self, reader=None, writer=None):
+        super().open(reader, writer)
+        self._transport = None
+        self._task = None
+        self._task_finished = False
+        self._waiter = None
+        self._error = None
+        self._eof = False
+        self._reading_paused = False
+        self._writing_paused = False
+        self._drain_waiter = None
+        self._connection_lost = False
+
+    def release(self):
+        self._transport = None
+        self._task = None
+        return super().release()
+
+    def connection_made(self, transport):
+        self._transport = transport
+        admission = self.admission
+        if admission is not None and not admission.connection_opened():
+            self._closed = True
+            transport.writelines(admission.rejection())
+            transport.close()
+            return
+        self._task = self.loop.create_task(self.handle_request())
+
+    def data_received(self, data):
+        if self._closed or self._error is not None:
+            return
+        self._extend_buffer(data)
+        if not self._ready():
+            try:
+                self._parse()
+            except Exception as e:
+                self._error = e
+                self._pause_reading()
+        self._update_timeout()
+
+        if self._error is not None or self._ready():
+            if len(self._buffer) > MAX_BUFFER_SIZE:
+                self._pause_reading()
+            self._wake()
+
+    def eof_received(self):
+        self._eof = True
+        self._wake()
+        return True
+
+    def connection_lost(self, exc):
+        self._eof = True
+        self._connection_lost = True
+        self.timer_wheel.cancel(self)
+        self._wake()
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_exception(
+                ConnectionResetError('Connection lost'))
+        if self._task is None or self._task_finished:
+            self.http_server.recycle(self)
+
+    def _finished(self):
+        """
+        The transport may still call back until 'connection_lost', so the
+        protocol is only recycled once both are done.
+        """
+        self._task_finished = True
+        if self._connection_lost:
+            self.http_server.recycle(self)
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+
+    async def _read_request(self):
+        """
+        Waits until 'data_received' has parsed enough of the current
+        request to hand it to its handler.
+        """
+        while not self._ready() and not self._closed:
+            if self._error is not None:
+                raise self._error
+            if self._eof:
+                if self._buffer or self.request.method:
+                    raise BadRequestException()
+                return
+            await self._wait_for_data()
+
+    async def read_body(self, size):
+        """
+        Returns the next piece of the current request's body, waiting for
+        'data_received' when the buffer holds no body bytes.
+
+        :param size: maximum number of bytes to return.
+        :return: a bytes object, empty once the whole body has been read.
+        """
+        while not self.request.finished:
+            data = self._parser.read_body(self.request, self._buffer, size)
+            if data or self.request.finished:
+                return data
+            if self._eof:
+                raise BadRequestException()
+            await self._wait_for_data()
+        return b''
+
+    async def _wait_for_data(self):
+        self._resume_reading()
+        self._waiter = self.loop.create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _pause_reading(self):
+        if not self._reading_paused and not self._transport.is_closing():
+            self._reading_paused = True
+            self._transport.pause_reading()
+
+    def _resume_reading(self):
+        if self._reading_paused and not self._transport.is_closing():
+            self._reading_paused = False
+            self._transport.resume_reading()
+
+    def _write(self, data):
+        self._transport.write(data)
+
+    def _writelines(self, data):
+        self._transport.writelines(data)
+
+    async def _drain(self):
+        if self._connection_lost:
+            raise ConnectionResetError('Connection lost')
+        if self._writing_paused:
+            self._drain_waiter = self.loop.create_future()
+            try:
+                await self._drain_waiter
+            finally:
+                self._drain_waiter = None
+
+    def _get_transport(self):
+        return self._transport
+
+    def _close_transport(self):
+        self._eof = True
+        self._transport.close()
+        self._wake()
@@ -1,15 +1,43 @@
 import logging
 import asyncio
+import os
+import time
 
-from .http_utils import Request, Response
+from .http_utils import (
+    FileResponse,
+    Request,
+    Response,
+    StreamingResponse,
+    frozen_response,
+    to_response,
+)
+from .http_parser import (
+    MAX_BODY_SIZE,
+    MAX_HEADER_SIZE,
+    MAX_HEADERS,
+    MAX_REQUEST_LINE,
+)
+from .pooling import FreeList
+from .timeouts import TimerWheel
 from .exceptions import (
     BadRequestException,
     NotFoundException,
+    ServiceUnavailableException,
     TimeoutException,
 )
 
 
-TIMEOUT = 5
+HEADER_TIMEOUT = 5
+BODY_TIMEOUT = 5
+READ_SIZE = 1024
+STREAM_READ_SIZE = 65536
+SENDFILE_CHUNK_SIZE = 262144
+KEEP_ALIVE_TIMEOUT = 15
+MAX_KEEP_ALIVE_REQUESTS = 100
+DRAIN_TIMEOUT = 30
+HEADER_PHASE = 'headers'
+BODY_PHASE = 'body'
+KEEP_ALIVE_PHASE = 'keep-alive'
 
 
 class HTTPServer(object):
@@ -17,38 +45,244 @@ class HTTPServer(object):
     Contains objects that are shared by HTTPConnections and schedules async
     connections.
 
-    :param router: An object that must expose the 'get_handler' interface.
-    :param http_parser: An object that must expose the 'parse_into' interface,
-        which works with a Request object and a bytearray.
+    :param router: An object that must expose the 'resolve' interface.
+    :param http_parser: An object that must expose the 'RequestParser'
+        interface, a callable returning a per connection parser with a
+        'parse_into' method, which works with a Request object and a
+        bytearray.
     :param loop: An object that implements the 'asyncio.BaseEventLoop'
         interface.
+    :param keep_alive_timeout: Number of seconds an idle persistent
+        connection is kept open while waiting for the next request.
+    :param max_keep_alive_requests: Number of requests served on a single
+        connection before it is closed.
+    :param header_timeout: Number of seconds a client has to send the
+        request line and headers of a request.
+    :param body_timeout: Number of seconds a client may stay silent while
+        sending the body of a request.
+    :param metrics: None, or an object that exposes the 'metrics.Metrics'
+        interface, which is told about every connection, request and
+        error.
+    :param cache: None, or an object that exposes the
+        'cache.ResponseCache' interface, which answers requests for routes
+        with a 'cache_ttl' in place of their handlers.
+    :param compressor: None, or an object that exposes the
+        'compression.Compressor' interface, which compresses responses
+        for clients that accept it.
+    :param admission: None, or an object that exposes the
+        'admission.AdmissionController' interface, which limits the
+        number of connections and requests handled at once.
+    :param max_request_line: the longest request line in bytes, longer
+        ones get '414 URI Too Long'.
+    :param max_header_size: the most bytes of headers a request may have,
+        and 'max_headers' the most header lines, or it gets
+        '431 Request Header Fields Too Large'.
+    :param max_body_size: the largest body buffered for a handler, larger
+        ones get '413 Payload Too Large'. Streaming routes read their body
+        in bounded pieces and aren't limited.
+
+    :param pool_size: the number of closed connections, receive buffers
+        and finished Requests kept for reuse, 0 disables pooling. With
+        pooling on, handlers must not hold on to the Request or its body
+        stream after they have replied.
+
+    The limits are passed to every connection's parser, which checks them
+    as bytes arrive, so no request is buffered past them. The open
+    connections are kept in 'connections' so 'shutdown' can drain them.
     """
 
-    def __init__(self, router, http_parser, loop):
+    def __init__(self, router, http_parser, loop,
+                 keep_alive_timeout=KEEP_ALIVE_TIMEOUT,
+                 max_keep_alive_requests=MAX_KEEP_ALIVE_REQUESTS,
+                 header_timeout=HEADER_TIMEOUT,
+                 body_timeout=BODY_TIMEOUT,
+                 metrics=None,
+                 cache=None,
+                 compressor=None,
+                 admission=None,
+                 max_request_line=MAX_REQUEST_LINE,
+                 max_header_size=MAX_HEADER_SIZE,
+                 max_headers=MAX_HEADERS,
+                 max_body_size=MAX_BODY_SIZE,
+                 pool_size=0):
         self.router = router
         self.http_parser = http_parser
         self.loop = loop
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.metrics = metrics
+        self.cache = cache
+        self.compressor = compressor
+        self.admission = admission
+        self.parser_limits = {
+            'max_request_line': max_request_line,
+            'max_header_size': max_header_size,
+            'max_headers': max_headers,
+            'max_body_size': max_body_size,
+        }
+        self.timer_wheel = TimerWheel(loop)
+        self.connections = set()
+        self.closing = False
+        self._drained = None
+        self.pool_size = pool_size
+        if pool_size:
+            self.connection_pools = {}
+            self.buffer_pool = FreeList(pool_size)
+            self.request_pool = FreeList(pool_size)
+        else:
+            self.connection_pools = self.buffer_pool = None
+            self.request_pool = None
 
     async def handle_connection(self, reader, writer):
         """
         Creates and schedules a HTTPConnection given a set (reader, writer)
-        objects.
+        objects. Connections the admission controller turns away get a 503
+        and are closed right away.
 
         :param reader: An object that implements the 'asyncio.StreamReader'
             interface.
         :param writer: An object that implements the 'asyncio.StreamWriter'
             interface.
         """
-        connection = HTTPConnection(self, reader, writer)
+        admission = self.admission
+        if admission is not None and not admission.connection_opened():
+            writer.writelines(admission.rejection())
+            writer.close()
+            return
+        connection = self.new_connection(HTTPConnection, reader, writer)
         asyncio.ensure_future(connection.handle_request(), loop=self.loop)
 
+    def new_connection(self, connection_class, *args):
+        """
+        :param connection_class: HTTPConnection or a subclass.
+        :param args: the arguments of the class after the HTTPServer.
+        :return: a connection of that class, a reused one if pooling is
+            on and one is free.
+        """
+        if self.connection_pools is not None:
+            pool = self.connection_pools.get(connection_class)
+            connection = pool.pop() if pool is not None else None
+            if connection is not None:
+                connection.open(*args)
+                return connection
+        return connection_class(self, *args)
+
+    def recycle(self, connection):
+        """
+        Takes back a connection whose task has finished and whose
+        transport is closed, along with its buffer and Request.
+
+        :param connection: an HTTPConnection.
+        """
+        if self.connection_pools is None:
+            self.release_request(connection.request)
+            return
+        self.release_buffer(connection.release())
+        pool = self.connection_pools.get(type(connection))
+        if pool is None:
+            pool = self.connection_pools[type(connection)] = FreeList(
+                self.pool_size)
+        pool.push(connection)
+
+    def new_buffer(self):
+        buffer = None
+        if self.buffer_pool is not None:
+            buffer = self.buffer_pool.pop()
+        return bytearray() if buffer is None else buffer
+
+    def release_buffer(self, buffer):
+        if self.buffer_pool is not None:
+            buffer.clear()
+            self.buffer_pool.push(buffer)
+
+    def new_request(self):
+        request = None
+        if self.request_pool is not None:
+            request = self.request_pool.pop()
+        return Request() if request is None else request
+
+    def release_request(self, request):
+        """
+        Closes a finished Request and takes it back if pooling is on.
+
+        :param request: a Request.
+        """
+        request.close()
+        if self.request_pool is not None:
+            request.reset()
+            self.request_pool.push(request)
+
+    def pool_stats(self):
+        """
+        :return: a dict of 'pooling.FreeList.stats' of every pool, empty
+            if pooling is off.
+        """
+        if self.connection_pools is None:
+            return {}
+        stats = {'buffers': self.buffer_pool.stats(),
+                 'requests': self.request_pool.stats()}
+        for connection_class, pool in self.connection_pools.items():
+            stats[connection_class.__name__] = pool.stats()
+        return stats
+
+    def connection_opened(self, connection):
+        self.connections.add(connection)
+
+    def connection_closed(self, connection):
+        self.connections.discard(connection)
+        if (not self.connections and self._drained is not None and
+                not self._drained.done()):
+            self._drained.set_result(None)
+
+    async def shutdown(self, timeout=DRAIN_TIMEOUT):
+        """
+        Drains the open connections once the listener has stopped
+        accepting new ones. Idle connections are closed right away, the
+        others finish the request they are handling, reply with
+        'Connection: close' and close. Whatever is still open after
+        'timeout' seconds is closed.
+
+        :param timeout: seconds to wait for requests in flight.
+        :return: Boolean - whether every connection finished in time.
+        """
+        self.closing = True
+        for connection in list(self.connections):
+            if connection.idle:
+                connection.close_connection()
+        if not self.connections:
+            return True
+
+        self._drained = self.loop.create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._drained), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logging.warning('Closing {0} connections that did not finish '
+                            'in time'.format(len(self.connections)))
+            for connection in list(self.connections):
+                connection.close_connection()
+            return False
+
 
 class HTTPConnection(object):
     """
     Takes care of whole life cycle of a single TCP connection with a
     HTTP client. First reads incoming data, parses it with
     'http_server.parser', generates as Response with 'http_server.router'
-    and sends data back to client.
+    and sends data back to client. Connections are persistent unless the
+    client asks otherwise, so this repeats for every request sent over
+    the connection, including pipelined ones.
+    Requests for streaming routes are handed to their handler as soon as
+    their headers are parsed, the handler then reads the body through
+    'Request.read'.
+    Read timeouts are tracked by the server's TimerWheel: the headers of
+    a request must arrive within 'header_timeout', the body must not stall
+    for longer than 'body_timeout' and an idle connection is closed after
+    'keep_alive_timeout'. Time spent in the handler is not limited.
+    Without 'http_server.metrics' nothing is measured, every measurement
+    is behind a single 'is not None' check.
 
     :param http_server: An instance of HTTPServer.
     :param reader: An object that implements the 'asyncio.StreamReader'
@@ -57,44 +291,115 @@ class HTTPConnection(object):
         interface.
     """
     def __init__(self, http_server, reader, writer):
+        self.http_server = http_server
         self.router = http_server.router
         self.http_parser = http_server.http_parser
         self.loop = http_server.loop
+        self.keep_alive_timeout = http_server.keep_alive_timeout
+        self.max_keep_alive_requests = http_server.max_keep_alive_requests
+        self.header_timeout = http_server.header_timeout
+        self.body_timeout = http_server.body_timeout
+        self.timer_wheel = http_server.timer_wheel
+        self.metrics = http_server.metrics
+        self.cache = http_server.cache
+        self.compressor = http_server.compressor
+        self.admission = http_server.admission
+        self._parser = self.http_parser.RequestParser(
+            **http_server.parser_limits)
+        self.open(reader, writer)
+
+    def open(self, reader, writer):
+        """
+        Sets up the state of a new connection, also when the object is
+        reused from the server's pool.
 
+        :param reader: An object that implements the
+            'asyncio.StreamReader' interface.
+        :param writer: An object that implements the
+            'asyncio.StreamWriter' interface.
+        """
         self._reader = reader
         self._writer = writer
-        self._buffer = bytearray()
-        self._conn_timeout = None
-        self.request = Request()
+        self._buffer = self.http_server.new_buffer()
+        self._parser.reset()
+        self._route = None
+        self._timeout_phase = None
+        self._keep_alive = True
+        self._response_started = False
+        self._closed = False
+        self._requests_served = 0
+        self._request_started = None
+        self._parse_time = 0.0
+        self.request = self.http_server.new_request()
 
+    def release(self):
+        """
+        Drops the connection's references to its streams and hands its
+        Request back to the server.
+
+        :return: the receive buffer, for the server to reuse.
+        """
+        self._reader = self._writer = None
+        self.http_server.release_request(self.request)
+        self.request = None
+        buffer, self._buffer = self._buffer, None
+        return buffer
 
     async def handle_request(self):
         """
         Reads bytes from a connection and attempts to parse them
-        incrementally until it can issue a Response and close the
-        connection.
+        incrementally until it can issue a Response. Keeps serving
+        requests until the client or the keep-alive policy asks to close
+        the connection.
         Also handles resetting the timeout counter for a connection.
         """
+        if self.metrics is not None:
+            self.metrics.connection_opened()
+        self.http_server.connection_opened(self)
         try:
-            while not self.request.finished and not self._reader.at_eof():
-                data = await self._reader.read(1024)
-                if data:
-                    self._reset_conn_timeout()
-                    await self.process_data(data)
-            if self.request.finished:
+            self._update_timeout()
+            while not self._closed:
+                await self._read_request()
+                if not self._ready():
+                    break
                 await self.reply()
-            elif self._reader.at_eof():
-                raise BadRequestException()
+                if not self._keep_alive or self.http_server.closing:
+                    break
+                self._next_request()
         except (NotFoundException,
-                BadRequestException) as e:
-            self.error_reply(e.code, body=Response.reason_phrases[e.code])
+                BadRequestException,
+                ServiceUnavailableException) as e:
+            self.error_reply(e.code, body=Response.reason_phrases[e.code],
+                             headers=getattr(e, 'headers', None))
         except Exception as e:
             logging.error(e)
             logging.error(e.__traceback__)
             self.error_reply(500, body=Response.reason_phrases[500])
 
         self.close_connection()
+        self._finished()
 
+    def _finished(self):
+        """
+        Called once 'handle_request' is done with the connection.
+        """
+        self.http_server.recycle(self)
+
+    async def _read_request(self):
+        """
+        Reads data until the current request can be handed to its handler.
+        A client closing the connection between requests is not an error,
+        closing it in the middle of one is.
+        """
+        while not self._ready() and not self._closed:
+            data = await self._receive(READ_SIZE)
+            if data:
+                await self.process_data(data)
+                self._update_timeout()
+            else:
+                if self._buffer or self.request.method:
+                    raise BadRequestException()
+                return
 
     async def process_data(self, data):
         """
@@ -103,56 +408,384 @@ class HTTPConnection(object):
 
         :param data: A bytearray object.
         """
+        self._extend_buffer(data)
+        self._parse()
+
+    def _extend_buffer(self, data):
+        """
+        Appends data received from the client to _buffer.
+
+        :param data: A bytes object.
+        """
         self._buffer.extend(data)
+        if self.metrics is not None:
+            self.metrics.bytes_received(len(data))
+            if self._request_started is None:
+                self._request_started = time.perf_counter()
+
+    def _parse(self):
+        """
+        Parses the headers of the current request and looks up its handler.
+        Bodies of requests for streaming routes are left to the handler,
+        everything else is buffered until the request is finished.
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            started = time.perf_counter()
+
+        if self._route is None:
+            parsed = self._parser.parse_head(self.request, self._buffer)
+            if metrics is not None:
+                now = time.perf_counter()
+                self._parse_time += now - started
+                started = now
+            if not parsed:
+                return
+            self._route = self.router.resolve(self.request)
+            if metrics is not None:
+                now = time.perf_counter()
+                metrics.observe_phase('route', now - started)
+                started = now
+
+        if not self._route.stream:
+            self._buffer = self._parser.parse_into(self.request, self._buffer)
+            if metrics is not None:
+                self._parse_time += time.perf_counter() - started
+
+    def _ready(self):
+        """
+        :return: Boolean - whether the current request can be handed to
+            its handler.
+        """
+        return self._route is not None and (
+            self.request.finished or self._route.stream)
+
+    async def read_body(self, size):
+        """
+        Returns the next piece of the current request's body, reading from
+        the connection only when the buffer holds no body bytes. Because
+        nothing is read unless the handler asks for it, a slow handler
+        fills the StreamReader's buffer which stops reading from the socket.
+
+        :param size: maximum number of bytes to return.
+        :return: a bytes object, empty once the whole body has been read.
+        """
+        while not self.request.finished:
+            data = self._parser.read_body(self.request, self._buffer, size)
+            if data or self.request.finished:
+                return data
+            data = await self._receive(max(size, STREAM_READ_SIZE))
+            if not data:
+                raise BadRequestException()
+            self._extend_buffer(data)
+            self._update_timeout()
+        return b''
+
+    def _next_request(self):
+        """
+        Prepares the connection for the next request and parses whatever
+        the client has already pipelined into the buffer.
+        """
+        self.http_server.release_request(self.request)
+        self.request = self.http_server.new_request()
+        self._route = None
+        self._response_started = False
+        self._parse_time = 0.0
+        self._request_started = None
+        if self._buffer:
+            if self.metrics is not None:
+                self._request_started = time.perf_counter()
+            self._parse()
+        self._update_timeout()
+
+    @property
+    def idle(self):
+        """
+        :return: Boolean - whether the connection is waiting for a request
+            and hasn't received any of it.
+        """
+        return (self._route is None and not self._buffer and
+                self.request.method is None)
 
-        self._buffer = self.http_parser.parse_into(
-            self.request, self._buffer)
+    def _should_keep_alive(self):
+        """
+        :return: Boolean - whether the connection can be reused after
+            replying to the current request.
+        """
+        if self.http_server.closing:
+            return False
+        if self._requests_served >= self.max_keep_alive_requests:
+            return False
+        if not self.request.finished:
+            return False
+        connection = self.request.header('connection', '')
+        tokens = [t.strip().lower() for t in connection.split(',')]
+        return 'close' not in tokens
 
     def close_connection(self):
         """
         Cancels the timeout timer and closes the connection.
         """
+        if self._closed:
+            return
         logging.debug('Closing connection')
-        self._cancel_conn_timeout()
-        self._writer.close()
+        self._closed = True
+        self.timer_wheel.cancel(self)
+        if self.metrics is not None:
+            self.metrics.connection_closed()
+        if self.admission is not None:
+            self.admission.connection_closed()
+        self.http_server.connection_closed(self)
+        self._close_transport()
 
-    def error_reply(self, code, body=''):
+    def error_reply(self, code, body='', headers=None):
         """
-        Generates a simple error response.
+        Generates a simple error response. Errors always close the
+        connection, so the client is told not to reuse it. Nothing is sent
+        if part of a response was already written.
 
         :param code: Integer signifying the HTTP error.
         :param body: A string that contains an error message.
+        :param headers: None or a dict of extra headers.
         """
-        response = Response(code=code, body=body)
-        self._writer.write(response.to_bytes())
-        self._writer.drain()
+        if self.metrics is not None:
+            self.metrics.error(code)
+        if self._closed or self._response_started:
+            return
+        buffers = frozen_response(code, body, headers).to_buffers(
+            keep_alive=False)
+        if self.metrics is not None:
+            self.metrics.bytes_sent(sum(map(len, buffers)))
+        self._writelines(buffers)
 
     async def reply(self):
         """
-        Obtains and applies the correct handler from 'self.router'
-        and write the Response back to the client.
+        Runs the chain of the route obtained from 'self.router' and writes
+        the Response back to the client. A streaming handler that leaves part
+        of the body unread gets the connection closed after the reply.
         """
         logging.debug('Replying to request')
         request = self.request
-        handler = self.router.get_handler(request.path)
+        route = self._route
+        metrics = self.metrics
+        if route.stream:
+            request.body_stream = RequestBodyStream(self)
+
+        if metrics is not None:
+            started = time.perf_counter()
+            metrics.observe_phase('read', started - self._request_started)
+            metrics.observe_phase('parse', self._parse_time)
+
+        admission = self.admission
+        if admission is not None:
+            await admission.acquire()
+        try:
+            response = await route.chain(self.cache)(request)
+        finally:
+            if admission is not None:
+                admission.release()
+
+        response = to_response(response)
+
+        self._requests_served += 1
+        self._keep_alive = self._should_keep_alive()
+
+        if metrics is not None:
+            now = time.perf_counter()
+            metrics.observe_phase('handler', now - started)
+            started = now
+
+        if self.compressor is not None:
+            response = await self.compressor.compress(
+                request, response, self.loop)
+
+        if isinstance(response, StreamingResponse):
+            await self._send_streaming(response)
+        elif isinstance(response, FileResponse):
+            await self._send_file(response)
+        else:
+            buffers = response.to_buffers(self._keep_alive)
+            if metrics is not None:
+                now = time.perf_counter()
+                metrics.observe_phase('serialize', now - started)
+                metrics.bytes_sent(sum(map(len, buffers)))
+                started = now
+            self._writelines(buffers)
+            await self._drain()
+            if metrics is not None:
+                metrics.observe_phase('drain', time.perf_counter() - started)
+
+        if metrics is not None:
+            metrics.observe_route(
+                route.path,
+                time.perf_counter() - self._request_started)
+
+    async def _send_streaming(self, response):
+        """
+        Sends a StreamingResponse one chunk at a time. Waits for the
+        writer's buffer to drain after every chunk, so a slow client
+        slows down the producer instead of piling data up in memory.
+
+        :param response: a StreamingResponse.
+        """
+        self._response_started = True
+        metrics = self.metrics
+        head = response.head_bytes(self._keep_alive)
+        if metrics is not None:
+            metrics.bytes_sent(len(head) + len(response.last_chunk))
+        self._write(head)
+        async for chunk in response.body:
+            if chunk:
+                buffers = response.encode_chunk(chunk)
+                if metrics is not None:
+                    metrics.bytes_sent(sum(map(len, buffers)))
+                self._writelines(buffers)
+                await self._drain()
+        self._write(response.last_chunk)
+        await self._drain()
+
+    async def _send_file(self, response):
+        """
+        Sends a FileResponse, its body goes from the file to the socket
+        with sendfile. The response is closed afterwards, even if sending
+        failed.
+
+        :param response: a FileResponse.
+        """
+        self._response_started = True
+        try:
+            head = response.head_bytes(self._keep_alive)
+            if self.metrics is not None:
+                self.metrics.bytes_sent(len(head) + response.count)
+            self._write(head)
+            if response.count:
+                await self._sendfile(
+                    response.file, response.offset, response.count)
+            await self._drain()
+        finally:
+            response.close()
+
+    async def _sendfile(self, file, offset, count):
+        """
+        Writes part of a file with 'loop.sendfile'. Where the loop or the
+        transport can't sendfile, ie. on uvloop or with TLS, the file is
+        read in chunks in the loop's executor and written as usual.
+
+        :param file: a regular file opened in binary mode.
+        :param offset: position of the first byte to send.
+        :param count: number of bytes to send.
+        """
+        try:
+            await self.loop.sendfile(
+                self._get_transport(), file, offset, count, fallback=False)
+            return
+        except (NotImplementedError, asyncio.SendfileNotAvailableError):
+            logging.debug('sendfile not available, copying the file')
+
+        fd = file.fileno()
+        end = offset + count
+        while offset < end:
+            chunk = await self.loop.run_in_executor(
+                None, os.pread, fd, min(SENDFILE_CHUNK_SIZE, end - offset),
+                offset)
+            if not chunk:
+                raise OSError('File shrank while it was being sent')
+            self._write(chunk)
+            offset += len(chunk)
+            await self._drain()
 
-        response = await handler.handle(request)
+    async def _receive(self, size):
+        """
+        :param size: maximum number of bytes to read.
+        :return: a bytes object, empty once the client closed the
+            connection.
+        """
+        return await self._reader.read(size)
 
-        if not isinstance(response, Response):
-            response = Response(code=200, body=response)
+    def _write(self, data):
+        self._writer.write(data)
 
-        self._writer.write(response.to_bytes())
+    def _writelines(self, data):
+        self._writer.writelines(data)
+
+    async def _drain(self):
         await self._writer.drain()
 
-    def _conn_timeout_close(self):
-        self.error_reply(500, 'timeout')
+    def _get_transport(self):
+        return self._writer.transport
+
+    def _close_transport(self):
+        self._writer.close()
+        self._reader.feed_eof()
+
+    def _update_timeout(self):
+        """
+        Picks the read timeout for the phase the current request is in.
+        The header deadline is set once per request, the body deadline is
+        pushed back whenever body bytes arrive and a finished request has
+        none while its handler runs.
+        """
+        if self._closed:
+            return
+        if self.request.finished:
+            phase, timeout = None, None
+        elif self._route is not None:
+            phase, timeout = BODY_PHASE, self.body_timeout
+        elif (self._buffer or self.request.method or
+              not self._requests_served):
+            phase, timeout = HEADER_PHASE, self.header_timeout
+        else:
+            phase, timeout = KEEP_ALIVE_PHASE, self.keep_alive_timeout
+
+        if phase == self._timeout_phase and phase != BODY_PHASE:
+            return
+        self._timeout_phase = phase
+        if phase is None:
+            self.timer_wheel.cancel(self)
+        else:
+            self.timer_wheel.schedule(self, timeout)
+
+    def on_timeout(self):
+        """
+        Called by the TimerWheel. Answers with an error if the client
+        stalled in the middle of a request and closes the connection.
+        """
+        if self._timeout_phase != KEEP_ALIVE_PHASE:
+            self.error_reply(500, 'timeout')
         self.close_connection()
 
-    def _reset_conn_timeout(self, timeout=TIMEOUT):
-        self._cancel_conn_timeout()
-        self._conn_timeout = self.loop.call_later(
-            timeout, self._conn_timeout_close)
 
-    def _cancel_conn_timeout(self):
-        if self._conn_timeout:
-            self._conn_timeout.cancel()
+class RequestBodyStream(object):
+    """
+    Body of a request for a streaming route. Supports 'await read(n)' and
+    'async for'.
+
+    :param connection: the HTTPConnection the request arrived on.
+    """
+    def __init__(self, connection):
+        self._connection = connection
+
+    async def read(self, size=-1):
+        """
+        :param size: maximum number of bytes to return, -1 reads the rest
+            of the body.
+        :return: a bytes object, empty once the whole body has been read.
+        """
+        if size >= 0:
+            return await self._connection.read_body(size)
+
+        chunks = []
+        chunk = await self._connection.read_body(STREAM_READ_SIZE)
+        while chunk:
+            chunks.append(chunk)
+            chunk = await self._connection.read_body(STREAM_READ_SIZE)
+        return b''.join(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self._connection.read_body(STREAM_READ_SIZE)
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
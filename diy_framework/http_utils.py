@@ -1,3 +1,43 @@
+import copy
+from urllib import parse
+
+from . import json_utils
+from .exceptions import FrozenResponse
+from .http_parser import FRAMING_HEADERS, parse_body, parse_headers
+
+
+CRLF = b'\r\n'
+MAX_CACHED_HEADER_LINES = 1024
+# headers whose few values repeat across responses, one-off values like
+# ETag or Last-Modified would only fill the cache
+CACHED_HEADERS = frozenset(name for header in (
+    'content-type',
+    'content-encoding',
+    'transfer-encoding',
+    'cache-control',
+    'accept-ranges',
+    'vary',
+    'allow',
+) for name in (header, header.title()))
+KEEP_ALIVE_MODES = (None, True, False)
+_status_lines = {}
+_header_lines = {}
+_connection_lines = {
+    True: b'Connection: keep-alive\r\n',
+    False: b'Connection: close\r\n',
+}
+_frozen_responses = {}
+# headers a 304 repeats from the 200 it stands for, RFC 7232 section 4.1
+NOT_MODIFIED_HEADERS = frozenset((
+    'etag',
+    'vary',
+    'cache-control',
+    'content-location',
+    'expires',
+    'last-modified',
+))
+
+
 def utf8_bytes(text):
     """
     Ensures  that text becomes utf-8 bytes.
@@ -12,17 +52,147 @@ def utf8_bytes(text):
 
 class Request(object):
     """
-    Container for data related to an HTTP request.
+    Container for data related to an HTTP request. Requests for streaming
+    routes have no body or body_raw, their handlers read the body with
+    'await request.read(n)' or 'async for chunk in request' instead.
+
+    The parser only stores the raw header bytes and query string, the
+    'headers', 'query_params' and 'body' attributes are decoded the first
+    time they are read, so a handler pays only for what it uses. The
+    headers that frame the request, ie. Content-Length, are picked out by
+    the parser into 'framing_headers' and can be read with 'header'
+    without decoding the rest.
     """
+    __slots__ = (
+        'method',
+        'path',
+        'path_params',
+        'body_raw',
+        'body_stream',
+        'finished',
+        'raw_query',
+        'raw_headers',
+        'framing_headers',
+        '_query_params',
+        '_headers',
+        '_body',
+        '_cleanups',
+    )
+
     def __init__(self):
+        self.path_params = {}
+        self.framing_headers = {}
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the Request so it can hold another one, without allocating
+        new dicts for the ones that are empty.
+        """
         self.method = None
         self.path = None
-        self.query_params = {}
-        self.path_params = {}
-        self.headers = {}
-        self.body = None
+        if self.path_params:
+            self.path_params = {}
+        if self.framing_headers:
+            self.framing_headers = {}
         self.body_raw = None
+        self.body_stream = None
         self.finished = False
+        self.raw_query = ''
+        self.raw_headers = None
+        self._query_params = None
+        self._headers = None
+        self._body = None
+        self._cleanups = None
+
+    @property
+    def query_params(self):
+        """
+        :return: a dict of query parameters in the form of {key: [val]}.
+        """
+        if self._query_params is None:
+            self._query_params = (
+                parse.parse_qs(self.raw_query) if self.raw_query else {})
+        return self._query_params
+
+    @query_params.setter
+    def query_params(self, value):
+        self._query_params = value
+
+    @property
+    def headers(self):
+        """
+        :return: a dict of lowercase header names and their values.
+        """
+        if self._headers is None:
+            self._headers = (
+                parse_headers(self.raw_headers) if self.raw_headers else {})
+        return self._headers
+
+    @headers.setter
+    def headers(self, value):
+        self._headers = value
+
+    @property
+    def body(self):
+        """
+        :return: the body parsed according to its Content-Type, or None
+            if the request has no buffered body.
+        """
+        if self._body is None and self.body_raw is not None:
+            self._body = parse_body(self.headers, self.body_raw)[1]
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
+
+    def add_cleanup(self, function):
+        """
+        :param function: called without arguments by 'close', ie. to free
+            what a response holds even if the response is never sent.
+        """
+        if self._cleanups is None:
+            self._cleanups = []
+        self._cleanups.append(function)
+
+    def close(self):
+        """
+        Runs the functions given to 'add_cleanup' and closes the parsed
+        body if it holds files, ie. the temporary files of a multipart
+        FormData. Called by the server once the request is done, also
+        when handling it failed.
+        """
+        cleanups, self._cleanups = self._cleanups, None
+        if cleanups is not None:
+            for function in cleanups:
+                function()
+        body, self._body = self._body, None
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+
+    def header(self, name, default=None):
+        """
+        :param name: a lowercase header name.
+        :param default: returned if the request has no such header.
+        :return: the header's value. Framing headers are read without
+            decoding the other headers.
+        """
+        if self._headers is None and name in FRAMING_HEADERS:
+            return self.framing_headers.get(name, default)
+        return self.headers.get(name, default)
+
+    async def read(self, size=-1):
+        """
+        :param size: maximum number of bytes to return, -1 reads the rest
+            of the body.
+        :return: a bytes object, empty once the whole body has been read.
+        """
+        return await self.body_stream.read(size)
+
+    def __aiter__(self):
+        return self.body_stream.__aiter__()
 
 
 class Response(object):
@@ -32,7 +202,10 @@ class Response(object):
     """
     reason_phrases = {
         200: 'OK',
+        201: 'Created',
+        202: 'Accepted',
         204: 'No Content',
+        206: 'Partial Content',
         301: 'Moved Permanently',
         302: 'Found',
         304: 'Not Modified',
@@ -40,8 +213,14 @@ class Response(object):
         401: 'Unauthorized',
         403: 'Forbidden',
         404: 'Not Found',
+        405: 'Method Not Allowed',
+        413: 'Payload Too Large',
+        414: 'URI Too Long',
+        416: 'Range Not Satisfiable',
+        431: 'Request Header Fields Too Large',
         451: 'Unavailable for Legal Reasons',
         500: 'Internal Server Error',
+        503: 'Service Unavailable',
     }
 
     def __init__(self, code=200, body=b'', **kwargs):
@@ -49,23 +228,55 @@ class Response(object):
         self.body = body
         self.headers = kwargs.get('headers', {})
         self.headers['content-type'] = kwargs.get('content_type', 'text/html')
+        self._buffers = None
+
+    def _build_head(self, encoding_fn=utf8_bytes, keep_alive=None):
+        """
+        Translates the status line and headers into a series of bytes.
+        Status lines and header lines are encoded once and reused.
+
+        :param encoding_fn: The function responsible for encoding strings
+            into bytes using the *correct charset*.
+        :param keep_alive: True or False adds a matching Connection header,
+            None leaves the headers as they are.
+        :return: A bytes object ending with the CRLFCRLF sequence.
+        """
+        lines = [self.status_line(self.code)]
+        for header, value in self.headers.items():
+            lines.append(header_line(header, value, encoding_fn))
+        if keep_alive is not None and 'Connection' not in self.headers:
+            lines.append(_connection_lines[keep_alive])
+        lines.append(CRLF)
+        return b''.join(lines)
 
-    def _build_response(self, encoding_fn=utf8_bytes):
+    def _build_response(self, encoding_fn=utf8_bytes, keep_alive=None,
+                        body=None):
         """
-        Translates self into a series of bytes.
+        Translates self into a series of bytes. The body is kept apart
+        from the head so it can be written without being copied.
 
         :param encoding_fn: The function responsible for encoding strings
             into bytes using the *correct charset*.
-        :return: A bytes object representing the HTTP response.
+        :param keep_alive: True, False or None, see '_build_head'.
+        :param body: the already encoded body, None to encode it.
+        :return: A list of the head and the body bytes objects.
         """
-        response_line = 'HTTP/1.1 {0} {1}'.format(
-            self.code, self.reason_phrases[self.code])
-        self.headers = {**self.headers, **{'Content-Length': len(self.body)}}
-        headers = '\r\n'.join(
-            [': '.join([k, str(v)]) for k, v in self.headers.items()])
-        headers += '\r\n'
-        return b'\r\n'.join(map(
-            encoding_fn, [response_line, headers, self.body]))
+        if body is None:
+            body = encoding_fn(self.body)
+        self.headers['Content-Length'] = len(body)
+        return [self._build_head(encoding_fn, keep_alive), body]
+
+    @classmethod
+    def status_line(cls, code):
+        """
+        :param code: an HTTP status code.
+        :return: the encoded status line, CRLF included.
+        """
+        line = _status_lines.get(code)
+        if line is None:
+            line = _status_lines[code] = 'HTTP/1.1 {0} {1}\r\n'.format(
+                code, cls.reason_phrases[code]).encode('utf-8')
+        return line
 
     def set_header(self, header, value=b''):
         """
@@ -74,7 +285,245 @@ class Response(object):
         :param header: A string with the headername.
         :param value: A bytes object - value of the header.
         """
+        if self.frozen:
+            raise FrozenResponse()
         self.headers[header] = value
 
-    def to_bytes(self):
-        return self._build_response()
+    @property
+    def frozen(self):
+        return self._buffers is not None
+
+    def freeze(self):
+        """
+        Marks the response as immutable. Its bytes are computed right away
+        and reused every time it is sent, which suits fixed replies like
+        error pages. The body is encoded once, and the variants for every
+        keep-alive mode share it.
+
+        :return: self.
+        """
+        if not self.frozen:
+            body = utf8_bytes(self.body)
+            self._buffers = {
+                keep_alive: self._build_response(
+                    keep_alive=keep_alive, body=body)
+                for keep_alive in KEEP_ALIVE_MODES}
+        return self
+
+    def thaw(self):
+        """
+        :return: self if the response isn't frozen, otherwise a copy that
+            can be changed, ie. by middleware that adds headers to a
+            response served from a ResponseCache.
+        """
+        if not self.frozen:
+            return self
+        response = copy.copy(self)
+        response.headers = dict(self.headers)
+        response._buffers = None
+        return response
+
+    @property
+    def frozen_size(self):
+        """
+        :return: the bytes held by a frozen response, every buffer its
+            variants share counted once.
+        """
+        buffers = {id(buffer): len(buffer)
+                   for keep_alive in KEEP_ALIVE_MODES
+                   for buffer in self._buffers[keep_alive]}
+        return sum(buffers.values())
+
+    def to_buffers(self, keep_alive=None):
+        """
+        :param keep_alive: True or False adds a matching Connection header.
+        :return: A list of bytes objects that make up the response, to be
+            sent with 'writelines'.
+        """
+        if self.frozen:
+            return self._buffers[keep_alive]
+        return self._build_response(keep_alive=keep_alive)
+
+    def to_bytes(self, keep_alive=None):
+        return b''.join(self.to_buffers(keep_alive))
+
+
+class JSONResponse(Response):
+    """
+    Response with a JSON body. The data is serialized to bytes right away
+    with the backend selected in 'json_utils' and kept in 'data'.
+    """
+    def __init__(self, data, code=200, **kwargs):
+        """
+        :param data: an object the JSON backend can serialize.
+        :param code: the HTTP status code.
+        """
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(code=code, body=json_utils.dumps(data), **kwargs)
+        self.data = data
+
+
+def to_response(result):
+    """
+    :param result: what a handler returned, a Response, a dict or list to
+        send as JSON, or a string or bytes body.
+    :return: a Response.
+    """
+    if isinstance(result, Response):
+        return result
+    if isinstance(result, (dict, list)):
+        return JSONResponse(result)
+    return Response(code=200, body=result)
+
+
+def header_line(header, value, encoding_fn=utf8_bytes):
+    """
+    Encodes a single header line. Lines of the headers in CACHED_HEADERS
+    with string values are cached, since most responses share the same
+    few of them.
+
+    :param header: a string with the header name.
+    :param value: a string, bytes or int header value.
+    :param encoding_fn: The function responsible for encoding strings
+        into bytes.
+    :return: a bytes object, CRLF included.
+    """
+    cacheable = encoding_fn is utf8_bytes and header in CACHED_HEADERS
+    if cacheable:
+        line = _header_lines.get((header, value))
+        if line is not None:
+            return line
+
+    if isinstance(value, int):
+        return b'%s: %d\r\n' % (encoding_fn(header), value)
+    if isinstance(value, bytes):
+        return b'%s: %s\r\n' % (encoding_fn(header), value)
+
+    line = encoding_fn('{0}: {1}\r\n'.format(header, value))
+    if cacheable and len(_header_lines) < MAX_CACHED_HEADER_LINES:
+        _header_lines[(header, value)] = line
+    return line
+
+
+def frozen_response(code, body='', headers=None):
+    """
+    :param code: an HTTP status code.
+    :param body: a string or bytes object.
+    :param headers: None or a dict of extra headers.
+    :return: a frozen Response shared by all callers asking for the same
+        code, body and headers.
+    """
+    key = (code, body, tuple(sorted(headers.items())) if headers else ())
+    response = _frozen_responses.get(key)
+    if response is None:
+        response = _frozen_responses[key] = Response(
+            code=code, body=body, headers=dict(headers or {})).freeze()
+    return response
+
+
+class NotModifiedResponse(Response):
+    """
+    Answer to a conditional request whose 'If-None-Match' matched the
+    current ETag. It has no body, so unlike other responses it carries
+    neither Content-Type nor Content-Length.
+    """
+    def __init__(self, etag, response=None, **kwargs):
+        """
+        :param etag: a string, the quoted entity tag of the current body.
+        :param response: None, or the full Response this one stands for,
+            ie. for a Compressor to answer with the 304 of the variant
+            it would have sent.
+        """
+        super().__init__(code=304, **kwargs)
+        del self.headers['content-type']
+        self.headers['ETag'] = etag
+        self.response = response
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        :param response: a Response with an 'ETag' header.
+        :return: a NotModifiedResponse standing for 'response', with its
+            headers in NOT_MODIFIED_HEADERS.
+        """
+        headers = {header: value for header, value in
+                   response.headers.items()
+                   if header.lower() in NOT_MODIFIED_HEADERS}
+        etag = headers.pop('ETag')
+        return cls(etag, response=response, headers=headers)
+
+    def _build_response(self, encoding_fn=utf8_bytes, keep_alive=None,
+                        body=None):
+        return [self._build_head(encoding_fn, keep_alive)]
+
+
+class StreamingResponse(Response):
+    """
+    Response whose body is produced piece by piece by an async iterable,
+    ie. an async generator, and sent with chunked transfer-encoding, so
+    the body never has to be held in memory as a whole.
+    """
+    last_chunk = b'0\r\n\r\n'
+
+    def __init__(self, body, code=200, **kwargs):
+        """
+        :param body: an async iterable of strings or bytes objects.
+        :param code: the HTTP status code.
+        """
+        super().__init__(code=code, body=body, **kwargs)
+        self.headers['Transfer-Encoding'] = 'chunked'
+
+    def head_bytes(self, keep_alive=None):
+        """
+        :param keep_alive: True or False adds a matching Connection header.
+        :return: A bytes object with the status line and the headers.
+        """
+        return self._build_head(keep_alive=keep_alive)
+
+    @staticmethod
+    def encode_chunk(chunk):
+        """
+        :param chunk: a non-empty string or bytes object.
+        :return: a list of bytes objects that make up one encoded chunk.
+        """
+        chunk = utf8_bytes(chunk)
+        return [b'%x\r\n' % len(chunk), chunk, b'\r\n']
+
+
+class FileResponse(Response):
+    """
+    Response whose body is 'count' bytes of an open file starting at
+    'offset'. HTTPConnection sends the body with 'loop.sendfile', so it
+    goes from the page cache to the socket without being copied into
+    Python objects.
+    """
+    def __init__(self, file, offset=0, count=0, code=200, release=None,
+                 **kwargs):
+        """
+        :param file: a regular file opened in binary mode.
+        :param offset: position of the first byte to send.
+        :param count: number of bytes to send, also the Content-Length.
+        :param code: the HTTP status code.
+        :param release: None or a function called once the response has
+            been sent, ie. to give the file back to a cache. 'close'
+            calls it at most once, so it can also be given to
+            'Request.add_cleanup' in case the response is never sent.
+        """
+        super().__init__(code=code, **kwargs)
+        self.file = file
+        self.offset = offset
+        self.count = count
+        self._release = release
+        self.headers['Content-Length'] = count
+
+    def head_bytes(self, keep_alive=None):
+        """
+        :param keep_alive: True or False adds a matching Connection header.
+        :return: A bytes object with the status line and the headers.
+        """
+        return self._build_head(keep_alive=keep_alive)
+
+    def close(self):
+        if self._release is not None:
+            self._release()
+            self._release = None
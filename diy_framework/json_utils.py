@@ -0,0 +1,116 @@
+"""
+Pluggable JSON encoding and decoding used for request bodies and
+JSONResponse. The fastest installed backend is picked at import time,
+orjson, then ujson, then the stdlib's json, and 'use' switches to
+another one.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class StdlibBackend(object):
+    """
+    The stdlib's json module, always available.
+    """
+    name = 'json'
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonBackend(object):
+    """
+    orjson, which encodes straight to bytes.
+    """
+    name = 'orjson'
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj)
+
+
+class UjsonBackend(object):
+    """
+    ujson, a C implementation with the stdlib's interface.
+    """
+    name = 'ujson'
+
+    @staticmethod
+    def loads(data):
+        return ujson.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+BACKENDS = {
+    StdlibBackend.name: StdlibBackend,
+    OrjsonBackend.name: OrjsonBackend,
+    UjsonBackend.name: UjsonBackend,
+}
+backend = OrjsonBackend if orjson else UjsonBackend if ujson else StdlibBackend
+
+
+def available():
+    """
+    :return: a list of the names of installed backends.
+    """
+    modules = {'json': json, 'orjson': orjson, 'ujson': ujson}
+    return [name for name in BACKENDS if modules[name] is not None]
+
+
+def use(name_or_backend):
+    """
+    Switches the backend used by 'loads' and 'dumps'.
+
+    :param name_or_backend: a key of BACKENDS or an object with 'loads'
+        and 'dumps' static methods.
+    :return: the previous backend.
+    """
+    global backend
+    previous = backend
+    if isinstance(name_or_backend, str):
+        if name_or_backend not in available():
+            raise ValueError(
+                'JSON backend not available: {0}'.format(name_or_backend))
+        name_or_backend = BACKENDS[name_or_backend]
+    backend = name_or_backend
+    return previous
+
+
+def loads(data):
+    """
+    :param data: a bytes-like object with a JSON document.
+    :return: the decoded object.
+    :raises ValueError: if data isn't valid JSON.
+    """
+    return backend.loads(data)
+
+
+def dumps(obj):
+    """
+    :param obj: an object the backend can serialize.
+    :return: a bytes object with the utf-8 encoded JSON document.
+    """
+    return backend.dumps(obj)
@@ -0,0 +1,179 @@
+"""
+Request instrumentation for HTTPServer. An HTTPServer created with
+'metrics=None' skips every measurement, so instrumentation costs nothing
+unless it's enabled.
+
+Any object with the same methods as Metrics can be plugged in instead,
+ie. one forwarding measurements to StatsD.
+"""
+
+import bisect
+
+from .http_utils import Response
+
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+    2.5, 5, 10)
+PHASES = ('read', 'parse', 'route', 'handler', 'serialize', 'drain')
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+class Histogram(object):
+    """
+    Counts observations in cumulative buckets, like a Prometheus histogram.
+
+    :param buckets: a sorted tuple of upper bounds in seconds.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        """
+        :param name: the metric name.
+        :param labels: a string of label pairs without braces, may be empty.
+        :return: a list of lines in Prometheus text format.
+        """
+        prefix = labels + ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append('{0}_bucket{{{1}le="{2}"}} {3}'.format(
+                name, prefix, bound, cumulative))
+        suffix = '{{{0}}}'.format(labels) if labels else ''
+        lines.append('{0}_sum{1} {2}'.format(name, suffix, self.sum))
+        lines.append('{0}_count{1} {2}'.format(name, suffix, self.count))
+        return lines
+
+
+class Metrics(object):
+    """
+    Collects per phase timings, per route latency histograms, connection
+    counts, bytes received and sent and errors by HTTP status code, and
+    renders them in Prometheus text format. Its 'handler' can be mounted
+    on a Router, ie. router.add_route('/metrics', metrics.handler). With
+    several workers every process keeps and serves its own numbers.
+
+    The phases of a request are:
+    read - from its first byte until it can be handed to the handler,
+    parse - parsing its bytes,
+    route - looking up its handler,
+    handler - running the handler,
+    serialize - turning the Response into bytes,
+    drain - waiting for the response to be written out.
+
+    Other components can add their own numbers with 'add_collector'.
+
+    :param buckets: upper bounds of histogram buckets, in seconds.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.connections_opened = 0
+        self.connections_active = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = {}
+        self.phases = {phase: Histogram(buckets) for phase in PHASES}
+        self.routes = {}
+        self.collectors = []
+
+    def add_collector(self, collector):
+        """
+        :param collector: an object with a 'render' method that returns a
+            list of lines in Prometheus text format, ie. an
+            'admission.AdmissionController'.
+        """
+        self.collectors.append(collector)
+
+    def connection_opened(self):
+        self.connections_opened += 1
+        self.connections_active += 1
+
+    def connection_closed(self):
+        self.connections_active -= 1
+
+    def bytes_received(self, count):
+        self.bytes_in += count
+
+    def bytes_sent(self, count):
+        self.bytes_out += count
+
+    def error(self, code):
+        """
+        :param code: the HTTP status code of an error reply.
+        """
+        self.errors[code] = self.errors.get(code, 0) + 1
+
+    def observe_phase(self, phase, seconds):
+        """
+        :param phase: one of PHASES.
+        :param seconds: time spent in the phase.
+        """
+        self.phases[phase].observe(seconds)
+
+    def observe_route(self, route, seconds):
+        """
+        :param route: the path the route was registered with.
+        :param seconds: time from the first byte of a request until its
+            response was written.
+        """
+        histogram = self.routes.get(route)
+        if histogram is None:
+            histogram = self.routes[route] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def render(self):
+        """
+        :return: a string with all metrics in Prometheus text format.
+        """
+        lines = [
+            '# TYPE diy_connections_opened_total counter',
+            'diy_connections_opened_total {0}'.format(
+                self.connections_opened),
+            '# TYPE diy_connections_active gauge',
+            'diy_connections_active {0}'.format(self.connections_active),
+            '# TYPE diy_received_bytes_total counter',
+            'diy_received_bytes_total {0}'.format(self.bytes_in),
+            '# TYPE diy_sent_bytes_total counter',
+            'diy_sent_bytes_total {0}'.format(self.bytes_out),
+            '# TYPE diy_errors_total counter',
+        ]
+        for code, count in sorted(self.errors.items()):
+            lines.append('diy_errors_total{{code="{0}"}} {1}'.format(
+                code, count))
+
+        lines.append('# TYPE diy_phase_seconds histogram')
+        for phase, histogram in self.phases.items():
+            lines.extend(histogram.render(
+                'diy_phase_seconds', 'phase="{0}"'.format(phase)))
+
+        lines.append('# TYPE diy_request_seconds histogram')
+        for route, histogram in sorted(self.routes.items()):
+            lines.extend(histogram.render(
+                'diy_request_seconds', 'route="{0}"'.format(
+                    escape_label(route))))
+
+        for collector in self.collectors:
+            lines.extend(collector.render())
+        return '\n'.join(lines) + '\n'
+
+    async def handler(self, request):
+        return Response(body=self.render(), content_type=CONTENT_TYPE)
+
+
+def escape_label(value):
+    """
+    :param value: a string used as a Prometheus label value.
+    :return: the string with backslashes, quotes and newlines escaped.
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
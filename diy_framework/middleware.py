@@ -0,0 +1,121 @@
+"""
+Middleware for routes. A middleware wraps the call of a route's handler,
+either around it, before it or after it, and can be added to a whole
+Router or App with 'use' or to a single route with the 'middleware'
+argument of 'add_route'.
+
+    @middleware.before
+    async def require_token(request):
+        if request.header('authorization') != TOKEN:
+            return Response(code=401)
+
+    router.use(require_token)
+
+Every route's middleware is composed with its handler into one chain of
+coroutine functions when the route is added or 'Router.compile' runs, so
+dispatching a request doesn't allocate wrappers or walk lists.
+
+Middleware also runs for responses a ResponseCache serves. Those are
+frozen and shared, so middleware that changes them works on
+'response.thaw()':
+
+    @middleware.after
+    async def add_cookie(request, response):
+        response = response.thaw()
+        response.set_header('Set-Cookie', session_cookie(request))
+        return response
+"""
+
+
+class Middleware(object):
+    """
+    Base class of middleware, subclasses implement 'wrap'.
+
+    :param fn: the async function the middleware calls.
+    """
+    def __init__(self, fn):
+        self.fn = fn
+
+    def wrap(self, call_next):
+        """
+        :param call_next: an async function that accepts a Request and
+            returns a Response, the rest of the chain.
+        :return: an async function with the same signature that runs the
+            middleware and 'call_next'.
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__, self.fn)
+
+
+class Around(Middleware):
+    """
+    Calls 'fn(request, call_next)', which decides whether and when to
+    await 'call_next(request)' and returns the Response.
+    """
+    def wrap(self, call_next):
+        fn = self.fn
+
+        async def call(request):
+            return await fn(request, call_next)
+        return call
+
+
+class Before(Middleware):
+    """
+    Calls 'fn(request)' before the rest of the chain. If it returns
+    anything but None, that is the reply and the rest of the chain is
+    skipped.
+    """
+    def wrap(self, call_next):
+        fn = self.fn
+
+        async def call(request):
+            response = await fn(request)
+            if response is None:
+                return await call_next(request)
+            return response
+        return call
+
+
+class After(Middleware):
+    """
+    Calls 'fn(request, response)' with the Response of the rest of the
+    chain and replies with the Response it returns.
+    """
+    def wrap(self, call_next):
+        fn = self.fn
+
+        async def call(request):
+            return await fn(request, await call_next(request))
+        return call
+
+
+def around(fn):
+    return Around(fn)
+
+
+def before(fn):
+    return Before(fn)
+
+
+def after(fn):
+    return After(fn)
+
+
+def compose(endpoint, middleware):
+    """
+    :param endpoint: an async function that accepts a Request and returns
+        a Response.
+    :param middleware: an iterable of Middleware or plain async functions,
+        which are used as Around middleware, the first one outermost.
+    :return: an async function that accepts a Request and runs the whole
+        chain.
+    """
+    call = endpoint
+    for layer in reversed(tuple(middleware)):
+        if not isinstance(layer, Middleware):
+            layer = Around(layer)
+        call = layer.wrap(call)
+    return call
@@ -0,0 +1,422 @@
+"""
+Incremental parser for 'multipart/form-data' request bodies. Bytes are
+fed to MultipartParser as they arrive, so a streaming route can take
+uploads of any size while holding at most one read's worth of the body
+in memory:
+
+    async def upload(request):
+        form = await multipart.read_form(request)
+        try:
+            avatar = form.files['avatar'][0]
+            save(avatar.filename, avatar.file)
+        finally:
+            form.close()
+
+    router.add_route('/upload', upload, stream=True)
+
+Fields are decoded into strings and kept in memory. File parts are
+written to a 'tempfile.SpooledTemporaryFile', which stays in memory up to
+'spool_size' bytes and moves to a temporary file on disk after that.
+'read_form' feeds the parser in a thread once a file part goes to disk,
+so uploads don't block the event loop on disk writes. Buffered requests
+with a multipart body are parsed the same way by 'Request.body', in the
+handler's thread and in one go, which is bounded by the server's
+'max_body_size'. The server closes that FormData once the request is
+done.
+"""
+
+import asyncio
+import functools
+import os
+import re
+import tempfile
+
+from .exceptions import BadRequestException, PayloadTooLargeException
+
+
+CRLF = b'\r\n'
+SEPARATOR = CRLF + CRLF
+SPOOL_SIZE = 1024 * 1024
+MAX_FIELD_SIZE = 64 * 1024
+MAX_HEADER_SIZE = 8 * 1024
+MAX_PARTS = 1000
+MAX_BOUNDARY_LENGTH = 70
+PARAM_REGEXP = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+
+class UploadFile(object):
+    """
+    A file part of a multipart body.
+
+    :param name: the name of the form field.
+    :param filename: the file's name as sent by the client, without any
+        directories.
+    :param content_type: the part's Content-Type.
+    :param headers: a dict of the part's lowercase headers.
+    :param file: a file-like object with the contents, positioned at the
+        start once the part has been parsed.
+    """
+    def __init__(self, name, filename, content_type, headers, file):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.headers = headers
+        self.file = file
+        self.size = 0
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.file.seek(offset, whence)
+
+    def close(self):
+        self.file.close()
+
+    def __repr__(self):
+        return '{0}({1!r}, {2!r}, {3} bytes)'.format(
+            self.__class__.__name__, self.name, self.filename, self.size)
+
+
+class FormData(object):
+    """
+    The parsed parts of a multipart body. 'fields' has the same
+    {key: [val]} form as the bodies of urlencoded forms, 'files' holds
+    lists of UploadFile objects. 'close' closes, and so deletes, every
+    file.
+    """
+    def __init__(self):
+        self.fields = {}
+        self.files = {}
+
+    def close(self):
+        for uploads in self.files.values():
+            for upload in uploads:
+                upload.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MultipartParser(object):
+    """
+    Stateful parser for a single multipart body, fed with 'feed' as
+    pieces of the body arrive and finished with 'close'. Only a tail as
+    long as the boundary is kept between calls, everything before it is
+    handed to the current part. Errors raise BadRequestException, bodies
+    over the limits PayloadTooLargeException.
+
+    :param boundary: a bytes object, the boundary parameter of the
+        Content-Type.
+    :param spool_size: bytes of a file part kept in memory before it's
+        moved to disk.
+    :param spool_dir: the directory for spooled files, None for the
+        system's default.
+    :param max_field_size: the largest field, in bytes.
+    :param max_file_size: the largest file part, in bytes, None for no
+        limit.
+    :param max_body_size: the largest body, in bytes, None for no limit.
+    :param max_parts: the most fields and files in a body, None for no
+        limit.
+    """
+    PREAMBLE, DELIMITER, HEADERS, DATA, DONE = range(5)
+
+    def __init__(self, boundary, spool_size=SPOOL_SIZE, spool_dir=None,
+                 max_field_size=MAX_FIELD_SIZE, max_file_size=None,
+                 max_body_size=None, max_parts=MAX_PARTS):
+        self.spool_size = spool_size
+        self.spool_dir = spool_dir
+        self.max_field_size = max_field_size
+        self.max_file_size = max_file_size
+        self.max_body_size = max_body_size
+        self.max_parts = max_parts
+        self.form = FormData()
+        self._delimiter = CRLF + b'--' + boundary
+        self._buffer = bytearray(CRLF)
+        self._state = self.PREAMBLE
+        self._received = 0
+        self._parts = 0
+        self._part = None
+        self._field = None
+
+    @classmethod
+    def from_content_type(cls, content_type, **options):
+        """
+        :param content_type: a string, the request's Content-Type header.
+        :param options: passed on to MultipartParser.
+        :return: a MultipartParser for the boundary of the content type.
+        """
+        return cls(get_boundary(content_type), **options)
+
+    def feed(self, data):
+        """
+        :param data: a bytes-like object, the next piece of the body.
+        """
+        self._received += len(data)
+        if (self.max_body_size is not None and
+                self._received > self.max_body_size):
+            raise PayloadTooLargeException('Multipart body too large')
+        buffer = self._buffer
+        buffer.extend(data)
+        offset = 0
+        while True:
+            if self._state == self.DATA:
+                offset, complete = self._read_data(offset)
+            elif self._state == self.DELIMITER:
+                offset, complete = self._read_delimiter(offset)
+            elif self._state == self.HEADERS:
+                offset, complete = self._read_headers(offset)
+            elif self._state == self.PREAMBLE:
+                offset, complete = self._read_preamble(offset)
+            else:
+                offset, complete = len(buffer), False
+            if not complete:
+                break
+        del buffer[:offset]
+
+    def spills(self, size):
+        """
+        :param size: the length of the next piece of the body.
+        :return: Boolean - whether feeding it may write the current file
+            part to disk. A part that starts in the same piece is only
+            seen by the next call.
+        """
+        part = self._part
+        return (isinstance(part, UploadFile) and bool(self.spool_size) and
+                part.size + size > self.spool_size)
+
+    def close(self):
+        """
+        :return: the FormData of the whole body.
+        :raises BadRequestException: if the body ended before the final
+            boundary.
+        """
+        if self._state != self.DONE:
+            self.abort()
+            raise BadRequestException('Incomplete multipart body')
+        return self.form
+
+    def abort(self):
+        """
+        Closes every file parsed so far.
+        """
+        if isinstance(self._part, UploadFile):
+            self._part.close()
+        self._part = None
+        self._field = None
+        self.form.close()
+
+    def _read_preamble(self, offset):
+        index = self._buffer.find(self._delimiter, offset)
+        if index == -1:
+            return self._keep_tail(offset), False
+        self._state = self.DELIMITER
+        return index + len(self._delimiter), True
+
+    def _read_delimiter(self, offset):
+        """
+        Reads what follows a delimiter, '--' after the last one and
+        optional whitespace and CRLF after the others.
+        """
+        buffer = self._buffer
+        if len(buffer) - offset < 2:
+            return offset, False
+        if buffer[offset:offset + 2] == b'--':
+            self._state = self.DONE
+            return len(buffer), False
+        line_end = buffer.find(CRLF, offset)
+        if line_end == -1:
+            if len(buffer) - offset > MAX_HEADER_SIZE:
+                raise BadRequestException('Malformed multipart boundary')
+            return offset, False
+        if buffer[offset:line_end].strip(b' \t'):
+            raise BadRequestException('Malformed multipart boundary')
+        self._state = self.HEADERS
+        return line_end + len(CRLF), True
+
+    def _read_headers(self, offset):
+        buffer = self._buffer
+        if buffer.startswith(CRLF, offset):
+            headers_end = offset
+        else:
+            headers_end = buffer.find(SEPARATOR, offset)
+            if headers_end == -1:
+                if len(buffer) - offset > MAX_HEADER_SIZE:
+                    raise BadRequestException('Multipart headers too large')
+                return offset, False
+            headers_end += len(CRLF)
+        self._start_part(parse_part_headers(bytes(buffer[offset:headers_end])))
+        self._state = self.DATA
+        return headers_end + len(CRLF), True
+
+    def _read_data(self, offset):
+        index = self._buffer.find(self._delimiter, offset)
+        if index == -1:
+            end = self._keep_tail(offset)
+            self._write(offset, end)
+            return end, False
+        self._write(offset, index)
+        self._finish_part()
+        self._state = self.DELIMITER
+        return index + len(self._delimiter), True
+
+    def _keep_tail(self, offset):
+        """
+        :return: the position up to which the buffer can be consumed
+            without splitting a delimiter that may continue in the next
+            piece of the body.
+        """
+        return max(offset, len(self._buffer) - len(self._delimiter) + 1)
+
+    def _start_part(self, headers):
+        disposition, params = parse_options(
+            headers.get('content-disposition', ''))
+        if disposition != 'form-data' or 'name' not in params:
+            raise BadRequestException('Malformed multipart part')
+        self._parts += 1
+        if self.max_parts is not None and self._parts > self.max_parts:
+            raise PayloadTooLargeException('Too many multipart parts')
+        name = params['name']
+        if 'filename' in params:
+            filename = os.path.basename(params['filename'].replace('\\', '/'))
+            self._part = UploadFile(
+                name, filename,
+                headers.get('content-type', 'application/octet-stream'),
+                headers, tempfile.SpooledTemporaryFile(
+                    max_size=self.spool_size, dir=self.spool_dir))
+        else:
+            self._part = name
+            self._field = bytearray()
+
+    def _write(self, start, end):
+        if start == end:
+            return
+        with memoryview(self._buffer) as view, view[start:end] as data:
+            if self._field is not None:
+                if len(self._field) + len(data) > self.max_field_size:
+                    raise PayloadTooLargeException('Multipart field too large')
+                self._field.extend(data)
+                return
+            part = self._part
+            part.size += len(data)
+            if (self.max_file_size is not None and
+                    part.size > self.max_file_size):
+                raise PayloadTooLargeException('Multipart file too large')
+            part.file.write(data)
+
+    def _finish_part(self):
+        if self._field is not None:
+            value = self._field.decode('utf-8', 'replace')
+            self.form.fields.setdefault(self._part, []).append(value)
+            self._field = None
+        else:
+            self._part.file.seek(0)
+            self.form.files.setdefault(self._part.name, []).append(
+                self._part)
+        self._part = None
+
+
+def get_boundary(content_type):
+    """
+    :param content_type: a string, a multipart Content-Type header.
+    :return: a bytes object, the boundary parameter.
+    :raises BadRequestException: if the boundary is missing or invalid.
+    """
+    boundary = parse_options(content_type)[1].get('boundary', '')
+    if not 0 < len(boundary) <= MAX_BOUNDARY_LENGTH:
+        raise BadRequestException('Invalid multipart boundary')
+    try:
+        return boundary.encode('ascii')
+    except UnicodeEncodeError:
+        raise BadRequestException('Invalid multipart boundary')
+
+
+def parse_options(value):
+    """
+    Splits a header such as Content-Type or Content-Disposition into its
+    value and parameters, ie. 'form-data; name="a"'.
+
+    :param value: a string, the header's value.
+    :return: a tuple of the lowercase value and a dict of parameters with
+        lowercase names and unquoted values.
+    """
+    main, sep, rest = value.partition(';')
+    params = {}
+    for name, param in PARAM_REGEXP.findall(sep + rest):
+        param = param.strip()
+        if param.startswith('"') and param.endswith('"') and len(param) > 1:
+            param = re.sub(r'\\(.)', r'\1', param[1:-1])
+        params[name.lower()] = param
+    return main.strip().lower(), params
+
+
+def parse_part_headers(header_lines):
+    """
+    :param header_lines: a bytes object of CRLF separated headers.
+    :return: a dict of lowercase header: value pairs.
+    """
+    headers = {}
+    for line in header_lines.split(CRLF):
+        if not line:
+            continue
+        name, sep, value = line.partition(b':')
+        if not sep:
+            raise BadRequestException('Malformed multipart header')
+        headers[name.strip().decode('utf-8', 'replace').lower()] = (
+            value.strip().decode('utf-8', 'replace'))
+    return headers
+
+
+def parse(content_type, body_raw, **options):
+    """
+    Parses a whole buffered body.
+
+    :param content_type: a string, the request's Content-Type header.
+    :param body_raw: a bytes object.
+    :param options: passed on to MultipartParser.
+    :return: a FormData.
+    """
+    parser = MultipartParser.from_content_type(content_type, **options)
+    try:
+        parser.feed(body_raw)
+    except BadRequestException:
+        parser.abort()
+        raise
+    return parser.close()
+
+
+async def read_form(request, **options):
+    """
+    Parses the multipart body of a request. The body of a request for a
+    streaming route is fed to the parser as it's read from the
+    connection, a buffered body is parsed in one go. Pieces that go to a
+    file part on disk, and buffered bodies too large to be spooled in
+    memory, are parsed in the loop's default executor.
+
+    :param request: a Request.
+    :param options: passed on to MultipartParser.
+    :return: a FormData, which the caller must close.
+    """
+    loop = asyncio.get_running_loop()
+    content_type = request.header('content-type', '')
+    if request.body_stream is None:
+        body_raw = request.body_raw or b''
+        if len(body_raw) <= options.get('spool_size', SPOOL_SIZE):
+            return parse(content_type, body_raw, **options)
+        return await loop.run_in_executor(None, functools.partial(
+            parse, content_type, body_raw, **options))
+
+    parser = MultipartParser.from_content_type(content_type, **options)
+    try:
+        async for chunk in request:
+            if parser.spills(len(chunk)):
+                await loop.run_in_executor(None, parser.feed, chunk)
+            else:
+                parser.feed(chunk)
+    except BaseException:
+        parser.abort()
+        raise
+    return parser.close()
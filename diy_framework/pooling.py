@@ -0,0 +1,48 @@
+"""
+Free lists HTTPServer uses to reuse connections, receive buffers and
+Requests instead of allocating new ones for every connection and
+request, when it's created with a 'pool_size'.
+"""
+
+
+class FreeList(object):
+    """
+    A bounded stack of objects that are ready to be used again. Objects
+    pushed while it's full are dropped and left to the garbage collector.
+    'reused' and 'created' count the pops that did and didn't find one.
+
+    :param max_size: the most objects kept.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.reused = 0
+        self.created = 0
+        self._free = []
+
+    def __len__(self):
+        return len(self._free)
+
+    def pop(self):
+        """
+        :return: a free object, or None if there is none and the caller
+            has to create one.
+        """
+        if self._free:
+            self.reused += 1
+            return self._free.pop()
+        self.created += 1
+        return None
+
+    def push(self, obj):
+        """
+        :param obj: an object that was reset and is no longer in use.
+        """
+        if len(self._free) < self.max_size:
+            self._free.append(obj)
+
+    def stats(self):
+        """
+        :return: a dict of the counters and the number of free objects.
+        """
+        return {'free': len(self._free), 'reused': self.reused,
+                'created': self.created}
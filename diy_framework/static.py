@@ -0,0 +1,261 @@
+"""
+Serving files from a directory, mounted on a Router with 'add_static'.
+"""
+
+import collections
+import email.utils
+import mimetypes
+import os
+import stat
+import time
+
+from .cache import etag_matches
+from .exceptions import NotFoundException
+from .http_utils import FileResponse, NotModifiedResponse, Response
+
+
+MAX_OPEN_FILES = 256
+STAT_TTL = 1
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+INDEX = 'index.html'
+
+
+class OpenFile(object):
+    """
+    A file kept open by StaticFiles together with the headers derived
+    from its stat result. It's closed once it has been evicted from the
+    cache and no response is sending it anymore.
+
+    :param path: the absolute path of the file.
+    :param checked: the clock time the file was last stat'ed at.
+    """
+    def __init__(self, path, checked):
+        self.file = open(path, 'rb')
+        self.stat = os.fstat(self.file.fileno())
+        self.checked = checked
+        self.users = 0
+        self.evicted = False
+        self.content_type = (mimetypes.guess_type(path)[0] or
+                             DEFAULT_CONTENT_TYPE)
+        self.last_modified = email.utils.formatdate(
+            self.stat.st_mtime, usegmt=True)
+        self.etag = '"{0:x}-{1:x}"'.format(
+            self.stat.st_mtime_ns, self.stat.st_size)
+
+    def acquire(self):
+        self.users += 1
+
+    def release(self):
+        self.users -= 1
+        if self.evicted and not self.users:
+            self.file.close()
+
+    def evict(self):
+        self.evicted = True
+        if not self.users:
+            self.file.close()
+
+    def changed(self, current):
+        """
+        :param current: a fresh 'os.stat' result for the same path.
+        :return: Boolean - whether the file was replaced or modified.
+        """
+        return (current.st_ino != self.stat.st_ino or
+                current.st_mtime_ns != self.stat.st_mtime_ns or
+                current.st_size != self.stat.st_size)
+
+
+class StaticFiles(object):
+    """
+    Handler that serves the files below a directory. Requests go through
+    an LRU cache of open files, so a popular file is opened once and
+    stat'ed at most once every 'stat_ttl' seconds. Replies carry
+    Last-Modified, ETag and Accept-Ranges headers, answer If-None-Match
+    and If-Modified-Since with '304 Not Modified' and single byte ranges
+    with '206 Partial Content'. Paths that leave the directory, hidden
+    files and anything that isn't a regular file are not found.
+
+    :param directory: the directory to serve.
+    :param max_open_files: the number of files kept open.
+    :param stat_ttl: seconds a cached stat result is trusted for.
+    :param index: the file served for a directory, None to serve none.
+    :param clock: a function returning the current time in seconds.
+    """
+    def __init__(self, directory, max_open_files=MAX_OPEN_FILES,
+                 stat_ttl=STAT_TTL, index=INDEX, clock=time.monotonic):
+        self.directory = os.path.realpath(directory)
+        self.max_open_files = max_open_files
+        self.stat_ttl = stat_ttl
+        self.index = index
+        self.clock = clock
+        self._files = collections.OrderedDict()
+
+    async def __call__(self, request, path):
+        if request.method != 'GET':
+            return Response(code=405, headers={'Allow': 'GET'})
+
+        open_file = self.open(path)
+        headers = {
+            'Last-Modified': open_file.last_modified,
+            'ETag': open_file.etag,
+            'Accept-Ranges': 'bytes',
+        }
+        if self.not_modified(request.headers, open_file):
+            response = NotModifiedResponse(open_file.etag)
+            response.headers['Last-Modified'] = open_file.last_modified
+            return response
+
+        size = open_file.stat.st_size
+        code, offset, count = 200, 0, size
+        if self.range_applies(request.headers, open_file):
+            byte_range = parse_range(request.headers['range'], size)
+            if byte_range is False:
+                headers['Content-Range'] = 'bytes */{0}'.format(size)
+                return Response(code=416, headers=headers)
+            if byte_range is not None:
+                code, (offset, count) = 206, byte_range
+                headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                    offset, offset + count - 1, size)
+
+        open_file.acquire()
+        response = FileResponse(
+            open_file.file, offset=offset, count=count, code=code,
+            release=open_file.release, headers=headers,
+            content_type=open_file.content_type)
+        # releases the file if middleware replaces the response or
+        # anything fails before it's sent
+        request.add_cleanup(response.close)
+        return response
+
+    def open(self, path):
+        """
+        :param path: a path relative to the served directory.
+        :return: an OpenFile, from the cache if it's still fresh.
+        """
+        full_path = self.resolve(path)
+        now = self.clock()
+        open_file = self._files.get(full_path)
+        if open_file is not None and now - open_file.checked < self.stat_ttl:
+            self._files.move_to_end(full_path)
+            return open_file
+
+        try:
+            current = os.stat(full_path)
+        except OSError:
+            current = None
+        if open_file is not None:
+            if current is not None and not open_file.changed(current):
+                open_file.checked = now
+                self._files.move_to_end(full_path)
+                return open_file
+            self._evict(full_path)
+        if current is None or not stat.S_ISREG(current.st_mode):
+            raise NotFoundException()
+
+        try:
+            open_file = OpenFile(full_path, now)
+        except OSError:
+            raise NotFoundException()
+        self._files[full_path] = open_file
+        while len(self._files) > self.max_open_files:
+            self._evict(next(iter(self._files)))
+        return open_file
+
+    def resolve(self, path):
+        """
+        :param path: a path relative to the served directory.
+        :return: the absolute path of the file to serve.
+        """
+        parts = path.split('/')
+        if '\x00' in path or any(part.startswith('.') for part in parts):
+            raise NotFoundException()
+
+        full_path = os.path.realpath(os.path.join(self.directory, *parts))
+        if os.path.commonpath((self.directory, full_path)) != self.directory:
+            raise NotFoundException()
+        if self.index and os.path.isdir(full_path):
+            full_path = os.path.join(full_path, self.index)
+        return full_path
+
+    def clear(self):
+        for full_path in list(self._files):
+            self._evict(full_path)
+
+    def _evict(self, full_path):
+        self._files.pop(full_path).evict()
+
+    @staticmethod
+    def not_modified(headers, open_file):
+        """
+        :param headers: the request's headers.
+        :param open_file: an OpenFile.
+        :return: Boolean - whether the client's copy is still current.
+        """
+        if 'if-none-match' in headers:
+            return etag_matches(headers['if-none-match'], open_file.etag)
+        since = parse_http_date(headers.get('if-modified-since'))
+        return since is not None and int(open_file.stat.st_mtime) <= since
+
+    @staticmethod
+    def range_applies(headers, open_file):
+        """
+        :param headers: the request's headers.
+        :param open_file: an OpenFile.
+        :return: Boolean - whether a Range header should be honoured,
+            which If-Range limits to an unchanged file.
+        """
+        if 'range' not in headers:
+            return False
+        if_range = headers.get('if-range')
+        return if_range is None or if_range in (
+            open_file.etag, open_file.last_modified)
+
+
+def parse_range(header, size):
+    """
+    Parses a Range header asking for a single byte range. Multiple
+    ranges aren't supported and get the whole file.
+
+    :param header: the value of a 'Range' header.
+    :param size: the size of the file in bytes.
+    :return: an (offset, count) tuple, None to send the whole file or
+        False if the range can't be satisfied.
+    """
+    unit, _, ranges = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+
+    start, sep, end = ranges.strip().partition('-')
+    try:
+        if not sep or not (start or end):
+            return None
+        if not start:
+            suffix = int(end)
+            if suffix <= 0 or not size:
+                return False
+            return max(size - suffix, 0), min(suffix, size)
+        start = int(start)
+        end = int(end) if end else None
+    except ValueError:
+        return None
+
+    if end is not None and start > end:
+        return None
+    if start >= size:
+        return False
+    if end is None or end >= size:
+        end = size - 1
+    return start, end - start + 1
+
+
+def parse_http_date(value):
+    """
+    :param value: an HTTP date string or None.
+    :return: a POSIX timestamp, or None if value is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return int(email.utils.parsedate_to_datetime(value).timestamp())
+    except (TypeError, ValueError, IndexError):
+        return None
@@ -0,0 +1,83 @@
+"""
+Shared, coarse-grained connection timeouts.
+"""
+
+import math
+
+
+RESOLUTION = 0.5
+
+
+class TimerWheel(object):
+    """
+    Tracks deadlines of many connections with a single periodic callback
+    instead of one 'loop.call_later' handle per connection. Deadlines are
+    rounded up to the next tick of 'resolution' seconds and connections
+    are kept in one bucket per tick, so moving a deadline is two set
+    operations, and every tick expires a whole bucket in one go. A
+    timeout fires between 'timeout' and 'timeout + resolution' seconds
+    after it was scheduled.
+
+    Scheduled objects must implement an 'on_timeout' method.
+
+    :param loop: An object that implements the 'asyncio.BaseEventLoop'
+        interface.
+    :param resolution: seconds between two sweeps.
+    """
+    def __init__(self, loop, resolution=RESOLUTION):
+        self.loop = loop
+        self.resolution = resolution
+        self._buckets = {}
+        self._deadlines = {}
+        self._handle = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, connection, timeout):
+        """
+        Sets or moves the deadline of a connection.
+
+        :param connection: an object with an 'on_timeout' method.
+        :param timeout: seconds from now.
+        """
+        tick = math.ceil((self.loop.time() + timeout) / self.resolution)
+        current = self._deadlines.get(connection)
+        if current == tick:
+            return
+        if current is not None:
+            self._discard(connection, current)
+
+        self._deadlines[connection] = tick
+        bucket = self._buckets.get(tick)
+        if bucket is None:
+            bucket = self._buckets[tick] = set()
+        bucket.add(connection)
+
+        if self._handle is None:
+            self._handle = self.loop.call_later(self.resolution, self._sweep)
+
+    def cancel(self, connection):
+        """
+        Removes the deadline of a connection, if it has one.
+        """
+        tick = self._deadlines.pop(connection, None)
+        if tick is not None:
+            self._discard(connection, tick)
+
+    def _discard(self, connection, tick):
+        bucket = self._buckets[tick]
+        bucket.discard(connection)
+        if not bucket:
+            del self._buckets[tick]
+
+    def _sweep(self):
+        self._handle = None
+        now = math.floor(self.loop.time() / self.resolution)
+        for tick in sorted(t for t in self._buckets if t <= now):
+            for connection in self._buckets.pop(tick):
+                del self._deadlines[connection]
+                connection.on_timeout()
+
+        if self._deadlines:
+            self._handle = self.loop.call_later(self.resolution, self._sweep)
@@ -0,0 +1,192 @@
+"""
+Pre-fork process supervision used by App when it runs more than one
+worker. The supervisor only forks, watches and signals processes, it
+never touches sockets or the event loop, which belong to the workers.
+
+Also the pieces of zero-downtime restarts: 'spawn_replacement' starts a
+new copy of the running program that inherits the listening socket and
+waits until it's serving, after which the old process drains its
+connections and exits.
+"""
+
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+
+logger = logging.getLogger(__name__)
+RESTART_DELAY = 1
+MIN_UPTIME = 1
+REPLACEMENT_TIMEOUT = 30
+FORWARDED_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+LISTEN_FD_ENV = 'DIY_FRAMEWORK_LISTEN_FD'
+READY_FD_ENV = 'DIY_FRAMEWORK_READY_FD'
+
+
+class Supervisor(object):
+    """
+    Forks a fixed number of worker processes that each call 'target',
+    restarts the ones that die and forwards SIGINT and SIGTERM to all of
+    them. Returns once every worker has exited after a forwarded signal.
+    With 'replace', SIGHUP calls it and, once it returns a replacement,
+    stops the workers with SIGTERM.
+
+    :param workers: the number of worker processes to keep running.
+    :param target: a callable run in every worker process. The worker
+        exits when it returns.
+    :param restart_delay: seconds to wait before replacing a worker that
+        died less than MIN_UPTIME seconds after it was started, so a
+        broken worker doesn't turn into a fork loop.
+    :param replace: None, or a callable that starts a process to take
+        over from this one and returns None if it failed to.
+    """
+    def __init__(self, workers, target, restart_delay=RESTART_DELAY,
+                 replace=None):
+        self.workers = workers
+        self.target = target
+        self.restart_delay = restart_delay
+        self.replace = replace
+        self._children = {}
+        self._stopping = False
+
+    def run(self):
+        """
+        Starts the workers and supervises them until they are told to stop.
+        """
+        previous_handlers = {
+            signum: signal.signal(signum, self._forward_signal)
+            for signum in FORWARDED_SIGNALS}
+        if self.replace is not None:
+            previous_handlers[signal.SIGHUP] = signal.signal(
+                signal.SIGHUP, self._restart)
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            self._supervise()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    def _supervise(self):
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+
+            started = self._children.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+
+            logger.warning('Worker {0} exited with status {1}, '
+                           'restarting'.format(pid, status))
+            if time.monotonic() - started < MIN_UPTIME:
+                time.sleep(self.restart_delay)
+            if not self._stopping:
+                self._spawn()
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            for signum in FORWARDED_SIGNALS + (signal.SIGHUP,):
+                signal.signal(signum, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            exit_code = 0
+            try:
+                self.target()
+            except BaseException:
+                logger.exception('Worker {0} crashed'.format(os.getpid()))
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        logger.info('Started worker {0}'.format(pid))
+        self._children[pid] = time.monotonic()
+
+    def _forward_signal(self, signum, frame):
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _restart(self, signum, frame):
+        if self._stopping:
+            return
+        logger.info('Got SIGHUP, starting a replacement')
+        if self.replace() is None:
+            logger.error('Replacement failed to start, still serving')
+            return
+        self._forward_signal(signal.SIGTERM, frame)
+
+
+def spawn_replacement(sock=None, timeout=REPLACEMENT_TIMEOUT):
+    """
+    Starts a new copy of the running program with the same command line
+    and waits until it calls 'notify_ready'.
+
+    :param sock: None, or the listening socket the new process takes
+        over through 'inherited_socket'. Without one, it binds its own.
+    :param timeout: seconds to wait for the new process.
+    :return: the subprocess.Popen of the new process, None if it exited
+        or didn't get ready in time, in which case it's terminated.
+    """
+    read_fd, write_fd = os.pipe()
+    env = dict(os.environ)
+    env[READY_FD_ENV] = str(write_fd)
+    pass_fds = [write_fd]
+    env.pop(LISTEN_FD_ENV, None)
+    if sock is not None:
+        env[LISTEN_FD_ENV] = str(sock.fileno())
+        pass_fds.append(sock.fileno())
+    argv = getattr(sys, 'orig_argv', [sys.executable] + sys.argv)
+    try:
+        process = subprocess.Popen(
+            [sys.executable] + argv[1:], env=env, pass_fds=pass_fds)
+    finally:
+        os.close(write_fd)
+
+    try:
+        readable, _, _ = select.select([read_fd], [], [], timeout)
+        if readable and os.read(read_fd, 1):
+            logger.info('Replacement {0} is serving'.format(process.pid))
+            return process
+    finally:
+        os.close(read_fd)
+    process.terminate()
+    return None
+
+
+def inherited_socket():
+    """
+    :return: the listening socket handed over by 'spawn_replacement', or
+        None if this process didn't get one.
+    """
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if fd is None:
+        return None
+    sock = socket.socket(fileno=int(fd))
+    sock.setblocking(False)
+    return sock
+
+
+def notify_ready():
+    """
+    Tells the process that started this one with 'spawn_replacement'
+    that it's accepting connections. Does nothing otherwise.
+    """
+    fd = os.environ.pop(READY_FD_ENV, None)
+    if fd is None:
+        return
+    try:
+        os.write(int(fd), b'1')
+    except OSError:
+        pass
+    finally:
+        os.close(int(fd))
@@ -0,0 +1,142 @@
+import asyncio
+import unittest as t
+from unittest.mock import MagicMock
+
+
+from diy_framework import http_parser
+from diy_framework import Router
+from diy_framework.admission import AdmissionController
+from diy_framework.exceptions import ServiceUnavailableException
+from diy_framework.http_protocol import HTTPProtocol
+from diy_framework.http_server import HTTPServer
+from diy_framework.metrics import Metrics
+
+
+class TestAdmissionController(t.TestCase):
+    def test_connections(self):
+        admission = AdmissionController(max_connections=1)
+        self.assertTrue(admission.connection_opened())
+        self.assertFalse(admission.connection_opened())
+        admission.connection_closed()
+        self.assertTrue(admission.connection_opened())
+        self.assertEqual(2, admission.admitted_connections)
+        self.assertEqual(1, admission.shed_connections)
+        rejection = b''.join(admission.rejection())
+        self.assertTrue(rejection.startswith(b'HTTP/1.1 503'))
+        self.assertIn(b'Retry-After: 1\r\n', rejection)
+
+    def test_requests_are_shed_without_queue(self):
+        admission = AdmissionController(max_requests=1)
+
+        async def main():
+            await admission.acquire()
+            with self.assertRaises(ServiceUnavailableException) as e:
+                await admission.acquire()
+            self.assertEqual({'Retry-After': '1'}, e.exception.headers)
+            admission.release()
+            await admission.acquire()
+
+        asyncio.run(main())
+        self.assertEqual(2, admission.admitted_requests)
+        self.assertEqual(1, admission.shed_requests)
+
+    def test_queued_request_gets_released_slot(self):
+        admission = AdmissionController(max_requests=1, max_queue=1)
+
+        async def main():
+            await admission.acquire()
+            waiting = asyncio.ensure_future(admission.acquire())
+            await asyncio.sleep(0)
+            self.assertEqual(1, admission.queued)
+            with self.assertRaises(ServiceUnavailableException):
+                await admission.acquire()
+            admission.release()
+            await waiting
+            self.assertEqual(1, admission.in_flight)
+            admission.release()
+
+        asyncio.run(main())
+        self.assertEqual(0, admission.in_flight)
+        self.assertEqual(0, admission.queued)
+
+    def test_queue_deadline(self):
+        admission = AdmissionController(max_requests=1, max_queue=1,
+                                        queue_timeout=0.01)
+
+        async def main():
+            await admission.acquire()
+            with self.assertRaises(ServiceUnavailableException):
+                await admission.acquire()
+            admission.release()
+
+        asyncio.run(main())
+        self.assertEqual(0, admission.queued)
+        self.assertEqual(0, admission.in_flight)
+        self.assertEqual(1, admission.shed_requests)
+
+    def test_render(self):
+        metrics = Metrics()
+        admission = AdmissionController()
+        admission.connection_opened()
+        metrics.add_collector(admission)
+        text = metrics.render()
+        self.assertIn(
+            'diy_admission_connections_total{outcome="admitted"} 1\n', text)
+        self.assertIn('diy_admission_in_flight 0\n', text)
+
+
+class TestServerAdmission(t.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.router = Router()
+        self.admission = AdmissionController(max_connections=1,
+                                             max_requests=1)
+        self.server = HTTPServer(self.router, http_parser, self.loop,
+                                 admission=self.admission)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def connect(self):
+        transport = MagicMock(spec=asyncio.Transport)
+        transport.is_closing.return_value = False
+        protocol = HTTPProtocol(self.server)
+        protocol.connection_made(transport)
+        return protocol, transport
+
+    def test_connection_is_shed(self):
+        first, _ = self.connect()
+        second, transport = self.connect()
+        self.assertIsNone(second._task)
+        data = b''.join(transport.writelines.call_args.args[0])
+        self.assertTrue(data.startswith(b'HTTP/1.1 503'))
+        transport.close.assert_called_once_with()
+
+        first.data_received(b'GET /missing HTTP/1.1\r\n\r\n')
+        self.loop.run_until_complete(first._task)
+        self.assertEqual(0, self.admission.connections)
+
+    def test_request_is_shed(self):
+        self.admission.max_connections = None
+        release = self.loop.create_future()
+
+        async def slow(request):
+            await release
+            return 'slow'
+        self.router.add_route('/', slow)
+
+        first, first_transport = self.connect()
+        second, second_transport = self.connect()
+        first.data_received(b'GET / HTTP/1.1\r\n\r\n')
+        second.data_received(b'GET / HTTP/1.1\r\n\r\n')
+        self.loop.run_until_complete(second._task)
+        data = b''.join(second_transport.writelines.call_args.args[0])
+        self.assertTrue(data.startswith(b'HTTP/1.1 503'))
+        self.assertIn(b'Retry-After: 1\r\n', data)
+
+        release.set_result(None)
+        first.eof_received()
+        self.loop.run_until_complete(first._task)
+        data = b''.join(first_transport.writelines.call_args.args[0])
+        self.assertTrue(data.endswith(b'slow'))
+        self.assertEqual(0, self.admission.in_flight)
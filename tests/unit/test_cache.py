@@ -0,0 +1,133 @@
+import asyncio
+import unittest as t
+
+
+from diy_framework import Router
+from diy_framework import middleware
+from diy_framework.application import Route
+from diy_framework.cache import ResponseCache, etag_matches
+from diy_framework.http_utils import Request, Response
+
+
+class TestResponseCache(t.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.calls = 0
+        self.cache = ResponseCache(clock=lambda: self.now)
+        self.route = Route('/', self.handler, cache_ttl=10, vary=('Accept',))
+
+    async def handler(self, request):
+        self.calls += 1
+        return 'body {0}'.format(self.calls)
+
+    def respond(self, path='/', query_params=None, headers=None):
+        request = Request()
+        request.method = 'GET'
+        request.path = path
+        request.query_params = query_params or {}
+        request.headers = headers or {}
+        return asyncio.run(self.route.chain(self.cache)(request))
+
+    def test_hit_is_served_without_handler(self):
+        first = self.respond()
+        second = self.respond()
+        self.assertEqual(1, self.calls)
+        self.assertIs(first, second)
+        self.assertTrue(second.frozen)
+        self.assertIn(b'ETag: "', second.to_bytes())
+
+    def test_key_includes_query_params_and_vary_headers(self):
+        self.respond(query_params={'a': ['1']})
+        self.respond(query_params={'a': ['2']})
+        self.respond(headers={'accept': 'text/plain'})
+        self.respond(headers={'accept': 'text/plain', 'x-other': 'x'})
+        self.assertEqual(3, self.calls)
+
+    def test_expired_entry_is_refreshed(self):
+        self.respond()
+        self.now = 10
+        self.respond()
+        self.assertEqual(2, self.calls)
+
+    def test_if_none_match_gets_304(self):
+        etag = self.respond().headers['ETag']
+        response = self.respond(headers={'if-none-match': etag})
+        data = response.to_bytes()
+        self.assertTrue(data.startswith(b'HTTP/1.1 304 Not Modified\r\n'))
+        self.assertIn(etag.encode('utf-8'), data)
+        self.assertNotIn(b'Content-Length', data)
+        self.assertTrue(data.endswith(b'\r\n\r\n'))
+
+    def test_lru_eviction(self):
+        self.cache.max_size = 2 * self.respond('/a').frozen_size
+        self.respond('/b')
+        self.respond('/a')
+        self.respond('/c')
+        self.assertEqual(2, len(self.cache))
+        self.assertLessEqual(self.cache.size, self.cache.max_size)
+        calls = self.calls
+        self.respond('/a')
+        self.assertEqual(calls, self.calls)
+        self.respond('/b')
+        self.assertEqual(calls + 1, self.calls)
+
+    def test_errors_are_not_cached(self):
+        async def handler(request):
+            self.calls += 1
+            return Response(code=404, body='no')
+        self.route = Route('/', handler, cache_ttl=10)
+        self.respond()
+        self.respond()
+        self.assertEqual(2, self.calls)
+        self.assertEqual(0, len(self.cache))
+
+
+class TestCachedRouteMiddleware(t.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.router = Router()
+
+        @middleware.before
+        async def require_token(request):
+            if request.headers.get('authorization') != 'secret':
+                return Response(code=401)
+
+        @middleware.after
+        async def add_cookie(request, response):
+            response = response.thaw()
+            response.set_header('Set-Cookie', request.headers['x-user'])
+            return response
+
+        self.router.use(require_token, add_cookie)
+        self.router.add_route('/', lambda request: 'top secret',
+                              cache_ttl=60)
+
+    def respond(self, **headers):
+        request = Request()
+        request.method = 'GET'
+        request.path = '/'
+        request.query_params = {}
+        request.headers = headers
+        route = self.router.resolve(request)
+        return asyncio.run(route.chain(self.cache)(request))
+
+    def test_middleware_runs_on_cache_hits(self):
+        first = self.respond(authorization='secret', **{'x-user': 'a'})
+        self.assertEqual(1, len(self.cache))
+        self.assertEqual(401, self.respond().code)
+        second = self.respond(authorization='secret', **{'x-user': 'b'})
+        self.assertEqual(('top secret', 'a'),
+                         (first.body, first.headers['Set-Cookie']))
+        self.assertEqual(('top secret', 'b'),
+                         (second.body, second.headers['Set-Cookie']))
+        self.assertNotIn('Set-Cookie', next(
+            iter(self.cache._entries.values())).response.headers)
+
+
+class TestEtagMatches(t.TestCase):
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"a"', '"a"'))
+        self.assertTrue(etag_matches('"b", W/"a"', '"a"'))
+        self.assertTrue(etag_matches('*', '"a"'))
+        self.assertFalse(etag_matches('"b"', '"a"'))
+        self.assertFalse(etag_matches(None, '"a"'))
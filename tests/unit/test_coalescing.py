@@ -0,0 +1,133 @@
+import asyncio
+import unittest as t
+
+
+from diy_framework.application import Route
+from diy_framework.coalescing import Coalescer
+from diy_framework.compression import Compressor
+from diy_framework.exceptions import (
+    NotFoundException,
+    ServiceUnavailableException,
+)
+from diy_framework.http_utils import Request, StreamingResponse
+
+
+def make_request(method='GET', path='/', query_params=None, headers=None):
+    request = Request()
+    request.method = method
+    request.path = path
+    request.query_params = query_params or {}
+    request.headers = headers or {}
+    return request
+
+
+class TestCoalescing(t.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.coalescer = Coalescer(query=('page',), headers=('Accept',),
+                                   max_waiters=3)
+        self.route = Route('/', self.handler, coalesce=self.coalescer)
+        self.result = 'body'
+
+    async def handler(self, request):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    def gather(self, *requests):
+        async def run():
+            return await asyncio.gather(
+                *(self.route.handle(request) for request in requests),
+                return_exceptions=True)
+        return asyncio.run(run())
+
+    def test_identical_requests_share_a_call(self):
+        responses = self.gather(*(make_request() for _ in range(4)))
+        self.assertEqual(1, self.calls)
+        self.assertEqual(['body'] * 4, [r.body for r in responses])
+        self.assertEqual(4, len(set(map(id, responses))))
+        responses[1].set_header('X-Waiter', '1')
+        self.assertNotIn('X-Waiter', responses[0].headers)
+        self.assertEqual({'in_flight': 0, 'calls': 1, 'coalesced': 3,
+                          'shed': 0}, self.coalescer.stats())
+
+    def test_key(self):
+        self.gather(make_request(query_params={'page': ['1']}),
+                    make_request(query_params={'page': ['1'], 'x': ['1']}),
+                    make_request(query_params={'page': ['2']}),
+                    make_request(headers={'accept': 'text/plain'}),
+                    make_request(path='/other'),
+                    make_request('POST'),
+                    make_request('POST'),
+                    make_request('HEAD'),
+                    make_request('HEAD'))
+        self.assertEqual(8, self.calls)
+
+    def test_errors_reach_every_waiter(self):
+        self.result = NotFoundException()
+        responses = self.gather(*(make_request() for _ in range(3)))
+        self.assertEqual(1, self.calls)
+        for response in responses:
+            self.assertIsInstance(response, NotFoundException)
+
+    def test_waiters_over_the_cap_are_shed(self):
+        responses = self.gather(*(make_request() for _ in range(5)))
+        self.assertEqual(1, self.calls)
+        self.assertIsInstance(responses[4], ServiceUnavailableException)
+        self.assertEqual({'Retry-After': '1'}, responses[4].headers)
+        self.assertEqual(1, self.coalescer.shed)
+
+    def test_streaming_responses_are_not_shared(self):
+        async def chunks():
+            yield 'chunk'
+        self.result = None
+
+        async def handler(request):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return StreamingResponse(chunks())
+        self.route = Route('/', handler, coalesce=True)
+        responses = self.gather(make_request(), make_request())
+        self.assertEqual(2, self.calls)
+        self.assertIsNot(responses[0], responses[1])
+
+    def test_waiters_retry_when_the_call_is_cancelled(self):
+        async def run():
+            first = asyncio.ensure_future(self.route.handle(make_request()))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(self.route.handle(make_request()))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+        self.assertEqual('body', asyncio.run(run()).body)
+        self.assertEqual(2, self.calls)
+        self.assertEqual(0, self.coalescer.stats()['in_flight'])
+
+    def test_waiters_get_the_response_before_compression(self):
+        self.result = 'a' * 2048
+        compressor = Compressor()
+
+        async def reply(request):
+            response = await self.route.handle(request)
+            return await compressor.compress(
+                request, response, asyncio.get_running_loop())
+        requests = (make_request(headers={'accept-encoding': 'gzip'}),
+                    make_request())
+
+        async def run():
+            return await asyncio.gather(*map(reply, requests))
+        leader, waiter = asyncio.run(run())
+        self.assertEqual(1, self.calls)
+        self.assertEqual('gzip', leader.headers['Content-Encoding'])
+        self.assertNotIn('Content-Encoding', waiter.headers)
+        self.assertEqual(self.result, waiter.body)
+
+    def test_streaming_route_can_not_be_coalesced(self):
+        with self.assertRaises(ValueError):
+            Route('/', self.handler, stream=True, coalesce=True)
+
+
+if __name__ == '__main__':
+    t.main()
@@ -0,0 +1,113 @@
+import asyncio
+import gzip
+import unittest as t
+import zlib
+
+
+from diy_framework.compression import Compressor, negotiate
+from diy_framework.http_utils import (
+    NotModifiedResponse,
+    Request,
+    Response,
+    StreamingResponse,
+)
+
+
+BODY = 'hello world ' * 200
+
+
+class TestNegotiate(t.TestCase):
+    def test_negotiate(self):
+        self.assertEqual('gzip', negotiate('gzip, deflate, br'))
+        self.assertEqual('deflate', negotiate('deflate'))
+        self.assertEqual('deflate', negotiate('gzip;q=0.5, deflate'))
+        self.assertEqual('gzip', negotiate('*'))
+        self.assertIsNone(negotiate('gzip;q=0, br'))
+        self.assertIsNone(negotiate('identity'))
+        self.assertIsNone(negotiate(None))
+
+
+class TestCompressor(t.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.compressor = Compressor()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def compress(self, response, accept_encoding='gzip'):
+        request = Request()
+        request.headers = {'accept-encoding': accept_encoding}
+        return self.loop.run_until_complete(
+            self.compressor.compress(request, response, self.loop))
+
+    def test_gzip(self):
+        response = self.compress(Response(body=BODY))
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertEqual('Accept-Encoding', response.headers['Vary'])
+        data = response.to_bytes()
+        head, body = data.split(b'\r\n\r\n', 1)
+        self.assertIn('Content-Length: {0}'.format(len(body)).encode(),
+                      head)
+        self.assertEqual(BODY.encode(), gzip.decompress(body))
+
+    def test_deflate(self):
+        response = self.compress(Response(body=BODY), 'deflate')
+        self.assertEqual(BODY.encode(), zlib.decompress(response.body))
+
+    def test_offloaded_to_executor(self):
+        self.compressor.offload_size = 0
+        response = self.compress(Response(body=BODY))
+        self.assertEqual(BODY.encode(), gzip.decompress(response.body))
+
+    def test_skipped(self):
+        small = self.compress(Response(body='hello'))
+        self.assertNotIn('Content-Encoding', small.headers)
+        self.assertEqual('Accept-Encoding', small.headers['Vary'])
+
+        image = self.compress(Response(body=BODY, content_type='image/png'))
+        self.assertNotIn('Content-Encoding', image.headers)
+        self.assertNotIn('Vary', image.headers)
+
+        identity = self.compress(Response(body=BODY), 'identity')
+        self.assertEqual(BODY, identity.body)
+
+    def test_frozen_response_variants(self):
+        original = Response(body=BODY, headers={'ETag': '"x"'}).freeze()
+        response = self.compress(original)
+        self.assertIsNot(original, response)
+        self.assertTrue(response.frozen)
+        self.assertEqual('W/"x"', response.headers['ETag'])
+        self.assertIs(response, self.compress(original))
+        self.assertEqual(BODY, original.body)
+
+        identity = self.compress(original, 'br')
+        self.assertNotIn('Content-Encoding', identity.headers)
+        self.assertEqual('Accept-Encoding', identity.headers['Vary'])
+
+    def test_not_modified_matches_the_variant(self):
+        original = Response(body=BODY, headers={'ETag': '"x"'}).freeze()
+        not_modified = NotModifiedResponse.from_response(original).freeze()
+        response = self.compress(not_modified)
+        self.assertEqual(304, response.code)
+        self.assertTrue(response.frozen)
+        self.assertEqual('W/"x"', response.headers['ETag'])
+        self.assertEqual('Accept-Encoding', response.headers['Vary'])
+        self.assertIs(response, self.compress(not_modified))
+
+        identity = self.compress(not_modified, 'identity')
+        self.assertEqual('"x"', identity.headers['ETag'])
+        self.assertEqual('Accept-Encoding', identity.headers['Vary'])
+        self.assertNotIn(b'Content-', identity.to_bytes())
+
+    def test_streaming(self):
+        async def body():
+            yield 'hello '
+            yield 'world'
+        response = self.compress(StreamingResponse(body()))
+
+        async def collect():
+            return b''.join([chunk async for chunk in response.body])
+        data = self.loop.run_until_complete(collect())
+        self.assertEqual(b'hello world', gzip.decompress(data))
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
@@ -0,0 +1,158 @@
+import asyncio
+import functools
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest as t
+
+
+from diy_framework import Router
+from diy_framework.diagnostics import (
+    Diagnostics,
+    LoopMonitor,
+    SamplingProfiler,
+    StackInspector,
+    handler_code,
+)
+from diy_framework.exceptions import BadRequestException
+from diy_framework.http_utils import Request
+
+
+def busy(request, seconds=0.2):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+    return sys._getframe()
+
+
+class Handlers(object):
+    def method(self, request):
+        pass
+
+    def __call__(self, request):
+        pass
+
+
+class TestStackInspector(t.TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.router.add_route('/busy/{seconds}', busy)
+        self.inspector = StackInspector()
+        self.inspector.add_routes(self.router)
+
+    def test_handler_code(self):
+        handlers = Handlers()
+        self.assertIs(busy.__code__, handler_code(busy))
+        self.assertIs(busy.__code__,
+                      handler_code(functools.partial(busy, seconds=1)))
+        self.assertIs(Handlers.method.__code__,
+                      handler_code(handlers.method))
+        self.assertIs(Handlers.__call__.__code__, handler_code(handlers))
+
+    def test_route_label(self):
+        label, names = self.inspector.inspect(busy(None, 0))
+        self.assertEqual('/busy/{seconds}', label)
+        self.assertEqual('tests.unit.test_diagnostics:busy', names[-1])
+        self.assertIn('TestStackInspector.test_route_label', names[-2])
+
+    def test_other_label(self):
+        self.assertEqual('<other>',
+                         self.inspector.inspect(sys._getframe())[0])
+
+
+class TestLoopMonitor(t.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.router = Router()
+        self.router.add_route('/busy/{seconds}', busy)
+        self.inspector = StackInspector()
+        self.inspector.add_routes(self.router)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_blocking_callback_is_reported(self):
+        monitor = LoopMonitor(self.inspector, interval=0.01,
+                              slow_threshold=0.05)
+        monitor.start(self.loop)
+        try:
+            with self.assertLogs('diy_framework.diagnostics') as logs:
+                self.loop.call_later(0.02, busy, None)
+                self.loop.run_until_complete(asyncio.sleep(0.3))
+        finally:
+            monitor.stop()
+        self.assertEqual({'/busy/{seconds}': 1}, monitor.slow_callbacks)
+        self.assertGreater(monitor.max_lag, 0.1)
+        self.assertGreater(monitor.lag.count, 2)
+        self.assertIn('blocked for over', logs.output[0])
+        self.assertIn('/busy/{seconds}', logs.output[0])
+        self.assertIn('lagged', logs.output[1])
+        self.assertIn('diy_slow_callbacks_total{route="/busy/{seconds}"} 1',
+                      monitor.render())
+
+    def test_stop(self):
+        monitor = LoopMonitor(self.inspector, interval=0.01)
+        monitor.start(self.loop)
+        monitor.stop()
+        count = monitor.lag.count
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertEqual(count, monitor.lag.count)
+
+
+class TestSamplingProfiler(t.TestCase):
+    def test_profile_is_written_per_route(self):
+        router = Router()
+        router.add_route('/busy/{seconds}', busy)
+        inspector = StackInspector()
+        inspector.add_routes(router)
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = SamplingProfiler(inspector, interval=0.001,
+                                        output_dir=output_dir)
+            self.assertTrue(profiler.start(threading.get_ident(), 0.1))
+            self.assertFalse(profiler.start(threading.get_ident(), 0.1))
+            busy(None, 0.2)
+            profiler.stop()
+
+            path = os.path.join(profiler.directory, 'busy_seconds.folded')
+            with open(path) as f:
+                lines = f.read().splitlines()
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertTrue(stack.endswith(';tests.unit.test_diagnostics:busy'))
+        self.assertGreater(int(count), 0)
+
+
+class TestDiagnosticsHandler(t.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.diagnostics = Diagnostics(sample_interval=0.001,
+                                       output_dir=self.output_dir.name)
+        self.loop = asyncio.new_event_loop()
+        self.diagnostics.start(self.loop)
+
+    def tearDown(self):
+        self.diagnostics.stop()
+        self.loop.close()
+        self.output_dir.cleanup()
+
+    def get(self, seconds):
+        request = Request()
+        request.query_params = {'seconds': [seconds]}
+        return self.loop.run_until_complete(
+            self.diagnostics.handler(request))
+
+    def test_profile(self):
+        self.assertEqual(202, self.get('0.05').code)
+        self.assertEqual(200, self.get('0.05').code)
+        self.diagnostics.profiler.stop()
+        self.assertTrue(os.path.isdir(self.diagnostics.profiler.directory))
+
+    def test_invalid_seconds(self):
+        for seconds in ('x', '0', '100000'):
+            with self.assertRaises(BadRequestException):
+                self.get(seconds)
+
+
+if __name__ == '__main__':
+    t.main()
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+import unittest as t
+
+
+from diy_framework import executors
+from diy_framework import http_parser
+from diy_framework import Router
+from diy_framework.application import Route
+from diy_framework.exceptions import ServiceUnavailableException
+from diy_framework.executors import ProcessPool, ThreadPool, get_pool
+from diy_framework.http_server import HTTPServer
+from diy_framework.http_utils import Request
+
+
+def square(request, number):
+    return int(number) ** 2
+
+
+def square_text(request, number):
+    return str(square(request, number))
+
+
+class TestHandlerExecution(t.TestCase):
+    def tearDown(self):
+        executors.shutdown()
+
+    def handle(self, handler, executor, **path_params):
+        route = Route('/', handler, executor=executor)
+        request = Request()
+        request.path_params = path_params
+        return asyncio.run(route.handle(request)).body
+
+    def test_sync_handler_inline(self):
+        def handler(request):
+            return threading.current_thread()
+        self.assertIs(threading.main_thread(),
+                      self.handle(handler, executors.INLINE))
+
+    def test_async_handler_inline(self):
+        async def handler(request, name):
+            return name
+        self.assertEqual('bob', self.handle(handler, None, name='bob'))
+
+    def test_thread_pool(self):
+        def handler(request):
+            return threading.current_thread()
+        self.assertIsNot(threading.main_thread(),
+                         self.handle(handler, executors.THREAD))
+
+    def test_process_pool(self):
+        pool = ProcessPool(max_workers=1)
+        self.assertEqual(49, self.handle(square, pool, number='7'))
+        pool.shutdown()
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            get_pool('fibers')
+
+    def test_coroutine_handlers_run_inline(self):
+        async def handler(request):
+            pass
+        for executor in (executors.THREAD, executors.PROCESS):
+            with self.assertRaises(ValueError):
+                Route('/', handler, executor=executor)
+
+    def test_streaming_routes_run_inline(self):
+        with self.assertRaises(ValueError):
+            Route('/', square, stream=True, executor=executors.THREAD)
+
+
+class TestProcessRouteThroughServer(t.TestCase):
+    def test_connection_reaches_eof(self):
+        pool = ProcessPool(max_workers=1)
+        router = Router()
+        router.add_route('/square/{number}', square_text, executor=pool)
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            server = HTTPServer(router, http_parser, loop)
+            listener = await asyncio.start_server(
+                server.handle_connection, '127.0.0.1', 0)
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /square/7 HTTP/1.1\r\n'
+                         b'Connection: close\r\n\r\n')
+            try:
+                return await asyncio.wait_for(reader.read(), 5)
+            finally:
+                writer.close()
+                listener.close()
+                await listener.wait_closed()
+
+        try:
+            response = asyncio.run(main())
+        finally:
+            pool.shutdown()
+        self.assertTrue(response.startswith(b'HTTP/1.1 200'))
+        self.assertTrue(response.endswith(b'49'))
+
+
+class TestPool(t.TestCase):
+    def test_loop_keeps_running(self):
+        pool = ThreadPool(max_workers=1)
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            ticker = asyncio.ensure_future(tick())
+            await pool.run(time.sleep, 0.1)
+            ticker.cancel()
+
+        asyncio.run(main())
+        pool.shutdown()
+        self.assertGreater(len(ticks), 3)
+
+    def test_max_pending(self):
+        pool = ThreadPool(max_workers=1, max_pending=1)
+
+        async def main():
+            first = asyncio.ensure_future(pool.run(time.sleep, 0.05))
+            await asyncio.sleep(0)
+            with self.assertRaises(ServiceUnavailableException):
+                await pool.run(time.sleep, 0)
+            await first
+            await pool.run(time.sleep, 0)
+
+        asyncio.run(main())
+        self.assertEqual(0, pool.pending)
+        pool.shutdown()
+
+    def test_shutdown(self):
+        pool = ThreadPool()
+        asyncio.run(pool.run(int))
+        executor = pool.executor
+        executors.shutdown()
+        self.assertIsNot(executor, pool.executor)
+        pool.shutdown()
@@ -2,6 +2,12 @@ import unittest as t
 
 from diy_framework import http_parser
 from diy_framework.http_utils import Request
+from diy_framework.exceptions import (
+    BadRequestException,
+    HeadersTooLargeException,
+    PayloadTooLargeException,
+    URITooLongException,
+)
 
 # add more edge case tests
 
@@ -39,12 +45,250 @@ class TestHTTPParser(t.TestCase):
         self.assertEqual(self.r.body_raw, bytearray(b'12=45&78=9'))
         self.assertEqual(self.r.body, {'12': ['45'], '78': ['9']})
 
+    def test_pipelined_body_leaves_rest_of_buffer(self):
+        next_r = b'GET / HTTP/1.1\r\n\r\n'
+        rest = http_parser.parse_into(self.r, self.post_r + next_r)
+        self.assertTrue(self.r.finished)
+        self.assertEqual(self.r.body_raw, bytearray(b'12=45&78=9'))
+        self.assertEqual(rest, bytearray(next_r))
+
+    def test_incremental_parse(self):
+        parser = http_parser.RequestParser()
+        buffer = bytearray()
+        for i in range(len(self.post_r)):
+            buffer.extend(self.post_r[i:i + 1])
+            buffer = parser.parse_into(self.r, buffer)
+            if i < len(self.post_r) - 1:
+                self.assertFalse(self.r.finished)
+        self.assertTrue(self.r.finished)
+        self.assertEqual(self.r.body, {'12': ['45'], '78': ['9']})
+        self.assertEqual(buffer, bytearray())
+
+    def test_buffer_kept_until_finished(self):
+        parser = http_parser.RequestParser()
+        partial = self.post_r[:-3]
+        buffer = parser.parse_into(self.r, bytearray(partial))
+        self.assertEqual(self.r.method, 'POST')
+        self.assertFalse(self.r.finished)
+        self.assertEqual(buffer, partial)
+
+    def test_header_value_with_colon(self):
+        http_parser.parse_into(
+            self.r, bytearray(b'GET / HTTP/1.1\r\nHost: a:8080\r\n\r\n'))
+        self.assertEqual(self.r.headers, {'host': 'a:8080'})
+
+    def test_malformed_request_line(self):
+        with self.assertRaises(BadRequestException):
+            http_parser.parse_into(self.r, bytearray(b'nonsense\r\n\r\n'))
+
+    def test_chunked_body(self):
+        chunked_r = bytearray(
+            b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'5;ext=1\r\n12=45\r\n5\r\n&78=9\r\n0\r\nX-Trailer: 1\r\n\r\n'
+            b'GET / HTTP/1.1\r\n\r\n')
+        parser = http_parser.RequestParser()
+        buffer = bytearray()
+        for i in range(len(chunked_r)):
+            buffer.extend(chunked_r[i:i + 1])
+            buffer = parser.parse_into(self.r, buffer)
+            if self.r.finished:
+                buffer.extend(chunked_r[i + 1:])
+                break
+        self.assertEqual(self.r.body_raw, b'12=45&78=9')
+        self.assertEqual(self.r.body, {'12': ['45'], '78': ['9']})
+        self.assertEqual(buffer, b'GET / HTTP/1.1\r\n\r\n')
+
+    def test_invalid_content_length(self):
+        for value in (b'+5', b'-5', b'5_0', b'0x5', b'\xd9\xa5', b''):
+            with self.assertRaises(BadRequestException, msg=value):
+                http_parser.parse_into(Request(), bytearray(
+                    b'POST / HTTP/1.1\r\nContent-Length: ' + value +
+                    b'\r\n\r\n12345'))
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(BadRequestException):
+            http_parser.parse_into(self.r, bytearray(
+                b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'zz\r\n'))
+
+    def test_read_body_streams_and_deletes(self):
+        parser = http_parser.RequestParser()
+        buffer = bytearray(self.post_r[:-4])
+        self.assertTrue(parser.parse_head(self.r, buffer))
+        self.assertEqual(parser.read_body(self.r, buffer, 4), b'12=4')
+        self.assertEqual(parser.read_body(self.r, buffer), b'5&')
+        self.assertEqual(buffer, bytearray())
+        self.assertFalse(self.r.finished)
+        buffer.extend(self.post_r[-4:])
+        self.assertEqual(parser.read_body(self.r, buffer), b'78=9')
+        self.assertTrue(self.r.finished)
+        self.assertIsNone(self.r.body)
+
+    def test_read_chunked_body(self):
+        parser = http_parser.RequestParser()
+        buffer = bytearray(
+            b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'3\r\nabc\r\n2\r\nde\r\n0\r\n\r\n')
+        parser.parse_head(self.r, buffer)
+        self.assertEqual(parser.read_body(self.r, buffer, 2), b'ab')
+        self.assertEqual(parser.read_body(self.r, buffer), b'cde')
+        self.assertTrue(self.r.finished)
+        self.assertEqual(buffer, bytearray())
+
     def test_uniform_method(self):
         short_get = bytearray(
             b'gEt / http/1.1\r\n\r\nContent-Type: text/plain')
         http_parser.parse_into(self.r, short_get)
         self.assertEqual(self.r.method, 'GET')
 
+    def test_headers_are_decoded_lazily(self):
+        r = bytearray(b'GET /?a=1&a=2 HTTP/1.1\r\nX-Custom: yes\r\n'
+                      b'Connection: close\r\n\r\n')
+        http_parser.parse_into(self.r, r)
+        self.assertIsNone(self.r._headers)
+        self.assertIsNone(self.r._query_params)
+        self.assertEqual({'connection': 'close'}, self.r.framing_headers)
+        self.assertEqual('close', self.r.header('connection'))
+        self.assertIsNone(self.r._headers)
+
+        self.assertEqual('yes', self.r.header('x-custom'))
+        self.assertEqual({'a': ['1', '2']}, self.r.query_params)
+        self.assertEqual('/', self.r.path)
+
+    def test_malformed_header_is_found_on_access(self):
+        r = bytearray(b'GET / HTTP/1.1\r\nbroken\r\n\r\n')
+        http_parser.parse_into(self.r, r)
+        self.assertTrue(self.r.finished)
+        with self.assertRaises(BadRequestException):
+            self.r.headers
+
+    def test_request_has_slots(self):
+        with self.assertRaises(AttributeError):
+            self.r.unknown = 1
+
+    def test_json_body(self):
+        r = bytearray(b'POST / HTTP/1.1\r\n'
+                      b'Content-Type: application/json; charset=utf-8\r\n'
+                      b'Content-Length: 13\r\n\r\n{"a": [1, 2]}')
+        http_parser.parse_into(self.r, r)
+        self.assertEqual({'a': [1, 2]}, self.r.body)
+
+    def test_invalid_json_body(self):
+        r = bytearray(b'POST / HTTP/1.1\r\nContent-Type: application/json'
+                      b'\r\nContent-Length: 2\r\n\r\n{x')
+        http_parser.parse_into(self.r, r)
+        with self.assertRaises(BadRequestException):
+            self.r.body
+
+    def test_unknown_content_type_body(self):
+        r = bytearray(b'POST / HTTP/1.1\r\nContent-Type: text/plain'
+                      b'\r\nContent-Length: 2\r\n\r\nhi')
+        http_parser.parse_into(self.r, r)
+        self.assertIsNone(self.r.body)
+        self.assertEqual(b'hi', self.r.body_raw)
+
+
+class TestParserLimits(t.TestCase):
+    def parse(self, data, **limits):
+        parser = http_parser.RequestParser(**limits)
+        return parser.parse_into(Request(), bytearray(data))
+
+    def test_long_request_line_before_it_ends(self):
+        with self.assertRaises(URITooLongException):
+            self.parse(b'GET /' + b'a' * 20, max_request_line=16)
+        self.parse(b'GET /' + b'a' * 11 + b'\r\n', max_request_line=16)
+        with self.assertRaises(URITooLongException):
+            self.parse(b'GET /' + b'a' * 12 + b' HTTP/1.1\r\n\r\n',
+                       max_request_line=16)
+
+    def test_headers_before_they_end(self):
+        with self.assertRaises(HeadersTooLargeException):
+            self.parse(b'GET / HTTP/1.1\r\nX-A: ' + b'a' * 64,
+                       max_header_size=32)
+        with self.assertRaises(HeadersTooLargeException):
+            self.parse(b'GET / HTTP/1.1\r\n' + b'X-A: 1\r\n' * 3,
+                       max_headers=2)
+        self.parse(b'GET / HTTP/1.1\r\n' + b'X-A: 1\r\n' * 2 + b'\r\n',
+                   max_headers=2)
+
+    def feed(self, data, chunk_size, **limits):
+        parser = http_parser.RequestParser(**limits)
+        request = Request()
+        buffer = bytearray()
+        for i in range(0, len(data), chunk_size):
+            buffer.extend(data[i:i + chunk_size])
+            parser.parse_into(request, buffer)
+        return request
+
+    def test_headers_at_the_limits_in_chunks(self):
+        data = b'GET / HTTP/1.1\r\n' + b'X-A: 1\r\n' * 4 + b'\r\n'
+        header_size = len(data) - data.index(b'\r\n') - 4
+        for chunk_size in (1, 2, 3, 7):
+            request = self.feed(data, chunk_size, max_headers=4,
+                                max_header_size=header_size)
+            self.assertTrue(request.finished)
+            with self.assertRaises(HeadersTooLargeException):
+                self.feed(data, chunk_size, max_headers=3)
+        with self.assertRaises(HeadersTooLargeException):
+            self.parse(data, max_headers=3)
+        with self.assertRaises(HeadersTooLargeException):
+            self.parse(data, max_header_size=header_size - 1)
+
+    def test_content_length_before_body_arrives(self):
+        with self.assertRaises(PayloadTooLargeException):
+            self.parse(b'POST / HTTP/1.1\r\nContent-Length: 11\r\n\r\n',
+                       max_body_size=10)
+
+    def test_chunked_body(self):
+        data = (b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'6\r\nabcdef\r\n6\r\nghijkl\r\n')
+        with self.assertRaises(PayloadTooLargeException):
+            self.parse(data, max_body_size=10)
+        self.parse(data, max_body_size=12)
+
+    def test_chunk_lines_and_trailers_before_they_end(self):
+        head = b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+        with self.assertRaises(PayloadTooLargeException):
+            self.parse(head + b'5;' + b'x' * http_parser.MAX_CHUNK_LINE)
+        with self.assertRaises(HeadersTooLargeException):
+            self.parse(head + b'0\r\nX-T: ' + b'a' * 64,
+                       max_header_size=32)
+        with self.assertRaises(HeadersTooLargeException):
+            self.parse(head + b'0\r\n' + b'X-T: 1\r\n' * 8,
+                       max_header_size=32)
+        request = Request()
+        http_parser.RequestParser(max_header_size=32).parse_into(
+            request, bytearray(head + b'0\r\n' + b'X-T: 1\r\n' * 4 +
+                               b'\r\n'))
+        self.assertTrue(request.finished)
+
+    def test_chunk_framing_is_not_buffered(self):
+        parser = http_parser.RequestParser(max_body_size=100)
+        request = Request()
+        buffer = bytearray(
+            b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n')
+        chunk = b'1;' + b'x' * 4000 + b'\r\na\r\n'
+        for _ in range(100):
+            buffer.extend(chunk)
+            parser.parse_into(request, buffer)
+            self.assertEqual(bytearray(), buffer)
+        buffer.extend(chunk)
+        with self.assertRaises(PayloadTooLargeException):
+            parser.parse_into(request, buffer)
+
+    def test_limits_can_be_disabled(self):
+        request = Request()
+        http_parser.RequestParser(
+            max_request_line=None, max_header_size=None, max_headers=None,
+            max_body_size=None).parse_into(request, bytearray(
+                b'POST /' + b'a' * 9000 + b' HTTP/1.1\r\n' +
+                b'X-A: 1\r\n' * 200 + b'Content-Length: 2\r\n\r\nab'))
+        self.assertTrue(request.finished)
+
+    def test_limits_are_bad_requests(self):
+        for exception in (URITooLongException, HeadersTooLargeException,
+                          PayloadTooLargeException):
+            self.assertTrue(issubclass(exception, BadRequestException))
 
 
 if __name__ == '__main__':
@@ -1,17 +1,16 @@
 import asyncio
 import unittest as t
 from unittest.mock import patch, MagicMock, Mock, ANY
-from collections import namedtuple
 
 
 from diy_framework import http_parser
-from diy_framework.http_server import HTTPConnection
+from diy_framework.http_server import HTTPConnection, HTTPServer
 from diy_framework.exceptions import TimeoutException
 from diy_framework import Router
+from diy_framework.http_utils import StreamingResponse
+from diy_framework.cache import ResponseCache
 
 
-HTTPServerMock = namedtuple('HTTPServerMock', 'router, http_parser, loop')
-
 class AsyncMock(Mock):
     def __call__(self, *args, **kwargs):
         sup = super(AsyncMock, self)
@@ -24,18 +23,12 @@ class AsyncMock(Mock):
 
 
 class TestHTTPConnection(t.TestCase):
-    @classmethod
-    def setUpClass(cls):
-        cls.server = HTTPServerMock(router=None,
-                                     http_parser=http_parser,
-                                     loop=None)
-
     def setUp(self):
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(None)
 
         self.router = Router()
-        self.server = self.server._replace(router=self.router, loop=self.loop)
+        self.server = HTTPServer(self.router, http_parser, self.loop)
 
         self.reader = asyncio.streams.StreamReader(loop=self.loop)
         self.writer = MagicMock(spec=asyncio.streams.StreamWriter)
@@ -49,18 +42,33 @@ class TestHTTPConnection(t.TestCase):
         self.loop.stop()
         self.loop.close()
 
+    def written(self):
+        """
+        :return: a list of the bytes passed to every write and writelines
+            call, in order.
+        """
+        data = []
+        for name, args, _ in self.writer.method_calls:
+            if name == 'write':
+                data.append(args[0])
+            elif name == 'writelines':
+                data.append(b''.join(args[0]))
+        return data
+
     def test_empty_get_request(self):
         mock_get_handler = AsyncMock(return_value='response')
         self.reader.feed_data(b'GET / http/1.1\r\n\r\n')
+        self.reader.feed_eof()
 
         self.router.add_route(r'/', mock_get_handler)
 
         self.loop.run_until_complete(self.conn.handle_request())
-        self.assertTrue(self.writer.write.call_args[0][0].endswith(b'response'))
+        self.assertTrue(self.written()[-1].endswith(b'response'))
 
     def test_url_params_get_request(self):
         mock_get_handler = AsyncMock(return_value='response')
         self.reader.feed_data(b'GET /12/edit/bob http/1.1\r\n\r\n')
+        self.reader.feed_eof()
 
         self.router.add_route(r'/{id}/edit/{name}', mock_get_handler)
 
@@ -74,10 +82,11 @@ class TestHTTPConnection(t.TestCase):
             (b'POST / http/1.1\r\nContent-Length:8\r\n'
              b'Content-Type: application/x-www-form-urlencoded\r\n\r\n'
              b'abcd=123'))
+        self.reader.feed_eof()
 
         self.router.add_route(r'/', echo_coro)
         self.loop.run_until_complete(self.conn.handle_request())
-        self.assertTrue(self.writer.write.call_args[0][0].endswith(b'abcd=123'))
+        self.assertTrue(self.written()[-1].endswith(b'abcd=123'))
 
     def test_post_large_request(self):
         async def echo_coro(r):
@@ -86,16 +95,161 @@ class TestHTTPConnection(t.TestCase):
             (b'POST / http/1.1\r\nContent-Length: 2000\r\n'
              b'Content-Type: application/x-www-form-urlencoded\r\n\r\n') +
             b'abcd=12345' * 200)
+        self.reader.feed_eof()
         self.router.add_route(r'/', echo_coro)
         self.loop.run_until_complete(self.conn.handle_request())
-        rsp_body = self.writer.write.call_args[0][0].split(b'\r\n\r\n')[1]
+        rsp_body = self.written()[-1].split(b'\r\n\r\n')[1]
         self.assertEqual(len(rsp_body), 2000)
 
+    def test_keep_alive_serves_multiple_requests(self):
+        mock_get_handler = AsyncMock(return_value='response')
+        self.reader.feed_data(b'GET / http/1.1\r\n\r\n')
+        self.reader.feed_data(b'GET / http/1.1\r\n\r\n')
+        self.reader.feed_eof()
+        self.router.add_route(r'/', mock_get_handler)
+
+        self.loop.run_until_complete(self.conn.handle_request())
+        self.assertEqual(mock_get_handler.call_count, 2)
+        self.assertIn(b'Connection: keep-alive',
+                      self.written()[-1])
+        self.writer.close.assert_called_once_with()
+
+    def test_pipelined_requests(self):
+        async def echo_coro(r):
+            return bytes(r.body_raw).decode('utf-8')
+        self.reader.feed_data(
+            b'POST / http/1.1\r\nContent-Length: 3\r\n\r\nabc'
+            b'POST / http/1.1\r\nContent-Length: 3\r\n\r\ndef')
+        self.reader.feed_eof()
+        self.router.add_route(r'/', echo_coro)
+
+        self.loop.run_until_complete(self.conn.handle_request())
+        bodies = self.written()
+        self.assertEqual(len(bodies), 2)
+        self.assertTrue(bodies[0].endswith(b'abc'))
+        self.assertTrue(bodies[1].endswith(b'def'))
+
+    def test_connection_close_header(self):
+        mock_get_handler = AsyncMock(return_value='response')
+        self.reader.feed_data(
+            b'GET / http/1.1\r\nConnection: close\r\n\r\n'
+            b'GET / http/1.1\r\n\r\n')
+        self.router.add_route(r'/', mock_get_handler)
+
+        self.loop.run_until_complete(self.conn.handle_request())
+        self.assertEqual(mock_get_handler.call_count, 1)
+        self.assertIn(b'Connection: close',
+                      self.written()[-1])
+
+    def test_max_keep_alive_requests(self):
+        self.server.max_keep_alive_requests = 1
+        self.conn = HTTPConnection(self.server, self.reader, self.writer)
+        mock_get_handler = AsyncMock(return_value='response')
+        self.reader.feed_data(b'GET / http/1.1\r\n\r\n' * 2)
+        self.router.add_route(r'/', mock_get_handler)
+
+        self.loop.run_until_complete(self.conn.handle_request())
+        self.assertEqual(mock_get_handler.call_count, 1)
+        self.assertIn(b'Connection: close',
+                      self.written()[-1])
+
+    def test_streaming_request_body(self):
+        received = []
+
+        async def upload(r):
+            async for chunk in r:
+                received.append(chunk)
+            return 'ok'
+        self.reader.feed_data(
+            b'POST /upload http/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'4\r\nabcd\r\n')
+        self.reader.feed_data(b'2\r\nef\r\n0\r\n\r\n')
+        self.reader.feed_data(b'GET /upload http/1.1\r\n\r\n')
+        self.reader.feed_eof()
+        self.router.add_route(r'/upload', upload, stream=True)
+
+        self.loop.run_until_complete(self.conn.handle_request())
+        self.assertEqual(b''.join(received), b'abcdef')
+        self.assertEqual(len(self.written()), 2)
+
+    def test_unread_streaming_body_closes_connection(self):
+        mock_get_handler = AsyncMock(return_value='response')
+        self.reader.feed_data(
+            b'POST / http/1.1\r\nContent-Length: 4\r\n\r\nab')
+        self.router.add_route(r'/', mock_get_handler, stream=True)
+
+        self.loop.run_until_complete(self.conn.handle_request())
+        self.assertIn(b'Connection: close',
+                      self.written()[-1])
+
+    def test_streaming_response(self):
+        async def export(r):
+            async def rows():
+                yield 'a,b\n'
+                yield ''
+                yield b'1,2\n'
+            return StreamingResponse(rows())
+        self.reader.feed_data(b'GET / http/1.1\r\n\r\n')
+        self.reader.feed_eof()
+        self.router.add_route(r'/', export)
+
+        self.loop.run_until_complete(self.conn.handle_request())
+        written = self.written()
+        self.assertIn(b'Transfer-Encoding: chunked', written[0])
+        self.assertEqual(
+            written[1:], [b'4\r\na,b\n\r\n', b'4\r\n1,2\n\r\n', b'0\r\n\r\n'])
+        self.assertEqual(self.writer.drain.call_count, 3)
 
-    @t.skip('')
     def test_request_timeout(self):
+        self.server.header_timeout = 0.05
+        self.server.timer_wheel.resolution = 0.01
+        self.conn = HTTPConnection(self.server, self.reader, self.writer)
         self.reader.feed_data(b'GET / ')
         self.loop.run_until_complete(self.conn.handle_request())
+        self.assertTrue(
+            self.written()[-1].startswith(b'HTTP/1.1 500'))
+        self.writer.close.assert_called_once_with()
+
+    def test_idle_keep_alive_timeout(self):
+        self.server.keep_alive_timeout = 0.05
+        self.server.timer_wheel.resolution = 0.01
+        self.conn = HTTPConnection(self.server, self.reader, self.writer)
+        mock_get_handler = AsyncMock(return_value='response')
+        self.router.add_route(r'/', mock_get_handler)
+        self.reader.feed_data(b'GET / http/1.1\r\n\r\n')
+        self.loop.run_until_complete(self.conn.handle_request())
+        self.assertEqual(len(self.written()), 1)
+        self.writer.close.assert_called_once_with()
+        self.assertEqual(len(self.server.timer_wheel), 0)
+
+    def test_cached_route(self):
+        self.server.cache = ResponseCache()
+        self.conn = HTTPConnection(self.server, self.reader, self.writer)
+        mock_get_handler = AsyncMock(return_value='response')
+        self.router.add_route(r'/', mock_get_handler, cache_ttl=60)
+        self.reader.feed_data(b'GET / http/1.1\r\n\r\n')
+        self.reader.feed_data(b'GET / http/1.1\r\n\r\n')
+        self.reader.feed_eof()
+
+        self.loop.run_until_complete(self.conn.handle_request())
+        self.assertEqual(mock_get_handler.call_count, 1)
+        first, second = self.written()
+        self.assertEqual(first, second)
+        self.assertIn(b'ETag: ', first)
+
+    def test_oversized_body_is_rejected_before_it_arrives(self):
+        self.server.parser_limits['max_body_size'] = 100
+        self.conn = HTTPConnection(self.server, self.reader, self.writer)
+        mock_get_handler = AsyncMock(return_value='response')
+        self.router.add_route(r'/', mock_get_handler)
+        self.reader.feed_data(
+            b'POST / http/1.1\r\nContent-Length: 1000000\r\n\r\n')
+
+        self.loop.run_until_complete(self.conn.handle_request())
+        self.assertEqual(mock_get_handler.call_count, 0)
+        self.assertTrue(self.written()[-1].startswith(
+            b'HTTP/1.1 413 Payload Too Large'))
+        self.writer.close.assert_called_once_with()
 
 
 if __name__ == '__main__':
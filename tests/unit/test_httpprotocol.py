@@ -0,0 +1,102 @@
+import asyncio
+import unittest as t
+from unittest.mock import MagicMock
+
+from diy_framework import http_parser
+from diy_framework.http_protocol import HTTPProtocol, MAX_BUFFER_SIZE
+from diy_framework.http_server import HTTPServer
+from diy_framework import Router
+
+
+class TestHTTPProtocol(t.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+        self.router = Router()
+        self.server = HTTPServer(self.router, http_parser, self.loop)
+
+        self.transport = MagicMock(spec=asyncio.Transport)
+        self.transport.is_closing.return_value = False
+        self.protocol = HTTPProtocol(self.server)
+        self.protocol.connection_made(self.transport)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_connection(self):
+        self.loop.run_until_complete(self.protocol._task)
+
+    def written(self):
+        data = []
+        for name, args, _ in self.transport.method_calls:
+            if name == 'write':
+                data.append(args[0])
+            elif name == 'writelines':
+                data.append(b''.join(args[0]))
+        return data
+
+    def test_get_request(self):
+        async def handler(r):
+            return 'response'
+        self.router.add_route(r'/', handler)
+        self.protocol.data_received(b'GET / http/1.1\r\n\r\n')
+        self.protocol.eof_received()
+
+        self.run_connection()
+        self.assertTrue(self.written()[0].endswith(b'response'))
+        self.transport.close.assert_called_once_with()
+
+    def test_pipelined_requests_in_one_chunk(self):
+        async def echo_coro(r, name):
+            return r.path
+        self.router.add_route(r'/{name}', echo_coro)
+        self.protocol.data_received(
+            b'GET /a http/1.1\r\n\r\nGET /b http/1.1\r\n\r\n')
+        self.protocol.eof_received()
+
+        self.run_connection()
+        written = self.written()
+        self.assertTrue(written[0].endswith(b'/a'))
+        self.assertTrue(written[1].endswith(b'/b'))
+
+    def test_not_found(self):
+        self.protocol.data_received(b'GET /missing http/1.1\r\n\r\n')
+
+        self.run_connection()
+        self.assertTrue(self.written()[0].startswith(b'HTTP/1.1 404'))
+
+    def test_streaming_body_across_chunks(self):
+        received = []
+
+        async def upload(r):
+            async for chunk in r:
+                received.append(chunk)
+            return 'ok'
+        self.router.add_route(r'/', upload, stream=True)
+        self.protocol.data_received(
+            b'POST / http/1.1\r\nContent-Length: 6\r\n\r\nabc')
+        self.loop.call_soon(self.protocol.data_received, b'def')
+        self.loop.call_soon(self.protocol.eof_received)
+
+        self.run_connection()
+        self.assertEqual(b''.join(received), b'abcdef')
+
+    def test_pause_reading_when_buffer_is_full(self):
+        async def upload(r):
+            await r.read()
+            return 'ok'
+        self.router.add_route(r'/', upload, stream=True)
+        body_size = MAX_BUFFER_SIZE + 1
+        self.protocol.data_received(
+            b'POST / http/1.1\r\nContent-Length: %d\r\n\r\n' % body_size +
+            b'a' * body_size)
+        self.transport.pause_reading.assert_called_once_with()
+        self.protocol.eof_received()
+
+        self.run_connection()
+        self.assertTrue(self.written()[0].endswith(b'ok'))
+
+
+if __name__ == '__main__':
+    t.main()
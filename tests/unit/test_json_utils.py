@@ -0,0 +1,34 @@
+import unittest as t
+
+
+from diy_framework import json_utils
+
+
+class TestJSONBackends(t.TestCase):
+    def setUp(self):
+        self.backend = json_utils.backend
+
+    def tearDown(self):
+        json_utils.use(self.backend)
+
+    def test_backends_agree(self):
+        data = {'name': 'zoë', 'values': [1, 2.5, None, True]}
+        for name in json_utils.available():
+            json_utils.use(name)
+            encoded = json_utils.dumps(data)
+            self.assertIsInstance(encoded, bytes, name)
+            self.assertEqual(data, json_utils.loads(encoded), name)
+
+    def test_use_returns_previous(self):
+        previous = json_utils.use('json')
+        self.assertIs(json_utils.StdlibBackend, json_utils.use(previous))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            json_utils.use('simplejson')
+
+    def test_invalid_json_raises_value_error(self):
+        for name in json_utils.available():
+            json_utils.use(name)
+            with self.assertRaises(ValueError, msg=name):
+                json_utils.loads(b'{x')
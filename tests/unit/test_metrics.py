@@ -0,0 +1,109 @@
+import asyncio
+import unittest as t
+from unittest.mock import MagicMock, Mock
+
+
+from diy_framework import http_parser
+from diy_framework import Router
+from diy_framework.http_server import HTTPConnection, HTTPServer
+from diy_framework.metrics import Histogram, Metrics, PHASES
+
+
+class AsyncMock(Mock):
+    def __call__(self, *args, **kwargs):
+        sup = super(AsyncMock, self)
+        async def coro():
+            return sup.__call__(*args, **kwargs)
+        return coro()
+
+
+class TestHistogram(t.TestCase):
+    def test_observe(self):
+        histogram = Histogram(buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.1)
+        histogram.observe(5)
+        self.assertEqual([2, 0, 1], histogram.counts)
+        self.assertEqual(3, histogram.count)
+
+    def test_render_is_cumulative(self):
+        histogram = Histogram(buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        lines = histogram.render('x', 'a="b"')
+        self.assertEqual([
+            'x_bucket{a="b",le="0.1"} 1',
+            'x_bucket{a="b",le="1"} 2',
+            'x_bucket{a="b",le="+Inf"} 2',
+            'x_sum{a="b"} 0.55',
+            'x_count{a="b"} 2',
+        ], lines)
+
+
+class TestMetrics(t.TestCase):
+    def test_render(self):
+        metrics = Metrics()
+        metrics.connection_opened()
+        metrics.bytes_received(10)
+        metrics.error(404)
+        metrics.observe_route('/"x"', 0.2)
+        text = metrics.render()
+        self.assertIn('diy_connections_active 1\n', text)
+        self.assertIn('diy_received_bytes_total 10\n', text)
+        self.assertIn('diy_errors_total{code="404"} 1\n', text)
+        self.assertIn('diy_request_seconds_count{route="/\\"x\\""} 1\n',
+                      text)
+
+    def test_handler(self):
+        metrics = Metrics()
+        response = asyncio.run(metrics.handler(None))
+        self.assertEqual(b'200 OK', response.to_bytes()[9:15])
+        self.assertIn(b'text/plain; version=0.0.4', response.to_bytes())
+
+
+class TestConnectionMetrics(t.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(None)
+
+        self.router = Router()
+        self.metrics = Metrics()
+        self.server = HTTPServer(self.router, http_parser, self.loop,
+                                 metrics=self.metrics)
+
+        self.reader = asyncio.streams.StreamReader(loop=self.loop)
+        self.writer = MagicMock(spec=asyncio.streams.StreamWriter)
+        self.writer.drain = AsyncMock()
+        self.conn = HTTPConnection(self.server, self.reader, self.writer)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_request_is_measured(self):
+        async def handler(request, name):
+            return 'hello'
+        self.router.add_route('/hello/{name}', handler)
+        request = b'GET /hello/bob HTTP/1.1\r\n\r\n'
+        self.reader.feed_data(request * 2)
+        self.reader.feed_eof()
+
+        self.loop.run_until_complete(self.conn.handle_request())
+
+        sent = sum(len(b''.join(call.args[0])) for call in
+                   self.writer.writelines.call_args_list)
+        self.assertEqual(len(request) * 2, self.metrics.bytes_in)
+        self.assertEqual(sent, self.metrics.bytes_out)
+        self.assertEqual(1, self.metrics.connections_opened)
+        self.assertEqual(0, self.metrics.connections_active)
+        self.assertEqual(2, self.metrics.routes['/hello/{name}'].count)
+        for phase in PHASES:
+            self.assertEqual(2, self.metrics.phases[phase].count, phase)
+
+    def test_errors_are_counted(self):
+        self.reader.feed_data(b'GET /missing HTTP/1.1\r\n\r\n')
+        self.reader.feed_eof()
+
+        self.loop.run_until_complete(self.conn.handle_request())
+
+        self.assertEqual({404: 1}, self.metrics.errors)
+        self.assertEqual(0, self.metrics.connections_active)
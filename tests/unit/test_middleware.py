@@ -0,0 +1,97 @@
+import asyncio
+import unittest as t
+from unittest.mock import patch
+
+
+from diy_framework import Router
+from diy_framework import middleware
+from diy_framework.application import Route
+from diy_framework.exceptions import NotFoundException
+from diy_framework.http_utils import Request, Response
+
+
+def request_for(path):
+    request = Request()
+    request.method = 'GET'
+    request.path = path
+    return request
+
+
+class TestMiddleware(t.TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.calls = []
+
+    def handle(self, path):
+        request = request_for(path)
+        route = self.router.resolve(request)
+        return asyncio.run(route.handle(request))
+
+    def record(self, name):
+        async def layer(request, call_next):
+            self.calls.append(name)
+            return await call_next(request)
+        return layer
+
+    def test_order(self):
+        async def handler(request, id):
+            self.calls.append('handler')
+            return id
+
+        self.router.use(self.record('outer'))
+        self.router.add_route('/users/{id}', handler,
+                              middleware=[self.record('route')])
+        self.router.use(middleware.around(self.record('inner')))
+        response = self.handle('/users/12')
+        self.assertEqual('12', response.body)
+        self.assertEqual(['outer', 'inner', 'route', 'handler'], self.calls)
+
+    def test_before_can_reply(self):
+        @middleware.before
+        async def deny(request):
+            if request.path == '/private':
+                return Response(code=401)
+
+        self.router.use(deny)
+        self.router.add_route('/private', lambda request: 'secret')
+        self.router.add_route('/public', lambda request: 'hello')
+        self.assertEqual(401, self.handle('/private').code)
+        self.assertEqual('hello', self.handle('/public').body)
+
+    def test_after_sees_response(self):
+        @middleware.after
+        async def add_header(request, response):
+            response.headers['X-Served-By'] = 'diy'
+            return response
+
+        self.router.add_route('/', lambda request: {'a': 1},
+                              middleware=[add_header])
+        response = self.handle('/')
+        self.assertEqual('diy', response.headers['X-Served-By'])
+        self.assertEqual({'a': 1}, response.data)
+
+    def test_chain_is_built_once(self):
+        self.router.add_route('/', lambda request: '')
+        route = self.router.resolve(request_for('/'))
+        chain = route.handle
+        self.handle('/')
+        self.assertIs(chain, self.router.resolve(request_for('/')).handle)
+        self.router.use(self.record('timing'))
+        self.assertIsNot(chain, route.handle)
+
+    def test_route_is_compiled_once(self):
+        self.router.use(self.record('outer'))
+        with patch.object(Route, 'compile', autospec=True,
+                          side_effect=Route.compile) as compile:
+            self.router.add_route('/', lambda request: '')
+            self.router.add_static('/assets', '/nonexistent')
+        self.assertEqual(2, compile.call_count)
+        self.handle('/')
+        self.assertEqual(['outer'], self.calls)
+
+    def test_static_mounts_run_middleware(self):
+        self.router.use(self.record('mount'))
+        self.router.add_static('/assets', '/nonexistent')
+        with self.assertRaises(NotFoundException):
+            self.handle('/assets/site.css')
+        self.assertEqual(['mount'], self.calls)
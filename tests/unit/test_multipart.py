@@ -0,0 +1,165 @@
+import asyncio
+import unittest as t
+from unittest.mock import MagicMock
+
+
+from diy_framework import http_parser
+from diy_framework import multipart
+from diy_framework import Router
+from diy_framework.exceptions import (
+    BadRequestException,
+    PayloadTooLargeException,
+)
+from diy_framework.http_server import HTTPConnection, HTTPServer
+from diy_framework.http_utils import Request
+from diy_framework.multipart import MultipartParser, get_boundary
+
+
+CONTENT_TYPE = 'multipart/form-data; boundary="abc123"'
+BODY = (
+    b'preamble\r\n'
+    b'--abc123\r\n'
+    b'Content-Disposition: form-data; name="title"\r\n'
+    b'\r\n'
+    b'Holiday\r\n'
+    b'--abc123\r\n'
+    b'Content-Disposition: form-data; name="photo"; '
+    b'filename="C:\\\\photos\\\\beach.jpg"\r\n'
+    b'Content-Type: image/jpeg\r\n'
+    b'\r\n'
+    b'\xff\xd8--abc12\r\n-abc123\xff\xd9\r\n'
+    b'--abc123--\r\n'
+    b'epilogue')
+PHOTO = b'\xff\xd8--abc12\r\n-abc123\xff\xd9'
+
+
+def check_form(test, form):
+    test.assertEqual({'title': ['Holiday']}, form.fields)
+    photo = form.files['photo'][0]
+    test.assertEqual('beach.jpg', photo.filename)
+    test.assertEqual('image/jpeg', photo.content_type)
+    test.assertEqual(len(PHOTO), photo.size)
+    test.assertEqual(PHOTO, photo.read())
+    form.close()
+
+
+class TestMultipartParser(t.TestCase):
+    def parse(self, chunk_size=None, body=BODY, **options):
+        parser = MultipartParser.from_content_type(CONTENT_TYPE, **options)
+        chunk_size = chunk_size or len(body)
+        for i in range(0, len(body), chunk_size):
+            parser.feed(body[i:i + chunk_size])
+        return parser.close()
+
+    def test_whole_body(self):
+        check_form(self, self.parse())
+
+    def test_byte_at_a_time(self):
+        check_form(self, self.parse(chunk_size=1))
+
+    def test_large_file_is_spooled_to_disk(self):
+        with self.parse(spool_size=4) as form:
+            photo = form.files['photo'][0]
+            self.assertTrue(photo.file._rolled)
+            self.assertEqual(PHOTO, photo.read())
+        self.assertTrue(photo.file.closed)
+
+    def test_small_file_stays_in_memory(self):
+        with self.parse() as form:
+            self.assertFalse(form.files['photo'][0].file._rolled)
+
+    def test_limits(self):
+        for options in ({'max_field_size': 4},
+                        {'max_file_size': 4},
+                        {'max_body_size': 100},
+                        {'max_parts': 1}):
+            with self.assertRaises(PayloadTooLargeException):
+                self.parse(chunk_size=7, **options)
+
+    def test_incomplete_body(self):
+        with self.assertRaises(BadRequestException):
+            self.parse(body=BODY[:-20])
+
+    def test_part_without_name(self):
+        body = (b'--abc123\r\nContent-Type: text/plain\r\n\r\nx\r\n'
+                b'--abc123--\r\n')
+        with self.assertRaises(BadRequestException):
+            self.parse(body=body)
+
+    def test_boundary(self):
+        self.assertEqual(b'xyz', get_boundary(
+            'multipart/form-data; charset=utf-8; boundary=xyz'))
+        with self.assertRaises(BadRequestException):
+            get_boundary('multipart/form-data')
+
+    def test_buffered_body(self):
+        request = Request()
+        request.raw_headers = (
+            '\r\nContent-Type: {0}'.format(CONTENT_TYPE).encode('ascii'))
+        request.body_raw = BODY
+        check_form(self, request.body)
+
+    def test_spills(self):
+        parser = MultipartParser.from_content_type(CONTENT_TYPE,
+                                                   spool_size=4)
+        parser.feed(BODY[:BODY.index(b'\xff')])
+        self.assertFalse(parser.spills(4))
+        self.assertTrue(parser.spills(5))
+        parser.abort()
+
+
+class TestStreamingUpload(t.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.router = Router()
+        self.server = HTTPServer(self.router, http_parser, self.loop)
+        self.reader = asyncio.StreamReader(loop=self.loop)
+        self.writer = MagicMock(spec=asyncio.StreamWriter)
+
+        async def drain():
+            pass
+        self.writer.drain = drain
+        self.conn = HTTPConnection(self.server, self.reader, self.writer)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_upload(self):
+        forms = []
+
+        async def upload(request):
+            form = await multipart.read_form(request, spool_size=4)
+            forms.append(form)
+            return str(form.files['photo'][0].size)
+        self.router.add_route('/upload', upload, stream=True)
+
+        self.reader.feed_data(
+            'POST /upload HTTP/1.1\r\nContent-Type: {0}\r\n'
+            'Content-Length: {1}\r\nConnection: close\r\n\r\n'.format(
+                CONTENT_TYPE, len(BODY)).encode('ascii'))
+        for i in range(0, len(BODY), 16):
+            self.reader.feed_data(BODY[i:i + 16])
+        self.loop.run_until_complete(self.conn.handle_request())
+
+        data = b''.join(self.writer.writelines.call_args.args[0])
+        self.assertTrue(data.startswith(b'HTTP/1.1 200'))
+        self.assertTrue(data.endswith(str(len(PHOTO)).encode('ascii')))
+        check_form(self, forms[0])
+
+    def test_buffered_form_is_closed(self):
+        forms = []
+
+        def upload(request):
+            forms.append(request.body)
+            return str(request.body.files['photo'][0].size)
+        self.router.add_route('/upload', upload)
+
+        self.reader.feed_data(
+            'POST /upload HTTP/1.1\r\nContent-Type: {0}\r\n'
+            'Content-Length: {1}\r\nConnection: close\r\n\r\n'.format(
+                CONTENT_TYPE, len(BODY)).encode('ascii') + BODY)
+        self.loop.run_until_complete(self.conn.handle_request())
+
+        data = b''.join(self.writer.writelines.call_args.args[0])
+        self.assertTrue(data.endswith(str(len(PHOTO)).encode('ascii')))
+        self.assertTrue(forms[0].files['photo'][0].file.closed)
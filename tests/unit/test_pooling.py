@@ -0,0 +1,112 @@
+import asyncio
+import unittest as t
+from unittest.mock import MagicMock
+
+
+from diy_framework import http_parser
+from diy_framework import Router
+from diy_framework.http_protocol import HTTPProtocol
+from diy_framework.http_server import HTTPConnection, HTTPServer
+from diy_framework.http_utils import Request
+from diy_framework.pooling import FreeList
+
+
+class TestFreeList(t.TestCase):
+    def test_bounded(self):
+        pool = FreeList(1)
+        self.assertIsNone(pool.pop())
+        pool.push('a')
+        pool.push('b')
+        self.assertEqual(1, len(pool))
+        self.assertEqual('a', pool.pop())
+        self.assertEqual({'free': 0, 'reused': 1, 'created': 1},
+                         pool.stats())
+
+    def test_request_reset(self):
+        request = Request()
+        path_params = request.path_params
+        request.method = 'GET'
+        request.raw_query = 'a=1'
+        request.query_params
+        request.reset()
+        self.assertIsNone(request.method)
+        self.assertEqual({}, request.query_params)
+        self.assertIs(path_params, request.path_params)
+        request.path_params = {'id': '1'}
+        request.reset()
+        self.assertEqual({}, request.path_params)
+
+
+class TestConnectionPooling(t.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.router = Router()
+        self.server = HTTPServer(self.router, http_parser, self.loop,
+                                 pool_size=4)
+        self.requests = []
+
+        async def handler(request, name):
+            self.requests.append((request, request.path))
+            return name
+        self.router.add_route('/{name}', handler)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def serve_protocol(self, data):
+        transport = MagicMock(spec=asyncio.Transport)
+        transport.is_closing.return_value = False
+        protocol = self.server.new_connection(HTTPProtocol)
+        protocol.connection_made(transport)
+        protocol.data_received(data)
+        protocol.eof_received()
+        self.loop.run_until_complete(protocol._task)
+        return protocol, transport
+
+    def test_protocol_is_reused_after_connection_lost(self):
+        first, _ = self.serve_protocol(b'GET /a HTTP/1.1\r\n\r\n')
+        self.assertIsNot(first, self.server.new_connection(HTTPProtocol))
+        first.connection_lost(None)
+        second, transport = self.serve_protocol(b'GET /b HTTP/1.1\r\n\r\n')
+        self.assertIs(first, second)
+        data = b''.join(transport.writelines.call_args.args[0])
+        self.assertTrue(data.endswith(b'b'))
+
+    def test_requests_are_reused_between_keep_alive_requests(self):
+        self.serve_protocol(b'GET /a HTTP/1.1\r\n\r\n'
+                            b'GET /b HTTP/1.1\r\n\r\n'
+                            b'GET /c HTTP/1.1\r\n\r\n')
+        (first, path_a), (second, path_b), (third, path_c) = self.requests
+        self.assertEqual(['/a', '/b', '/c'], [path_a, path_b, path_c])
+        self.assertIs(first, second)
+        self.assertIs(first, third)
+        self.assertEqual(1, self.server.request_pool.created)
+
+    def test_streams_connection_is_reused(self):
+        def serve(data):
+            reader = asyncio.StreamReader(loop=self.loop)
+            writer = MagicMock(spec=asyncio.StreamWriter)
+
+            async def drain():
+                pass
+            writer.drain = drain
+            reader.feed_data(data)
+            reader.feed_eof()
+            connection = self.server.new_connection(
+                HTTPConnection, reader, writer)
+            self.loop.run_until_complete(connection.handle_request())
+            return connection, writer
+
+        first, _ = serve(b'GET /a HTTP/1.1\r\n\r\n')
+        second, writer = serve(b'GET /b HTTP/1.1\r\n\r\n')
+        self.assertIs(first, second)
+        self.assertTrue(b''.join(
+            writer.writelines.call_args.args[0]).endswith(b'b'))
+        stats = self.server.pool_stats()
+        self.assertEqual(1, stats['HTTPConnection']['reused'])
+        self.assertEqual(1, stats['buffers']['reused'])
+
+    def test_pooling_is_off_by_default(self):
+        server = HTTPServer(self.router, http_parser, self.loop)
+        self.assertEqual({}, server.pool_stats())
+        self.assertIsNot(server.new_request(), server.new_request())
@@ -1,6 +1,14 @@
 import unittest as t
 
-from diy_framework.http_utils import Response
+from diy_framework.exceptions import FrozenResponse
+from diy_framework.http_utils import (
+    JSONResponse,
+    Response,
+    StreamingResponse,
+    frozen_response,
+    header_line,
+    to_response,
+)
 
 
 class TestResponse(t.TestCase):
@@ -27,6 +35,78 @@ class TestResponse(t.TestCase):
             byte_r,
             flags=MULTILINE)
         self.assertIsNotNone(match_obj)
+    def test_content_length_counts_bytes(self):
+        r = Response(code=200, body='\u00e9')
+        byte_r = r.to_bytes()
+        self.assertIn(b'Content-Length: 2', byte_r)
+
+    def test_body_kept_in_separate_buffer(self):
+        head, body = self.r.to_buffers()
+        self.assertTrue(head.endswith(b'\r\n\r\n'))
+        self.assertEqual(body, self.body.encode())
+
+    def test_connection_header(self):
+        self.assertIn(b'Connection: keep-alive\r\n', self.r.to_bytes(True))
+        self.assertIn(b'Connection: close\r\n', self.r.to_bytes(False))
+        self.assertNotIn(b'Connection', self.r.to_bytes())
+
+    def test_frozen_response_reuses_bytes(self):
+        self.r.freeze()
+        self.assertIs(self.r.to_buffers(True), self.r.to_buffers(True))
+        with self.assertRaises(FrozenResponse):
+            self.r.set_header('X-Test', 'value')
+
+    def test_frozen_variants_share_the_body(self):
+        self.r.freeze()
+        bodies = [self.r.to_buffers(keep_alive)[1]
+                  for keep_alive in (None, True, False)]
+        self.assertIs(bodies[0], bodies[1])
+        self.assertIs(bodies[0], bodies[2])
+        heads = sum(len(self.r.to_buffers(keep_alive)[0])
+                    for keep_alive in (None, True, False))
+        self.assertEqual(heads + len(self.body), self.r.frozen_size)
+
+    def test_frozen_response_is_shared(self):
+        self.assertIs(frozen_response(404, 'Not Found'),
+                      frozen_response(404, 'Not Found'))
+        self.assertTrue(frozen_response(404, 'Not Found').frozen)
+
+    def test_only_common_header_lines_are_cached(self):
+        self.assertIs(header_line('Content-Type', 'text/css'),
+                      header_line('Content-Type', 'text/css'))
+        etag = header_line('ETag', '"abc"')
+        self.assertEqual(b'ETag: "abc"\r\n', etag)
+        self.assertIsNot(etag, header_line('ETag', '"abc"'))
+
+
+class TestStreamingResponse(t.TestCase):
+    def test_chunked_head(self):
+        r = StreamingResponse(body=None)
+        head = r.head_bytes()
+        self.assertIn(b'Transfer-Encoding: chunked\r\n', head)
+        self.assertNotIn(b'Content-Length', head)
+        self.assertTrue(head.endswith(b'\r\n\r\n'))
+
+    def test_encode_chunk(self):
+        self.assertEqual(
+            b''.join(StreamingResponse.encode_chunk('a' * 26)),
+            b'1a\r\n' + b'a' * 26 + b'\r\n')
+
+
+class TestJSONResponse(t.TestCase):
+    def test_json_response(self):
+        r = JSONResponse({'name': 'bob'}, code=201)
+        data = r.to_bytes()
+        self.assertIn(b'content-type: application/json\r\n', data)
+        self.assertTrue(data.endswith(b'\r\n\r\n{"name":"bob"}'))
+        self.assertEqual({'name': 'bob'}, r.data)
+
+    def test_to_response(self):
+        self.assertIsInstance(to_response([1, 2]), JSONResponse)
+        self.assertEqual(b'text', to_response(b'text').body)
+        r = Response()
+        self.assertIs(r, to_response(r))
+
 
 if __name__ == '__main__':
     t.main()
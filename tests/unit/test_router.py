@@ -87,6 +87,81 @@ class TestRouter(t.TestCase):
         response = yield from wrapped_handler.handle('request')
         self.assertEqual(response, 'bob')
 
+    def test_static_route_lookup(self):
+        self.router.add_route(r'/login', self.handler)
+        wrapped_handler = self.router.get_handler('/login')
+        self.assertIs(wrapped_handler.handler, self.handler)
+        self.assertDictEqual(wrapped_handler.path_params, {})
+
+    def test_static_segment_beats_param(self):
+        handler2 = lambda r: r
+        self.router.add_route(r'/users/{id}', self.handler)
+        self.router.add_route(r'/users/me', handler2)
+        self.assertIs(self.router.get_handler('/users/me').handler, handler2)
+        self.assertDictEqual(
+            self.router.get_handler('/users/12').path_params, {'id': '12'})
+
+    def test_backtrack_to_param_route(self):
+        handler2 = lambda r, name: name
+        self.router.add_route(r'/users/me/edit', self.handler)
+        self.router.add_route(r'/users/{name}/view', handler2)
+        wrapped_handler = self.router.get_handler('/users/me/view')
+        self.assertIs(wrapped_handler.handler, handler2)
+        self.assertDictEqual(wrapped_handler.path_params, {'name': 'me'})
+
+    def test_mixed_segment_route(self):
+        self.router.add_route(r'/reports/{year}-{month}.csv', self.handler)
+        wrapped_handler = self.router.get_handler('/reports/2016-05.csv')
+        self.assertDictEqual(
+            wrapped_handler.path_params, {'year': '2016', 'month': '05'})
+        with self.assertRaises(NotFoundException):
+            self.router.get_handler('/reports/2016-05xcsv')
+
+    def test_param_does_not_match_empty_segment(self):
+        self.router.add_route(r'/path/{id}', self.handler)
+        with self.assertRaises(NotFoundException):
+            self.router.get_handler('/path/')
+        with self.assertRaises(NotFoundException):
+            self.router.get_handler('/path/12/more')
+
+    def test_unique_param_route(self):
+        self.router.add_route(r'/path/{id}', self.handler)
+        with self.assertRaises(DuplicateRoute):
+            self.router.add_route(r'/path/{id}', self.handler)
+
+    def test_static_segment_beats_param_added_first(self):
+        handler2 = lambda r: r
+        self.router.add_route(r'/users/me', handler2)
+        self.router.add_route(r'/users/{id}', self.handler)
+        self.assertIs(self.router.get_handler('/users/me').handler, handler2)
+        self.assertIs(self.router.get_handler('/users/12').handler,
+                      self.handler)
+
+    def test_regexp_route(self):
+        self.router.add_route(r'/files/(?P<name>.+)', self.handler)
+        wrapped_handler = self.router.get_handler('/files/a/b.txt')
+        self.assertIs(wrapped_handler.handler, self.handler)
+        self.assertDictEqual(wrapped_handler.path_params, {'name': 'a/b.txt'})
+        with self.assertRaises(NotFoundException):
+            self.router.get_handler('/files/')
+
+    def test_regexp_routes_after_params_in_order_added(self):
+        handler2 = lambda r, name: name
+        handler3 = lambda r, id: id
+        self.router.add_route(r'/items/(?P<name>[a-z]+)', handler2)
+        self.router.add_route(r'/items/{id}', self.handler)
+        self.router.add_route(r'/items/(?P<id>.*)', handler3)
+        self.assertIs(self.router.get_handler('/items/abc').handler,
+                      self.handler)
+        self.assertIs(self.router.get_handler('/items/a.c').handler,
+                      handler3)
+
+    def test_dot_is_literal(self):
+        self.router.add_route(r'/report.csv', self.handler)
+        self.router.get_handler('/report.csv')
+        with self.assertRaises(NotFoundException):
+            self.router.get_handler('/reportxcsv')
+
 
 if __name__ == '__main__':
     t.main()
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import textwrap
+import time
+import unittest as t
+from unittest.mock import MagicMock
+
+
+from diy_framework import http_parser
+from diy_framework import Router
+from diy_framework.http_protocol import HTTPProtocol
+from diy_framework.http_server import HTTPServer
+from diy_framework.workers import LISTEN_FD_ENV
+
+
+class TestServerShutdown(t.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.router = Router()
+        self.server = HTTPServer(self.router, http_parser, self.loop)
+        self.release = self.loop.create_future()
+
+        async def slow(request):
+            await self.release
+            return 'done'
+        self.router.add_route('/slow', slow)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def connect(self):
+        transport = MagicMock(spec=asyncio.Transport)
+        transport.is_closing.return_value = False
+        protocol = HTTPProtocol(self.server)
+        protocol.connection_made(transport)
+        return protocol, transport
+
+    def start(self):
+        idle, idle_transport = self.connect()
+        busy, busy_transport = self.connect()
+        busy.data_received(b'GET /slow HTTP/1.1\r\n\r\n')
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(2, len(self.server.connections))
+        return idle_transport, busy_transport
+
+    def test_drain(self):
+        idle_transport, busy_transport = self.start()
+        shutdown = self.loop.create_task(self.server.shutdown(timeout=5))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        idle_transport.close.assert_called_once_with()
+        busy_transport.close.assert_not_called()
+
+        self.release.set_result(None)
+        self.assertTrue(self.loop.run_until_complete(shutdown))
+        data = b''.join(busy_transport.writelines.call_args.args[0])
+        self.assertIn(b'Connection: close\r\n', data)
+        self.assertTrue(data.endswith(b'done'))
+        busy_transport.close.assert_called_once_with()
+        self.assertEqual(set(), self.server.connections)
+
+    def test_drain_deadline(self):
+        _, busy_transport = self.start()
+        self.assertFalse(self.loop.run_until_complete(
+            self.server.shutdown(timeout=0.01)))
+        busy_transport.close.assert_called_once_with()
+        self.assertEqual(set(), self.server.connections)
+        self.release.set_result(None)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+
+
+SERVER_SCRIPT = textwrap.dedent('''
+    import asyncio
+    import os
+    import sys
+    from diy_framework import App, Router
+
+    async def slow(request):
+        await asyncio.sleep(0.3)
+        return str(os.getpid())
+
+    router = Router()
+    router.add_route('/', slow)
+    app = App(router, port=int(sys.argv[1]), workers=int(sys.argv[2]))
+    app.start_server()
+''')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get(port):
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+        sock.sendall(b'GET / HTTP/1.1\r\nConnection: close\r\n\r\n')
+        chunks = []
+        chunk = sock.recv(4096)
+        while chunk:
+            chunks.append(chunk)
+            chunk = sock.recv(4096)
+    return b''.join(chunks)
+
+
+class TestSignals(t.TestCase):
+    workers = 1
+
+    def setUp(self):
+        self.port = free_port()
+        env = dict(os.environ, PYTHONPATH=os.getcwd())
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', SERVER_SCRIPT, str(self.port),
+             str(self.workers)], env=env, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', self.port)).close()
+                return
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+        self.fail('server did not start')
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+    def request_then_signal(self, signum):
+        with socket.create_connection(('127.0.0.1', self.port), 5) as sock:
+            sock.sendall(b'GET / HTTP/1.1\r\n\r\n')
+            time.sleep(0.1)
+            self.process.send_signal(signum)
+            return sock.recv(4096)
+
+    def test_sigterm_drains_requests_in_flight(self):
+        response = self.request_then_signal(signal.SIGTERM)
+        self.assertTrue(response.startswith(b'HTTP/1.1 200'))
+        self.assertIn(b'Connection: close\r\n', response)
+        self.assertEqual(0, self.process.wait(timeout=5))
+
+    def test_sighup_hands_socket_to_replacement(self):
+        response = self.request_then_signal(signal.SIGHUP)
+        self.assertTrue(response.endswith(
+            str(self.process.pid).encode('ascii')))
+        self.assertEqual(0, self.process.wait(timeout=10))
+
+        response = get(self.port)
+        self.assertTrue(response.startswith(b'HTTP/1.1 200'))
+        replacement = int(response.rsplit(b'\r\n', 1)[1])
+        self.assertNotEqual(self.process.pid, replacement)
+        os.kill(replacement, signal.SIGTERM)
+
+
+def parent_pid(pid):
+    with open('/proc/{0}/stat'.format(pid)) as f:
+        return int(f.read().rsplit(')', 1)[1].split()[1])
+
+
+@t.skipUnless(os.path.exists('/proc'), 'needs /proc to find the supervisor')
+class TestWorkerSignals(TestSignals):
+    workers = 2
+
+    def test_sigterm_drains_requests_in_flight(self):
+        response = self.request_then_signal(signal.SIGTERM)
+        self.assertTrue(response.startswith(b'HTTP/1.1 200'))
+        self.assertEqual(0, self.process.wait(timeout=5))
+
+    def test_sighup_hands_socket_to_replacement(self):
+        response = self.request_then_signal(signal.SIGHUP)
+        self.assertTrue(response.startswith(b'HTTP/1.1 200'))
+        old_worker = int(response.rsplit(b'\r\n', 1)[1])
+        self.assertEqual(0, self.process.wait(timeout=10))
+
+        response = get(self.port)
+        self.assertTrue(response.startswith(b'HTTP/1.1 200'))
+        replacement = int(response.rsplit(b'\r\n', 1)[1])
+        self.assertNotIn(replacement, (self.process.pid, old_worker))
+        supervisor = parent_pid(replacement)
+        self.assertNotEqual(self.process.pid, supervisor)
+        with open('/proc/{0}/environ'.format(supervisor), 'rb') as f:
+            environ = f.read()
+        os.kill(supervisor, signal.SIGTERM)
+        self.assertIn(LISTEN_FD_ENV.encode('ascii') + b'=', environ)
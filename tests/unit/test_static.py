@@ -0,0 +1,191 @@
+import asyncio
+import os
+import tempfile
+import unittest as t
+from unittest.mock import patch
+
+
+from diy_framework import http_parser
+from diy_framework import Router
+from diy_framework.exceptions import NotFoundException
+from diy_framework.http_protocol import HTTPProtocol
+from diy_framework.http_server import HTTPServer
+from diy_framework.http_utils import FileResponse, Request, Response
+from diy_framework.static import StaticFiles, parse_range
+
+
+CONTENT = b'0123456789' * 1000
+
+
+class TestParseRange(t.TestCase):
+    def test_parse_range(self):
+        self.assertEqual((0, 10), parse_range('bytes=0-9', 100))
+        self.assertEqual((90, 10), parse_range('bytes=90-', 100))
+        self.assertEqual((90, 10), parse_range('bytes=-10', 100))
+        self.assertEqual((0, 100), parse_range('bytes=-500', 100))
+        self.assertEqual((95, 5), parse_range('bytes=95-200', 100))
+        self.assertFalse(parse_range('bytes=100-', 100))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('bytes=5-1', 100))
+        self.assertIsNone(parse_range('lines=1-2', 100))
+        self.assertIsNone(parse_range('bytes=a-b', 100))
+
+
+class TestStaticFiles(t.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+        os.mkdir(os.path.join(self.directory, 'css'))
+        path = os.path.join(self.directory, 'css', 'site.css')
+        with open(path, 'wb') as f:
+            f.write(CONTENT)
+        with open(os.path.join(self.directory, '.secret'), 'wb') as f:
+            f.write(b'secret')
+        self.static = StaticFiles(self.directory)
+
+    def tearDown(self):
+        self.static.clear()
+        self.tmp.cleanup()
+
+    def get(self, path, method='GET', **headers):
+        request = Request()
+        request.method = method
+        request.headers = headers
+        return asyncio.run(self.static(request, path))
+
+    def test_file(self):
+        response = self.get('css/site.css')
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual((0, len(CONTENT)), (response.offset, response.count))
+        self.assertEqual('text/css', response.headers['content-type'])
+        self.assertIn('Last-Modified', response.headers)
+        response.close()
+
+    def test_open_files_are_reused(self):
+        first = self.get('css/site.css')
+        second = self.get('css/site.css')
+        self.assertIs(first.file, second.file)
+        first.close()
+        second.close()
+
+    def test_not_found(self):
+        for path in ('missing', '../etc/passwd', 'css/../../x', '.secret',
+                     'css'):
+            with self.assertRaises(NotFoundException, msg=path):
+                self.get(path)
+
+    def test_range(self):
+        response = self.get('css/site.css', range='bytes=10-19')
+        self.assertEqual(206, response.code)
+        self.assertEqual((10, 10), (response.offset, response.count))
+        self.assertEqual('bytes 10-19/{0}'.format(len(CONTENT)),
+                         response.headers['Content-Range'])
+        response.close()
+
+        response = self.get('css/site.css', range='bytes=20000-')
+        self.assertEqual(416, response.code)
+
+        response = self.get('css/site.css', range='bytes=0-1',
+                            **{'if-range': '"stale"'})
+        self.assertEqual(200, response.code)
+        response.close()
+
+    def test_conditional_get(self):
+        response = self.get('css/site.css')
+        response.close()
+        etag = response.headers['ETag']
+        modified = response.headers['Last-Modified']
+
+        self.assertEqual(304, self.get(
+            'css/site.css', **{'if-none-match': etag}).code)
+        self.assertEqual(304, self.get(
+            'css/site.css', **{'if-modified-since': modified}).code)
+        response = self.get('css/site.css',
+                            **{'if-modified-since': 'Thu, 01 Jan 1970 '
+                                                    '00:00:00 GMT'})
+        self.assertEqual(200, response.code)
+        response.close()
+
+    def test_method_not_allowed(self):
+        self.assertEqual(405, self.get('css/site.css', method='POST').code)
+
+
+class TestSendFile(t.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmp.name, 'data.bin'), 'wb') as f:
+            f.write(CONTENT)
+        self.router = Router()
+        self.static = self.router.add_static('/static', self.tmp.name)
+        self.loop = asyncio.new_event_loop()
+        self.server = HTTPServer(self.router, http_parser, self.loop)
+
+    def tearDown(self):
+        self.static.clear()
+        self.loop.close()
+        self.tmp.cleanup()
+
+    def fetch(self, request, protocol=False):
+        async def run():
+            if protocol:
+                server = await self.loop.create_server(
+                    lambda: HTTPProtocol(self.server), '127.0.0.1', 0)
+            else:
+                server = await asyncio.start_server(
+                    self.server.handle_connection, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            data = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return data
+        return self.loop.run_until_complete(run())
+
+    def test_sendfile(self):
+        for protocol in (False, True):
+            data = self.fetch(b'GET /static/data.bin HTTP/1.1\r\n'
+                              b'Connection: close\r\n\r\n', protocol)
+            head, body = data.split(b'\r\n\r\n', 1)
+            self.assertTrue(head.startswith(b'HTTP/1.1 200 OK'))
+            self.assertEqual(CONTENT, body)
+
+    def test_keep_alive_after_range(self):
+        data = self.fetch(b'GET /static/data.bin HTTP/1.1\r\n'
+                          b'Range: bytes=5-14\r\n\r\n'
+                          b'GET /static/data.bin HTTP/1.1\r\n'
+                          b'Connection: close\r\n\r\n')
+        first, second = data.split(b'HTTP/1.1 200 OK')
+        self.assertTrue(first.startswith(b'HTTP/1.1 206 Partial Content'))
+        self.assertTrue(first.endswith(b'\r\n\r\n' + CONTENT[5:15]))
+        self.assertTrue(second.endswith(b'\r\n\r\n' + CONTENT))
+
+    def test_fallback(self):
+        async def unavailable(*args, **kwargs):
+            raise NotImplementedError
+        with patch.object(self.loop, 'sendfile', unavailable):
+            data = self.fetch(b'GET /static/data.bin HTTP/1.1\r\n'
+                              b'Connection: close\r\n\r\n')
+        self.assertTrue(data.endswith(b'\r\n\r\n' + CONTENT))
+
+    def test_file_released_when_not_sent(self):
+        async def replace(request, call_next):
+            response = await call_next(request)
+            if request.path.endswith('.bin'):
+                return Response(body='replaced')
+            raise ValueError('failed')
+        self.router.use(replace)
+        for name in ('data.bin', 'data.txt'):
+            with open(os.path.join(self.tmp.name, name), 'wb') as f:
+                f.write(CONTENT)
+        data = self.fetch(b'GET /static/data.bin HTTP/1.1\r\n'
+                          b'Connection: close\r\n\r\n')
+        self.assertTrue(data.endswith(b'\r\n\r\nreplaced'))
+        with self.assertLogs(level='ERROR'):
+            data = self.fetch(b'GET /static/data.txt HTTP/1.1\r\n'
+                              b'Connection: close\r\n\r\n')
+        self.assertTrue(data.startswith(b'HTTP/1.1 500'))
+        open_files = list(self.static._files.values())
+        self.assertEqual(2, len(open_files))
+        self.assertEqual([0, 0], [f.users for f in open_files])
@@ -0,0 +1,70 @@
+import unittest as t
+from unittest.mock import MagicMock
+
+from diy_framework.timeouts import TimerWheel
+
+
+class FakeLoop(object):
+    def __init__(self):
+        self.now = 0.0
+        self.callbacks = []
+
+    def time(self):
+        return self.now
+
+    def call_later(self, delay, callback):
+        self.callbacks.append((self.now + delay, callback))
+        return MagicMock()
+
+    def advance(self, seconds):
+        self.now += seconds
+        due = [c for c in self.callbacks if c[0] <= self.now]
+        self.callbacks = [c for c in self.callbacks if c[0] > self.now]
+        for _, callback in due:
+            callback()
+
+
+class TestTimerWheel(t.TestCase):
+    def setUp(self):
+        self.loop = FakeLoop()
+        self.wheel = TimerWheel(self.loop, resolution=1)
+        self.conn = MagicMock()
+
+    def test_expires_after_timeout(self):
+        self.wheel.schedule(self.conn, 3)
+        for _ in range(2):
+            self.loop.advance(1)
+        self.conn.on_timeout.assert_not_called()
+        self.loop.advance(1)
+        self.conn.on_timeout.assert_called_once_with()
+        self.assertEqual(len(self.wheel), 0)
+        self.assertEqual(self.loop.callbacks, [])
+
+    def test_reschedule_moves_deadline(self):
+        self.wheel.schedule(self.conn, 2)
+        self.loop.advance(1)
+        self.wheel.schedule(self.conn, 2)
+        self.loop.advance(1)
+        self.conn.on_timeout.assert_not_called()
+        self.loop.advance(1)
+        self.conn.on_timeout.assert_called_once_with()
+
+    def test_cancel(self):
+        self.wheel.schedule(self.conn, 1)
+        self.wheel.cancel(self.conn)
+        self.loop.advance(2)
+        self.conn.on_timeout.assert_not_called()
+
+    def test_single_loop_timer(self):
+        conns = [MagicMock() for _ in range(100)]
+        for conn in conns:
+            self.wheel.schedule(conn, 5)
+        self.assertEqual(len(self.loop.callbacks), 1)
+        for _ in range(5):
+            self.loop.advance(1)
+        for conn in conns:
+            conn.on_timeout.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    t.main()
@@ -0,0 +1,42 @@
+import os
+import signal
+import threading
+import time
+import unittest as t
+
+from diy_framework.workers import Supervisor
+
+
+def stop_after(seconds):
+    timer = threading.Timer(
+        seconds, os.kill, args=(os.getpid(), signal.SIGTERM))
+    timer.start()
+    return timer
+
+
+class CountingSupervisor(Supervisor):
+    spawned = 0
+
+    def _spawn(self):
+        self.spawned += 1
+        super()._spawn()
+
+
+class TestSupervisor(t.TestCase):
+    def test_forwarded_signal_stops_workers(self):
+        supervisor = Supervisor(2, lambda: time.sleep(30))
+        stop_after(0.3)
+        started = time.monotonic()
+        supervisor.run()
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertDictEqual(supervisor._children, {})
+
+    def test_dead_workers_are_restarted(self):
+        supervisor = CountingSupervisor(2, lambda: None, restart_delay=0.01)
+        stop_after(0.5)
+        supervisor.run()
+        self.assertGreater(supervisor.spawned, 2)
+
+
+if __name__ == '__main__':
+    t.main()